@@ -0,0 +1,61 @@
+# benchmarks/codec_scaling.py
+"""
+Measure how encoding throughput of large messages scales with the number of
+codec processes, compared to encoding inline on the calling thread.
+
+    poetry run python -m benchmarks.codec_scaling --messages 200 --size 512 --compression 6
+"""
+
+import os
+import time
+import zlib
+import argparse
+from connectiva.codec import CodecPool, dumps
+
+
+def payload(size_kb: int) -> dict:
+    row = {"id": 12345, "name": "sensor-reading", "values": [1.5, 2.25, 3.125], "ok": True}
+    rows = max(1, size_kb * 1024 // len(dumps(row)))
+    return {"action": "send", "data": [dict(row, id=i) for i in range(rows)], "metadata": {}}
+
+
+def run_inline(value: dict, messages: int, compression) -> float:
+    started = time.perf_counter()
+    for _ in range(messages):
+        data = dumps(value)
+        if compression is not None:
+            zlib.compress(data, compression)
+    return messages / (time.perf_counter() - started)
+
+
+def run(codec: CodecPool, value: dict, messages: int) -> float:
+    started = time.perf_counter()
+    futures = [codec.encode(value) for _ in range(messages)]
+    for future in futures:
+        future.result()
+    return messages / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--size", type=int, default=512, help="Payload size in KB")
+    parser.add_argument("--compression", type=int, default=None, help="zlib level, or omit for none")
+    args = parser.parse_args()
+
+    value = payload(args.size)
+    baseline = run_inline(value, args.messages, args.compression)
+    print(f"{'processes':>9}  {'msg/s':>9}  {'speedup':>7}")
+    print(f"{'inline':>9}  {baseline:9.1f}  {1.0:7.2f}")
+
+    processes = 1
+    while processes <= (os.cpu_count() or 1):
+        codec = CodecPool(processes=processes, threshold=0, compression_level=args.compression)
+        run(codec, value, processes)  # Start the workers before measuring
+        throughput = run(codec, value, args.messages)
+        print(f"{processes:>9}  {throughput:9.1f}  {throughput / baseline:7.2f}")
+        processes *= 2
+
+
+if __name__ == "__main__":
+    main()
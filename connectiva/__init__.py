@@ -1,6 +1,9 @@
 from .message import Message
 from .interfaces import CommunicationMethod
+from .response_cache import ResponseCache
 from .communication_factory import CommunicationFactory
 from .logging_config import setup_logging 
 from .connectiva import Connectiva
-__all__= ["Message","CommunicationMethod","CommunicationFactory","setup_logging","Connectiva"]
\ No newline at end of file
+from .pipeline import Pipeline
+from .multicast import Multicast
+__all__= ["Message","CommunicationMethod","CommunicationFactory","setup_logging","Connectiva","ResponseCache","Pipeline","Multicast"]
\ No newline at end of file
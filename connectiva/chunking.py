@@ -0,0 +1,302 @@
+# connectiva/chunking.py
+
+import json
+import time
+import base64
+import codecs
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from uuid import uuid4
+from connectiva.message import Message, unwrap
+from connectiva.interfaces import ROUTING_HEADERS
+
+
+class Chunker:
+    """
+    Splits messages whose serialized form exceeds a size limit into sequenced
+    "chunk" messages that any protocol can carry.
+
+    Each chunk holds a base64 slice of the UTF-8 JSON encoding of the original
+    message and a ``chunk`` metadata entry with the message id, the sequence
+    number and the total number of chunks. Base64 text needs no escaping when
+    the protocol JSON-encodes the chunk, so ``chunk_size`` bounds the payload
+    each chunk puts on the wire.
+
+    Chunks carry the priority, key and target_partition of the original message.
+    Without a key, the message id is used so all chunks land on one partition.
+    """
+
+    def __init__(self, chunk_size: int = 256 * 1024):
+        """
+        :param chunk_size: Maximum length of the serialized message carried by one chunk.
+        """
+        if chunk_size < 4:
+            raise ValueError("chunk_size must be at least 4")
+        self.chunk_size = chunk_size
+
+    def split(self, message: Message) -> List[Message]:
+        """
+        Split a message into chunks.
+
+        :param message: The message to send.
+        :return: The message itself if it fits in one chunk, otherwise its chunks in order.
+        """
+        encoded = json.dumps(message.__dict__).encode('utf-8')
+        if len(encoded) <= self.chunk_size:
+            return [message]
+
+        # Every 3 bytes become 4 base64 characters
+        step = self.chunk_size // 4 * 3
+        message_id = uuid4().hex
+        total = (len(encoded) + step - 1) // step
+        routing = {key: message.metadata[key] for key in ROUTING_HEADERS if message.metadata.get(key) is not None}
+        routing.setdefault("key", message_id)
+        return [
+            Message(
+                action="chunk",
+                data=base64.b64encode(encoded[seq * step:(seq + 1) * step]).decode('ascii'),
+                metadata=dict(routing, chunk={"id": message_id, "seq": seq, "total": total})
+            )
+            for seq in range(total)
+        ]
+
+
+class _Partial:
+    """
+    Chunks received so far for one message.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.pieces: Dict[int, str] = {}
+        self.acks: List[Dict[str, Any]] = []  # Receive metadata of the chunks, to acknowledge them all
+        self.size = 0
+        self.started = time.monotonic()
+        self.next_seq = 0  # Next sequence number a stream reader expects
+
+    def add(self, seq: int, piece: str) -> int:
+        if seq in self.pieces or seq < self.next_seq:
+            return 0  # Redelivered chunk
+        self.pieces[seq] = piece
+        self.size += len(piece)
+        return len(piece)
+
+
+# Metadata key of a reassembled message listing the receive metadata of its chunks
+CHUNK_ACKS = "chunk_acks"
+
+
+def chunk_acks(message: Message) -> Optional[List[Message]]:
+    """
+    Return the chunks to acknowledge in place of a reassembled message, or None
+    if the message was not reassembled.
+    """
+    acks = message.metadata.get(CHUNK_ACKS)
+    if acks is None:
+        return None
+    return [Message(action="chunk", data=None, metadata=metadata) for metadata in acks]
+
+
+def chunk_info(message: Message) -> Optional[Dict[str, Any]]:
+    """
+    Return the ``chunk`` metadata of a received message, or None if it is not a chunk.
+    """
+    info = message.metadata.get("chunk")
+    if info is None:
+        original = unwrap(message)
+        if original.action == "chunk":
+            info = original.metadata.get("chunk")
+    return info if isinstance(info, dict) else None
+
+
+def _chunk_data(message: Message) -> str:
+    return message.data if isinstance(message.data, str) else unwrap(message).data
+
+
+class Reassembler:
+    """
+    Rebuilds chunked messages on the receiving side.
+
+    Chunks may arrive out of order and interleaved with other messages. The
+    memory held by incomplete messages is bounded: when ``max_bytes`` would be
+    exceeded the oldest incomplete message is dropped, and messages that do not
+    complete within ``timeout`` seconds are dropped as well.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, timeout: float = 60.0):
+        """
+        :param max_bytes: Upper bound for the chunk data buffered across incomplete messages.
+        :param timeout: Seconds an incomplete message is kept after its first chunk arrived.
+        """
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._partials: "OrderedDict[str, _Partial]" = OrderedDict()
+        self._ready = deque()  # Messages completed while a stream was being read
+        self._size = 0
+        self._completed = 0
+        self._expired = 0
+        self._evicted = 0
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._partials:
+            message_id, partial = next(iter(self._partials.items()))
+            if now - partial.started <= self.timeout:
+                break
+            self.logger.warning("Dropping incomplete message %s after %.1fs.", message_id, self.timeout)
+            self._drop(message_id)
+            self._expired += 1
+
+    def _drop(self, message_id: str):
+        partial = self._partials.pop(message_id)
+        self._size -= partial.size
+
+    def _make_room(self, message_id: str, needed: int) -> bool:
+        while self._size + needed > self.max_bytes:
+            oldest = next((key for key in self._partials if key != message_id), None)
+            if oldest is None:
+                return False
+            self.logger.warning("Chunk buffer full; dropping incomplete message %s.", oldest)
+            self._drop(oldest)
+            self._evicted += 1
+        return True
+
+    def _buffer(self, message: Message, info: Dict[str, Any]) -> Optional[_Partial]:
+        message_id = info["id"]
+        partial = self._partials.get(message_id)
+        if partial is None:
+            partial = self._partials[message_id] = _Partial(info["total"])
+        if not self._make_room(message_id, len(_chunk_data(message))):
+            self.logger.warning("Message %s is larger than the chunk buffer; dropping it.", message_id)
+            self._drop(message_id)
+            self._evicted += 1
+            return None
+        added = partial.add(info["seq"], _chunk_data(message))
+        # Routing headers travel with every chunk and say nothing about how to acknowledge it
+        handle = {key: value for key, value in message.metadata.items()
+                  if key != "chunk" and key not in ROUTING_HEADERS}
+        if added and handle:
+            partial.acks.append(handle)
+        self._size += added
+        return partial
+
+    def _complete(self, message: Message, partial: _Partial, message_id: str) -> Message:
+        self._drop(message_id)
+        self._completed += 1
+        encoded = b"".join(base64.b64decode(partial.pieces[seq]) for seq in range(partial.total))
+        original = Message(**json.loads(encoded))
+        # Connectiva.ack() acknowledges every chunk through their receive metadata
+        acks = {CHUNK_ACKS: partial.acks} if partial.acks else {}
+        if unwrap(message) is not message:
+            # Keep the receive shape of the protocol that delivered the chunks
+            return Message(action=message.action, data=original.__dict__, metadata=dict(message.metadata, **acks))
+        return Message(action=original.action, data=original.data, metadata=dict(original.metadata, **acks))
+
+    def add(self, message: Message) -> Optional[Message]:
+        """
+        Feed a received message.
+
+        :param message: A message returned by a protocol's receive().
+        :return: The message itself if it is not a chunk, the reassembled message
+                 once its last chunk arrives, or None while chunks are missing.
+        """
+        info = chunk_info(message)
+        if info is None:
+            return message
+        self._expire()
+        partial = self._buffer(message, info)
+        if partial is None or len(partial.pieces) < partial.total:
+            return None
+        return self._complete(message, partial, info["id"])
+
+    def pop_ready(self) -> Optional[Message]:
+        """
+        Return a message that was completed while a stream was being read, if any.
+        """
+        return self._ready.popleft() if self._ready else None
+
+    def stream(self,
+               receive: Callable[[], Message],
+               poll_interval: float = 0.1,
+               ack: Optional[Callable[[Message], None]] = None) -> Iterator[str]:
+        """
+        Read the next message from ``receive`` and yield its serialized JSON text
+        piece by piece as the chunks arrive, without holding the whole payload.
+
+        Out-of-order chunks of the streamed message are buffered until their turn.
+        Other messages received in the meantime are kept and returned later by
+        pop_ready(). The stream ends early if the message does not complete within
+        the timeout.
+
+        :param receive: Callable returning the next received message, such as a protocol's receive().
+        :param poll_interval: Seconds to wait when no message is available.
+        :param ack: Callable acknowledging a received message, such as a protocol's ack().
+                    The streamed message, or each of its chunks, is acknowledged once the
+                    whole text has been read; an interrupted stream acknowledges nothing.
+        """
+        message_id = None
+        partial = None
+        text = codecs.getincrementaldecoder('utf-8')()  # Slices may split a multi-byte character
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            message = receive()
+            if message.action == "error":
+                if "No message found" not in message.metadata.get("error", ""):
+                    self.logger.error("Stream interrupted: %s", message.metadata.get("error"))
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            info = chunk_info(message)
+            if message_id is None and info is None:
+                yield json.dumps(unwrap(message).__dict__)
+                if ack is not None:
+                    ack(message)
+                return
+            if info is None or (message_id is not None and info["id"] != message_id):
+                complete = self.add(message)
+                if complete is not None:
+                    self._ready.append(complete)
+                continue
+
+            if message_id is None:
+                message_id = info["id"]
+                deadline = time.monotonic() + self.timeout
+            self._expire()
+            partial = self._buffer(message, info)
+            if partial is None or message_id not in self._partials:
+                return
+            while partial.next_seq in partial.pieces:
+                piece = partial.pieces.pop(partial.next_seq)
+                self._size -= len(piece)
+                partial.size -= len(piece)
+                partial.next_seq += 1
+                decoded = text.decode(base64.b64decode(piece), final=partial.next_seq == partial.total)
+                if decoded:
+                    yield decoded
+            if partial.next_seq == partial.total:
+                self._drop(message_id)
+                self._completed += 1
+                if ack is not None:
+                    for metadata in partial.acks:
+                        ack(Message(action="chunk", data=None, metadata=metadata))
+                return
+
+        if message_id in self._partials:
+            self._drop(message_id)
+            self._expired += 1
+        self.logger.warning("Stream timed out after %.1fs.", self.timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return the number of incomplete messages, the bytes they hold and drop counters.
+        """
+        return {
+            "pending": len(self._partials),
+            "buffered_bytes": self._size,
+            "completed": self._completed,
+            "expired": self._expired,
+            "evicted": self._evicted,
+        }
@@ -0,0 +1,139 @@
+# connectiva/coalescer.py
+
+import json
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+from connectiva.message import Message
+
+
+class Coalescer:
+    """
+    Groups individual sends into batches.
+
+    Messages submitted within ``linger`` seconds of the first one of a batch are
+    shipped together through ``send_batch``, up to ``max_batch_size`` messages or
+    ``max_batch_bytes`` of serialized data. Every caller gets a future that
+    resolves to the result for its own message.
+    """
+
+    def __init__(self,
+                 send_batch: Callable[[List[Message]], List[Dict[str, Any]]],
+                 linger: float = 0.005,
+                 max_batch_size: int = 100,
+                 max_batch_bytes: Optional[int] = None):
+        """
+        :param send_batch: Callable that sends a list of messages and returns one result per message.
+        :param linger: Seconds to wait for more messages after the first one of a batch.
+        :param max_batch_size: Maximum number of messages per batch.
+        :param max_batch_bytes: Maximum serialized size of a batch, or None for no limit.
+        """
+        self.send_batch = send_batch
+        self.linger = linger
+        self.max_batch_size = max_batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._batches = 0
+        self._messages = 0
+        self._thread = None
+        self._closed = True
+        self._lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        """
+        Start the worker thread, again after close(). Does nothing while it is running.
+        """
+        with self._lock:
+            if not self._closed:
+                return
+            self._closed = False
+            self._thread = threading.Thread(target=self._run, name="coalescer", daemon=True)
+            self._thread.start()
+
+    def submit(self, message: Message) -> Future:
+        """
+        Queue a message and return a future resolving to its send result.
+        Once the coalescer is closed, the future resolves to an error right away.
+        """
+        future = Future()
+        size = len(json.dumps(message.__dict__)) if self.max_batch_bytes else 0
+        with self._lock:
+            if self._closed:
+                future.set_result({"error": "Coalescer is closed"})
+                return future
+            self._queue.put((message, future, size))
+        return future
+
+    def close(self):
+        """
+        Flush pending messages and stop the worker thread.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return the number of batches flushed and their average size.
+        """
+        return {
+            "batches": self._batches,
+            "messages": self._messages,
+            "average_batch_size": self._messages / self._batches if self._batches else 0.0,
+            "pending": self._queue.qsize(),
+        }
+
+    def _run(self):
+        """
+        Gather messages until the linger window elapses or a limit is reached, then flush them.
+        """
+        carry = None  # Message that did not fit in the previous batch
+        stopping = False
+        while not stopping:
+            item = carry if carry is not None else self._queue.get()
+            carry = None
+            if item is None:
+                break
+            batch = [item]
+            size = item[2]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                if self.max_batch_bytes and size + item[2] > self.max_batch_bytes:
+                    carry = item
+                    break
+                batch.append(item)
+                size += item[2]
+            self._flush(batch)
+
+    def _flush(self, batch):
+        """
+        Send a batch and resolve each caller's future with its own result.
+        """
+        self.logger.debug("Flushing batch of %d messages.", len(batch))
+        try:
+            results = list(self.send_batch([message for message, _, _ in batch]))
+        except Exception as e:
+            results = [{"error": str(e)} for _ in batch]
+        if len(results) < len(batch):
+            self.logger.error("send_batch returned %d results for %d messages.", len(results), len(batch))
+            results += [{"error": "No result for message"} for _ in range(len(batch) - len(results))]
+        self._batches += 1
+        self._messages += len(batch)
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,167 @@
+# connectiva/codec.py
+
+import os
+import json
+import zlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional, Union
+
+# First byte of a zlib stream; serialized messages are JSON objects and start with "{"
+ZLIB_MAGIC = 0x78
+
+
+def dumps(value: Any) -> bytes:
+    """
+    Serialize a value to UTF-8 JSON.
+    """
+    return json.dumps(value).encode('utf-8')
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """
+    Deserialize JSON, inflating it first when it was compressed by a CodecPool.
+    """
+    if isinstance(data, str):
+        return json.loads(data)
+    if len(data) and data[0] == ZLIB_MAGIC:
+        data = zlib.decompress(data)
+    return json.loads(bytes(data))
+
+
+def _encode(value: Any, compression_level: Optional[int]) -> bytes:
+    data = dumps(value)
+    return zlib.compress(data, compression_level) if compression_level is not None else data
+
+
+def resolved(func: Callable, *args) -> Future:
+    """
+    Call a function right away and return its outcome as a completed future.
+    """
+    future = Future()
+    try:
+        future.set_result(func(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def estimate_size(value: Any, limit: int) -> int:
+    """
+    Roughly estimate the serialized size of a value, giving up once it exceeds ``limit``.
+    """
+    size = 0
+    stack = [value]
+    while stack and size <= limit:
+        item = stack.pop()
+        if isinstance(item, (str, bytes, bytearray)):
+            size += len(item) + 2
+        elif isinstance(item, dict):
+            size += 2 * len(item) + 2
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            size += len(item) + 2
+            stack.extend(item)
+        else:
+            size += 8
+    return size
+
+
+# Worker pools shared by every CodecPool with the same number of processes
+_executors: Dict[int, ProcessPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def _executor(processes: int) -> ProcessPoolExecutor:
+    with _executors_lock:
+        if processes not in _executors:
+            # Forking a process that runs broker client and event loop threads can copy
+            # locks in a held state into the workers, so they are spawned fresh instead
+            _executors[processes] = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executors[processes]
+
+
+class CodecPool:
+    """
+    Offloads serialization of large messages to worker processes.
+
+    Values estimated at ``threshold`` bytes or more are encoded (and, with a
+    ``compression_level``, zlib-compressed) or decoded in a process pool, so
+    CPU-heavy codec work runs on other cores instead of holding the GIL of the
+    sending thread. Smaller values are handled inline, where the cost of
+    shipping them to a worker would outweigh the work. Results come back as
+    futures, which lets callers encode ahead while earlier messages are sent.
+    """
+
+    def __init__(self,
+                 processes: Optional[int] = None,
+                 threshold: int = 256 * 1024,
+                 compression_level: Optional[int] = None):
+        """
+        :param processes: Number of worker processes; defaults to the number of CPUs.
+        :param threshold: Size in bytes from which values are handled by the pool.
+        :param compression_level: zlib level (0-9) for compressing offloaded values, or None.
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.threshold = threshold
+        self.compression_level = compression_level
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._inline = 0
+        self._offloaded = 0
+
+    def _count(self, offloaded: bool):
+        with self._lock:
+            if offloaded:
+                self._offloaded += 1
+            else:
+                self._inline += 1
+
+    def encode(self, value: Any) -> Future:
+        """
+        Serialize a value, returning a future resolving to the encoded bytes.
+        """
+        offload = estimate_size(value, self.threshold) >= self.threshold
+        self._count(offload)
+        if not offload:
+            return resolved(dumps, value)
+        return _executor(self.processes).submit(_encode, value, self.compression_level)
+
+    def decode(self, data: Union[bytes, bytearray, memoryview, str]) -> Future:
+        """
+        Deserialize encoded bytes, returning a future resolving to the value.
+        """
+        offload = len(data) >= self.threshold
+        self._count(offload)
+        if not offload:
+            return resolved(loads, data)
+        return _executor(self.processes).submit(loads, bytes(data) if isinstance(data, memoryview) else data)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return how many values were handled inline and by the pool.
+        """
+        with self._lock:
+            return {"processes": self.processes, "inline": self._inline, "offloaded": self._offloaded}
+
+
+def create_codec(**kwargs) -> Optional[CodecPool]:
+    """
+    Build a protocol's codec pool from the ``codec_processes``, ``codec_threshold``
+    and ``compression_level`` options. Returns None unless ``codec_processes`` is set;
+    ``codec_processes=True`` uses one process per CPU.
+    """
+    processes = kwargs.get("codec_processes")
+    if not processes:
+        return None
+    return CodecPool(
+        processes=None if processes is True else processes,
+        threshold=kwargs.get("codec_threshold", 256 * 1024),
+        compression_level=kwargs.get("compression_level")
+    )
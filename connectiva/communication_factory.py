@@ -7,7 +7,8 @@ from connectiva.protocols import (
     KafkaProtocol,
     FileProtocol,
     WebSocketProtocol,
-    GraphQLProtocol
+    GraphQLProtocol,
+    MemoryProtocol
 )
 
 class CommunicationFactory:
@@ -22,7 +23,8 @@ class CommunicationFactory:
         "Kafka": KafkaProtocol,
         "File": FileProtocol,
         "WebSocket": WebSocketProtocol,
-        "GraphQL": GraphQLProtocol
+        "GraphQL": GraphQLProtocol,
+        "Memory": MemoryProtocol
     }
 
     @staticmethod
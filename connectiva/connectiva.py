@@ -1,8 +1,21 @@
 # connectiva/connectiva.py
 
+import time
+import json
+import hashlib
 import logging
-from typing import Dict, Any, List, Optional
+import threading
+from contextlib import nullcontext
+from typing import Dict, Any, Iterator, List, Optional, Union
+from uuid import uuid4
 from connectiva import CommunicationFactory, Message, setup_logging
+from connectiva.chunking import Chunker, Reassembler, chunk_acks
+from connectiva.coalescer import Coalescer
+from connectiva.dedup import create_deduplicator
+from connectiva.message import unwrap
+from connectiva.outbox import Outbox
+from connectiva.profiling import TRACEPARENT, StageProfiler, child_traceparent
+from connectiva.schema import SchemaRegistry, create_schema_registry
 
 
 class Connectiva:
@@ -15,6 +28,27 @@ class Connectiva:
                  log_file: Optional[str] = None,
                  custom_logging_handlers: Optional[List[logging.Handler]] = None,
                  log_level: str = "INFO",
+                 outbox_dir: Optional[str] = None,
+                 outbox_batch_size: int = 100,
+                 outbox_flush_timeout: Optional[float] = 10.0,
+                 outbox_max_attempts: Optional[int] = None,
+                 chunk_size: Optional[int] = None,
+                 chunk_buffer_size: int = 64 * 1024 * 1024,
+                 chunk_timeout: float = 60.0,
+                 message_ids: bool = False,
+                 dedup: Optional[str] = None,
+                 dedup_capacity: Optional[int] = None,
+                 dedup_window: float = 600.0,
+                 dedup_path: Optional[str] = None,
+                 coalesce_linger: Optional[float] = None,
+                 coalesce_max_batch: int = 100,
+                 coalesce_max_bytes: Optional[int] = None,
+                 trace: bool = False,
+                 profile_sample_rate: Optional[float] = None,
+                 profile_slow_threshold: Optional[float] = None,
+                 profile_trace_file: Optional[str] = None,
+                 schema_registry: Union[SchemaRegistry, str, None] = None,
+                 schema_registry_url: Optional[str] = None,
                  **kwargs):
         """
         Initializes Connectiva with given keyword arguments.
@@ -23,6 +57,41 @@ class Connectiva:
         :param log_file: File path to save logs if provided.
         :param custom_logging_handlers: List of custom logging handlers.
         :param log_level: Logging level (e.g., DEBUG, INFO, WARNING, ERROR, CRITICAL).
+        :param outbox_dir: Directory for a durable outbox. When set, send() buffers messages
+                           locally and returns immediately; a background drainer delivers them.
+                           The drainer shares the protocol client, so calls on it are serialized.
+                           Cannot be combined with coalesce_linger.
+        :param outbox_batch_size: Maximum number of messages the drainer ships per batch.
+        :param outbox_flush_timeout: Seconds disconnect() waits for the outbox to drain.
+        :param outbox_max_attempts: Deliveries the drainer tries before moving a message to the
+                                    outbox's dead letters; by default it retries forever.
+        :param chunk_size: Split messages whose serialized form is longer than this into chunks,
+                           and reassemble chunks on receive.
+        :param chunk_buffer_size: Maximum bytes held by partially received messages.
+        :param chunk_timeout: Seconds to wait for the missing chunks of a message.
+        :param message_ids: Stamp a unique ``message_id`` into the metadata of every sent message.
+        :param dedup: Drop received messages whose ``message_id`` was already seen:
+                      "lru" for exact matching, "bloom" for approximate matching at very high volumes.
+        :param dedup_capacity: Maximum number of ids remembered.
+        :param dedup_window: Seconds an id is remembered.
+        :param dedup_path: File to persist the deduplication state across restarts.
+        :param coalesce_linger: Group send() calls arriving within this many seconds into one
+                                send_batch() of the protocol. Each call still returns its own result.
+                                Batches are flushed on a background thread, so calls on the protocol
+                                client are serialized. Cannot be combined with outbox_dir, whose
+                                drainer already sends in batches.
+        :param coalesce_max_batch: Maximum number of messages per coalesced batch.
+        :param coalesce_max_bytes: Maximum serialized size of a coalesced batch.
+        :param trace: Stamp a W3C ``traceparent`` into the metadata of every sent message,
+                      continuing the trace of a ``traceparent`` the message already carries.
+        :param profile_sample_rate: Profile this fraction of sends, breaking their latency down
+                                    into serialization, I/O and acknowledgement (see profile_stats()).
+        :param profile_slow_threshold: Seconds after which a profiled send is kept as a slow trace.
+        :param profile_trace_file: JSON lines file receiving slow traces.
+        :param schema_registry: SchemaRegistry, or directory of schema files. Messages with a
+                                ``schema_id`` in their metadata are sent with their data encoded
+                                positionally by that schema, and decoded again on receive.
+        :param schema_registry_url: Registry service to fetch schemas missing from the directory from.
         :param kwargs: Other keyword arguments for configuration.
         """
         setup_logging(
@@ -34,7 +103,40 @@ class Connectiva:
 
         self.logger = logging.getLogger(self.__class__.__name__)
         self.config = kwargs
+        if outbox_dir and coalesce_linger is not None:
+            # The outbox drainer already sends in batches
+            raise ValueError("coalesce_linger cannot be combined with outbox_dir")
         self.strategy = self.create_strategy(**kwargs)
+        self.outbox_flush_timeout = outbox_flush_timeout
+        # Protocol clients such as pika's BlockingConnection are not thread-safe, so
+        # while a background thread sends through the strategy every call holds this lock
+        self._strategy_lock = threading.RLock() if outbox_dir or coalesce_linger is not None else nullcontext()
+        self.outbox = None
+        if outbox_dir:
+            # One outbox per endpoint, so several instances can share a directory
+            name = "outbox_" + hashlib.sha1(str(kwargs.get("endpoint")).encode()).hexdigest()[:12]
+            self.outbox = Outbox(
+                outbox_dir, self._send_batch,
+                name=name, batch_size=outbox_batch_size, max_attempts=outbox_max_attempts
+            )
+        self.chunker = None
+        self.reassembler = None
+        if chunk_size:
+            self.chunker = Chunker(chunk_size)
+            self.reassembler = Reassembler(max_bytes=chunk_buffer_size, timeout=chunk_timeout)
+        self.message_ids = message_ids
+        self.deduplicator = None
+        if dedup:
+            self.deduplicator = create_deduplicator(dedup, dedup_capacity, dedup_window, dedup_path)
+        self.coalescer = None
+        if coalesce_linger is not None:
+            self.coalescer = Coalescer(self._send_batch, coalesce_linger, coalesce_max_batch, coalesce_max_bytes)
+        self.trace = trace
+        self.profiler = None
+        if profile_sample_rate:
+            self.profiler = StageProfiler(profile_sample_rate, profile_slow_threshold, profile_trace_file)
+            self.profiler.attach(self.strategy)
+        self.schemas = create_schema_registry(schema_registry, schema_registry_url)
         self.logger.info("Connectiva initialized with configuration: %s", self.config)
 
     def create_strategy(self, **kwargs) -> CommunicationFactory:
@@ -47,21 +149,221 @@ class Connectiva:
         self.logger.debug("Creating communication strategy...")
         return CommunicationFactory.create_communication(**kwargs)
 
+    def _call(self, method: str, *args, **kwargs):
+        """
+        Call a method of the strategy, holding the strategy lock when a background thread shares it.
+        """
+        with self._strategy_lock:
+            return getattr(self.strategy, method)(*args, **kwargs)
+
+    def _send_batch(self, messages: List[Message]) -> List[Dict[str, Any]]:
+        return self._call("send_batch", messages)
+
     def connect(self):
         self.logger.info("Connecting to communication endpoint...")
-        self.strategy.connect()
+        self._call("connect")
+        if self.outbox is not None:
+            self.outbox.start()
+        if self.coalescer is not None:
+            self.coalescer.start()  # Restarts it after a disconnect()
+
+    def _stamp(self, message: Message) -> Message:
+        stamps = {}
+        if self.message_ids and "message_id" not in message.metadata:
+            stamps["message_id"] = uuid4().hex
+        if self.trace:
+            stamps[TRACEPARENT] = child_traceparent(message.metadata.get(TRACEPARENT))
+        data = message.data
+        if self.schemas is not None and "schema_id" in message.metadata and isinstance(data, dict):
+            data = self.schemas.encode(message.metadata["schema_id"], data)
+        if not stamps and data is message.data:
+            return message
+        return Message(action=message.action, data=data, metadata=dict(message.metadata, **stamps))
+
+    def _decode_schema(self, message: Message) -> Message:
+        """
+        Rebuild the data of a received message that was encoded with a schema,
+        or return an error message when it cannot be decoded.
+        """
+        sent = unwrap(message)
+        schema_id = sent.metadata.get("schema_id")
+        if schema_id is None or not isinstance(sent.data, list):
+            return message
+        try:
+            data = self.schemas.decode(schema_id, sent.data)
+        except (KeyError, ValueError) as e:
+            self.logger.error("Cannot decode message with schema %s: %s", schema_id, e)
+            return Message(action="error", data={}, metadata={"error": str(e)})
+        if sent is message:
+            return Message(action=message.action, data=data, metadata=message.metadata)
+        # Broker protocols return the sent envelope as data
+        return Message(action=message.action, data=dict(message.data, data=data), metadata=message.metadata)
+
+    def _try_stamp(self, message: Message) -> Union[Message, Dict[str, Any]]:
+        """
+        Stamp a message, returning an error dictionary when its schema cannot encode it.
+        """
+        try:
+            return self._stamp(message)
+        except (KeyError, ValueError) as e:
+            self.logger.error("Failed to encode message with its schema: %s", e)
+            return {"error": str(e)}
 
     def send(self, message: Message) -> Dict[str, Any]:
         self.logger.info("Sending message: %s", message)
-        return self.strategy.send(message)
+        message = self._try_stamp(message)
+        if not isinstance(message, Message):
+            return message
+        chunks = self.chunker.split(message) if self.chunker is not None else [message]
+        if len(chunks) > 1:
+            return self._send_chunks(chunks)
+        if self.outbox is not None:
+            try:
+                return {"status": "queued", "outbox_id": self.outbox.append(message)}
+            except (TypeError, ValueError) as e:
+                self.logger.error("Failed to queue message: %s", e)
+                return {"error": str(e)}
+        # Only messages handed to the protocol as they are reach their ack; chunks and
+        # outbox rows are sent as other objects, which would leave the sample open
+        if self.profiler is not None:
+            self.profiler.begin(message)
+        if self.coalescer is not None:
+            return self.coalescer.submit(message).result()
+        return self._call("send", message)
+
+    def _send_chunks(self, chunks: List[Message]) -> Dict[str, Any]:
+        message_id = chunks[0].metadata["chunk"]["id"]
+        self.logger.info("Sending message %s in %d chunks", message_id, len(chunks))
+        if self.outbox is not None:
+            outbox_ids = [self.outbox.append(chunk) for chunk in chunks]
+            return {"status": "queued", "outbox_id": outbox_ids[-1], "message_id": message_id, "chunks": len(chunks)}
+        for result in self._send_batch(chunks):
+            if not isinstance(result, dict) or "error" in result:
+                return result
+        return {"status": "sent", "message_id": message_id, "chunks": len(chunks)}
+
+    def send_batch(self, messages: List[Message]) -> List[Dict[str, Any]]:
+        self.logger.info("Sending batch of %d messages", len(messages))
+        if self.chunker is not None:
+            return [self.send(message) for message in messages]
+        stamped = [self._try_stamp(message) for message in messages]
+        valid = [message for message in stamped if isinstance(message, Message)]
+        results = iter(self._send_batch(valid) if valid else [])
+        return [next(results) if isinstance(message, Message) else message for message in stamped]
+
+    def send_raw(self, body: Union[bytes, memoryview], headers: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Send an already encoded message as is, e.g. to relay a body returned by
+        receive_raw() without decoding and re-encoding it. The body bypasses the
+        outbox, chunking, coalescing and message stamping.
+
+        :param body: The encoded message.
+        :param headers: Metadata sent as transport headers where the protocol has them.
+        """
+        self.logger.info("Sending raw message of %d bytes", len(body))
+        return self._call("send_raw", body, headers)
+
+    def receive_raw(self) -> Message:
+        """
+        Receive a message without decoding it: ``data`` holds the body as bytes and
+        ``metadata["headers"]`` the transport headers. Chunks and duplicates are not handled.
+        """
+        self.logger.info("Receiving raw message...")
+        return self._call("receive_raw")
 
     def receive(self) -> Message:
         self.logger.info("Receiving message...")
-        return self.strategy.receive()
+        while True:
+            message = self._receive_complete()
+            if self.deduplicator is not None and message.action != "error":
+                message_id = message.metadata.get("message_id") or unwrap(message).metadata.get("message_id")
+                if message_id is not None and self.deduplicator.seen(message_id):
+                    self.logger.info("Dropping duplicate message %s", message_id)
+                    self.ack(message)
+                    continue
+            return self._decode_schema(message) if self.schemas is not None else message
+
+    def _receive_complete(self) -> Message:
+        if self.reassembler is None:
+            return self._call("receive")
+
+        ready = self.reassembler.pop_ready()
+        if ready is not None:
+            return ready
+        deadline = time.monotonic() + self.reassembler.timeout
+        while True:
+            message = self._call("receive")
+            if message.action == "error":
+                return message
+            complete = self.reassembler.add(message)
+            if complete is not None:
+                return complete
+            if time.monotonic() >= deadline:
+                return Message(action="error", data={}, metadata={"error": "Incomplete chunked message"})
+
+    def receive_stream(self) -> Iterator[str]:
+        """
+        Receive the next message as a stream of pieces of its serialized JSON text,
+        yielded as the chunks arrive. Requires chunk_size to be configured.
+        The message is acknowledged once the stream has been read to the end.
+        """
+        if self.reassembler is None:
+            raise ValueError("receive_stream() requires chunk_size to be set")
+        ready = self.reassembler.pop_ready()
+        if ready is not None:
+            yield json.dumps(unwrap(ready).__dict__)
+            self.ack(ready)
+            return
+        yield from self.reassembler.stream(lambda: self._call("receive"), ack=lambda chunk: self._call("ack", chunk))
+
+    def stream(self) -> Iterator[Message]:
+        """
+        Yield messages as the endpoint pushes them, for protocols with a streaming
+        receive (REST with Server-Sent Events, NDJSON or long polling).
+        """
+        if not hasattr(self.strategy, 'stream'):
+            raise ValueError("Streaming receive is not supported by this protocol")
+        for message in self.strategy.stream():
+            yield self._decode_schema(message) if self.schemas is not None else message
+
+    def ack(self, message: Message):
+        self.logger.debug("Acknowledging message: %s", message)
+        chunks = chunk_acks(message)
+        if chunks is None:
+            self._call("ack", message)
+            return
+        for chunk in chunks:
+            self._call("ack", chunk)
+
+    def request(self, message: Message, timeout: float = 10.0) -> Message:
+        """
+        Send a request and wait for its reply.
+        Supported by protocols with a reply channel (AMQP and Kafka).
+        """
+        self.logger.info("Sending request: %s", message)
+        if hasattr(self.strategy, 'request'):
+            return self._call("request", message, timeout=timeout)
+        return Message(action="error", data={}, metadata={"error": "Request/reply is not supported by this protocol"})
+
+    def reply(self, request: Message, response: Message) -> Dict[str, Any]:
+        """
+        Answer a request received through receive().
+        """
+        self.logger.info("Replying to request: %s", request)
+        if hasattr(self.strategy, 'reply'):
+            return self._call("reply", request, response)
+        return {"error": "Request/reply is not supported by this protocol"}
 
     def disconnect(self):
         self.logger.info("Disconnecting from communication endpoint...")
+        if self.coalescer is not None:
+            self.coalescer.close()
+        if self.outbox is not None:
+            self.outbox.stop(flush=True, timeout=self.outbox_flush_timeout)
+            self.outbox.close()
         self.strategy.disconnect()
+        if self.deduplicator is not None:
+            self.deduplicator.close()
 
     def seek_to_end(self):
         """
@@ -69,5 +371,67 @@ class Connectiva:
         This method will check if the strategy supports seeking.
         """
         if hasattr(self.strategy, 'seek_to_end'):
-            self.strategy.seek_to_end()
+            self._call("seek_to_end")
             self.logger.info("Consumer moved to the end of the log.")
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """
+        Return hit/miss statistics of the strategy's response cache.
+        Strategies without a cache return an empty dictionary.
+        """
+        cache = getattr(self.strategy, 'cache', None)
+        return cache.stats() if cache is not None else {}
+
+    def limiter_stats(self) -> Dict[str, Any]:
+        """
+        Return throttling counters and the current rate and concurrency limits of the
+        strategy's rate limiter. Strategies without a limiter return an empty dictionary,
+        and balanced REST endpoints report the limiter of each replica by its address.
+        """
+        if hasattr(self.strategy, 'limiter_stats'):
+            return self.strategy.limiter_stats()
+        limiter = getattr(self.strategy, 'limiter', None)
+        return limiter.stats() if limiter is not None else {}
+
+    def load_balancer_stats(self) -> Dict[str, Any]:
+        """
+        Return the load and health of each replica when the strategy balances over several endpoints.
+        """
+        balancer = getattr(self.strategy, 'balancer', None)
+        return balancer.stats() if balancer is not None else {}
+
+    def schema_stats(self) -> Dict[str, Any]:
+        """
+        Return the number of compiled schemas, or an empty dictionary when no schema registry is configured.
+        """
+        return self.schemas.stats() if self.schemas is not None else {}
+
+    def profile_stats(self) -> Dict[str, Any]:
+        """
+        Return the per-stage latency distribution of profiled sends, or an empty dictionary when profiling is disabled.
+        """
+        return self.profiler.stats() if self.profiler is not None else {}
+
+    def coalesce_stats(self) -> Dict[str, Any]:
+        """
+        Return the number and average size of coalesced batches, or an empty dictionary when coalescing is disabled.
+        """
+        return self.coalescer.stats() if self.coalescer is not None else {}
+
+    def chunk_stats(self) -> Dict[str, Any]:
+        """
+        Return reassembly statistics, or an empty dictionary when chunking is disabled.
+        """
+        return self.reassembler.stats() if self.reassembler is not None else {}
+
+    def dedup_stats(self) -> Dict[str, Any]:
+        """
+        Return the duplicate rate of received messages, or an empty dictionary when deduplication is disabled.
+        """
+        return self.deduplicator.stats() if self.deduplicator is not None else {}
+
+    def outbox_stats(self) -> Dict[str, Any]:
+        """
+        Return depth and drain rate of the outbox, or an empty dictionary when it is disabled.
+        """
+        return self.outbox.stats() if self.outbox is not None else {}
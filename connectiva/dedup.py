@@ -0,0 +1,248 @@
+# connectiva/dedup.py
+
+import os
+import json
+import math
+import time
+import base64
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class Deduplicator(ABC):
+    """
+    Remembers recently received message ids so redelivered messages can be dropped.
+    """
+
+    def __init__(self, window: float = 600.0, path: Optional[str] = None):
+        """
+        :param window: Seconds a message id is remembered.
+        :param path: File the state is saved to on close() and restored from on start.
+        """
+        self.window = window
+        self.path = path
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._received = 0
+        self._duplicates = 0
+        if path and os.path.exists(path):
+            try:
+                with open(path) as file:
+                    self._restore(json.load(file))
+                self.logger.info("Restored deduplication state from %s.", path)
+            except (OSError, ValueError, KeyError) as e:
+                self.logger.warning("Ignoring unreadable deduplication state %s: %s", path, e)
+
+    def seen(self, message_id: str) -> bool:
+        """
+        Record a message id.
+
+        :return: True if the id was already seen within the window, i.e. the message is a duplicate.
+        """
+        with self._lock:
+            self._received += 1
+            duplicate = self._check_and_add(message_id, time.time())
+            if duplicate:
+                self._duplicates += 1
+            return duplicate
+
+    def close(self):
+        """
+        Save the state if a path is configured.
+        """
+        if not self.path:
+            return
+        with self._lock:
+            state = self._snapshot()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(state, file)
+        os.replace(temporary, self.path)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return the number of received messages, duplicates and the duplicate rate.
+        """
+        with self._lock:
+            return {
+                "received": self._received,
+                "duplicates": self._duplicates,
+                "duplicate_rate": self._duplicates / self._received if self._received else 0.0,
+                **self._size(),
+            }
+
+    @abstractmethod
+    def _check_and_add(self, message_id: str, now: float) -> bool:
+        """
+        Record a message id seen at ``now``. Called with the lock held.
+
+        :return: True if the id was already seen within the window.
+        """
+        pass
+
+    @abstractmethod
+    def _snapshot(self) -> Dict[str, Any]:
+        """
+        Return the state to save as JSON. Called with the lock held.
+        """
+        pass
+
+    @abstractmethod
+    def _restore(self, state: Dict[str, Any]):
+        """
+        Load a state returned by _snapshot().
+        """
+        pass
+
+    @abstractmethod
+    def _size(self) -> Dict[str, Any]:
+        """
+        Return size statistics for stats(). Called with the lock held.
+        """
+        pass
+
+
+class LRUDeduplicator(Deduplicator):
+    """
+    Exact deduplication over a time window, holding at most ``capacity`` ids.
+    When full, the oldest id is forgotten first.
+    """
+
+    def __init__(self, capacity: int = 100_000, window: float = 600.0, path: Optional[str] = None):
+        self.capacity = capacity
+        self._ids: "OrderedDict[str, float]" = OrderedDict()
+        super().__init__(window=window, path=path)
+
+    def _check_and_add(self, message_id: str, now: float) -> bool:
+        # Ids are kept in arrival order, so the expired ones are at the front
+        while self._ids:
+            oldest, first_seen = next(iter(self._ids.items()))
+            if now - first_seen <= self.window:
+                break
+            del self._ids[oldest]
+        if message_id in self._ids:
+            return True
+        if len(self._ids) >= self.capacity:
+            self._ids.popitem(last=False)
+        self._ids[message_id] = now
+        return False
+
+    def _snapshot(self) -> Dict[str, Any]:
+        return {"ids": list(self._ids.items())}
+
+    def _restore(self, state: Dict[str, Any]):
+        now = time.time()
+        for message_id, first_seen in state["ids"][-self.capacity:]:
+            if now - first_seen <= self.window:
+                self._ids[message_id] = first_seen
+
+    def _size(self) -> Dict[str, Any]:
+        return {"size": len(self._ids), "capacity": self.capacity}
+
+
+class _BloomFilter:
+    def __init__(self, bits: int, hashes: int, data: Optional[bytes] = None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data is not None else bytearray((bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.data[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key: str):
+        for p in self._positions(key):
+            self.data[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+
+class BloomDeduplicator(Deduplicator):
+    """
+    Approximate deduplication for very high volumes, with memory fixed up front.
+
+    Two Bloom filters are rotated: ids go into the current one, lookups check
+    both, and the older one is discarded once the current one holds half the
+    capacity or half the window has passed. A false positive drops a message
+    that was not a duplicate, with a probability of about ``error_rate``.
+    """
+
+    def __init__(self,
+                 capacity: int = 1_000_000,
+                 error_rate: float = 0.001,
+                 window: float = 600.0,
+                 path: Optional[str] = None):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        generation = max(capacity // 2, 1)
+        self._bits = max(int(-generation * math.log(error_rate) / math.log(2) ** 2), 8)
+        self._hashes = max(round(self._bits / generation * math.log(2)), 1)
+        self._current = _BloomFilter(self._bits, self._hashes)
+        self._previous = _BloomFilter(self._bits, self._hashes)
+        self._rotated = time.time()
+        super().__init__(window=window, path=path)
+
+    def _rotate(self, now: float):
+        if self._current.count >= self.capacity // 2 or now - self._rotated >= self.window / 2:
+            self._previous = self._current
+            self._current = _BloomFilter(self._bits, self._hashes)
+            self._rotated = now
+
+    def _check_and_add(self, message_id: str, now: float) -> bool:
+        self._rotate(now)
+        if message_id in self._current or message_id in self._previous:
+            return True
+        self._current.add(message_id)
+        return False
+
+    def _snapshot(self) -> Dict[str, Any]:
+        return {
+            "bits": self._bits,
+            "hashes": self._hashes,
+            "rotated": self._rotated,
+            "filters": [
+                {"count": bloom.count, "data": base64.b64encode(bytes(bloom.data)).decode()}
+                for bloom in (self._current, self._previous)
+            ],
+        }
+
+    def _restore(self, state: Dict[str, Any]):
+        if state["bits"] != self._bits or state["hashes"] != self._hashes:
+            raise ValueError("saved filter was built for a different capacity or error rate")
+        filters = []
+        for saved in state["filters"]:
+            bloom = _BloomFilter(self._bits, self._hashes, base64.b64decode(saved["data"]))
+            bloom.count = saved["count"]
+            filters.append(bloom)
+        self._current, self._previous = filters
+        self._rotated = state["rotated"]
+
+    def _size(self) -> Dict[str, Any]:
+        return {
+            "size": self._current.count + self._previous.count,
+            "capacity": self.capacity,
+            "memory_bytes": 2 * len(self._current.data),
+        }
+
+
+def create_deduplicator(kind: str, capacity: Optional[int] = None, window: float = 600.0,
+                        path: Optional[str] = None) -> Deduplicator:
+    """
+    Create a deduplicator by name ("lru" or "bloom").
+    """
+    if kind == "lru":
+        return LRUDeduplicator(capacity=capacity or 100_000, window=window, path=path)
+    if kind == "bloom":
+        return BloomDeduplicator(capacity=capacity or 1_000_000, window=window, path=path)
+    raise ValueError(f"Unknown deduplication mode: {kind}")
@@ -1,12 +1,64 @@
+import time
+import logging
+from collections import deque
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple, Union
 from connectiva import Message
+from connectiva.codec import CodecPool, dumps, loads, resolved
+
+# Points on the send path at which protocols call the registered hooks
+STAGES = ("pre_serialize", "post_serialize", "pre_io", "post_io", "ack")
+
+# Metadata entries that steer where a message goes (file priority lane, AMQP priority,
+# Kafka key and partition); send_raw() takes them from its headers
+ROUTING_HEADERS = ("priority", "key", "target_partition")
 
 class CommunicationMethod(ABC):
     """
     Abstract base class for different communication methods.
+
+    Protocols report the stages of each send to hooks registered with
+    add_hook(): before and after serializing the message, before and after
+    handing it to the transport, and when the endpoint has acknowledged it.
     """
 
+    _hooks: Optional[Dict[str, List[Callable[[Message, str, float], None]]]] = None
+    codec: Optional[CodecPool] = None  # Set by protocols that offload serialization (see connectiva.codec)
+
+    def add_hook(self, stage: str, hook: Callable[[Message, str, float], None]):
+        """
+        Register a callable to run at a stage of every send.
+
+        :param stage: One of "pre_serialize", "post_serialize", "pre_io", "post_io" or "ack".
+        :param hook: Called with the message, the stage and a time.monotonic() timestamp.
+        """
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage: {stage}")
+        if self._hooks is None:
+            self._hooks = {}
+        self._hooks.setdefault(stage, []).append(hook)
+
+    def remove_hook(self, stage: str, hook: Callable[[Message, str, float], None]):
+        """
+        Unregister a callable added with add_hook().
+        """
+        if self._hooks and hook in self._hooks.get(stage, []):
+            self._hooks[stage].remove(hook)
+
+    def _stage(self, stage: str, message: Message):
+        """
+        Run the hooks of a stage. Hooks cannot fail the send; their errors are logged.
+        """
+        if not self._hooks or not self._hooks.get(stage):
+            return
+        now = time.monotonic()
+        for hook in self._hooks[stage]:
+            try:
+                hook(message, stage, now)
+            except Exception as e:
+                logging.getLogger(self.__class__.__name__).error("Hook for stage %s failed: %s", stage, e)
+
     @abstractmethod
     def connect(self):
         """
@@ -24,6 +76,84 @@ class CommunicationMethod(ABC):
         """
         pass
 
+    def send_batch(self, messages: List[Message]) -> List[Dict[str, Any]]:
+        """
+        Sends several messages. Protocols that can ship a batch in one
+        operation override this; by default each message is sent in turn.
+
+        :param messages: The messages to be sent.
+        :return: One response dictionary per message, in the same order.
+        """
+        if self.codec is not None:
+            return [self._send_encoded(message, body) for message, body in self._encode_ahead(messages)]
+        return [self.send(message) for message in messages]
+
+    def _encode_ahead(self, messages: List[Message]) -> Iterator[Tuple[Message, Future]]:
+        """
+        Yield each message with the future of its encoding, keeping the codec pool
+        busy with the next messages while the caller sends the current one. At most
+        two messages per worker are encoded ahead, which bounds the memory held.
+        """
+        window = 2 * self.codec.processes if self.codec is not None else 1
+        ahead = deque()
+        for message in messages:
+            ahead.append((message, self._encode_message(message)))
+            if len(ahead) > window:
+                yield ahead.popleft()
+        while ahead:
+            yield ahead.popleft()
+
+    def _send_encoded(self, message: Message, encoded: Future) -> Dict[str, Any]:
+        """
+        Send a message already serialized by _encode_message(). Protocols that set
+        a codec override this and let send() delegate to it; by default the message
+        goes through send() again.
+
+        :param message: The message to be sent.
+        :param encoded: Future resolving to the encoded message.
+        :return: A dictionary containing the response.
+        """
+        return self.send(message)
+
+    def _encode_message(self, message: Message) -> Future:
+        """
+        Serialize a message, in the codec pool when one is configured.
+
+        :return: A future resolving to the encoded bytes.
+        """
+        self._stage("pre_serialize", message)
+        if self.codec is not None:
+            return self.codec.encode(message.__dict__)
+        return resolved(dumps, message.__dict__)
+
+    def _decode_body(self, data: Any) -> Any:
+        """
+        Deserialize a received body, in the codec pool when one is configured.
+        """
+        if self.codec is not None:
+            return self.codec.decode(data).result()
+        return loads(data)
+
+    def send_raw(self, body: Union[bytes, memoryview], headers: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Sends an already encoded body as is, without building or serializing a
+        Message, e.g. to relay what receive_raw() returned from another endpoint.
+
+        :param body: The encoded message.
+        :param headers: Metadata sent alongside the body, by protocols that support headers.
+        :return: A dictionary containing the response.
+        """
+        return {"error": f"Raw send is not supported by {self.__class__.__name__}"}
+
+    def receive_raw(self) -> Message:
+        """
+        Receives a message without decoding it.
+
+        :return: A message whose data is the received body as bytes, with the
+                 transport headers in ``metadata["headers"]``.
+        """
+        return Message(action="error", data={}, metadata={"error": f"Raw receive is not supported by {self.__class__.__name__}"})
+
     @abstractmethod
     def receive(self) -> Message:
         """
@@ -33,6 +163,15 @@ class CommunicationMethod(ABC):
         """
         pass
 
+    def ack(self, message: Message):
+        """
+        Acknowledges that a received message has been fully processed.
+        Protocols that acknowledge on receive treat this as a no-op.
+
+        :param message: The message returned by receive().
+        """
+        pass
+
     @abstractmethod
     def disconnect(self):
         """
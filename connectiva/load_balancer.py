@@ -0,0 +1,246 @@
+# connectiva/load_balancer.py
+
+import time
+import random
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+
+class NoReplicasError(Exception):
+    """
+    Raised by LoadBalancer.pick() when there is no replica to send to.
+    """
+
+
+class _Replica:
+    """
+    Health and load state of one endpoint.
+    """
+
+    def __init__(self, address: str):
+        self.address = address
+        self.outstanding = 0
+        self.latency: Optional[float] = None  # EWMA of response times in seconds
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+
+class LoadBalancer:
+    """
+    Spreads requests over several replicas of an endpoint.
+
+    Strategies:
+
+    - ``round_robin``: replicas in turn.
+    - ``least_outstanding``: the replica with the fewest requests in flight.
+    - ``p2c``: the better of two random replicas, scored by latency EWMA times
+      requests in flight ("power of two choices").
+
+    Replicas are ejected passively: after ``failure_threshold`` consecutive
+    failures, or when their latency EWMA exceeds ``slow_factor`` times the
+    median of the others. Ejected replicas get traffic again after
+    ``ejection_time`` seconds, doubled for each repeated ejection. At most half
+    of the replicas are ejected at a time, and if all are unavailable the
+    balancer falls back to using all of them.
+    """
+
+    STRATEGIES = ("round_robin", "least_outstanding", "p2c")
+
+    def __init__(self,
+                 endpoints: Optional[Sequence[str]] = None,
+                 resolver: Optional[Callable[[], Sequence[str]]] = None,
+                 strategy: str = "round_robin",
+                 resolve_interval: float = 30.0,
+                 failure_threshold: int = 3,
+                 ejection_time: float = 30.0,
+                 slow_factor: float = 5.0,
+                 decay: float = 0.3):
+        """
+        :param endpoints: Addresses of the replicas.
+        :param resolver: Callable returning the current addresses, called every ``resolve_interval`` seconds.
+        :param strategy: "round_robin", "least_outstanding" or "p2c".
+        :param resolve_interval: Seconds between resolver calls.
+        :param failure_threshold: Consecutive failures after which a replica is ejected.
+        :param ejection_time: Seconds a replica is ejected for the first time.
+        :param slow_factor: Eject replicas this many times slower than the median; 0 disables.
+        :param decay: Weight of the newest sample in the latency EWMA.
+        """
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown load balancing strategy: {strategy}")
+        if not endpoints and resolver is None:
+            raise ValueError("LoadBalancer needs endpoints or a resolver")
+        self.strategy = strategy
+        self.resolver = resolver
+        self.resolve_interval = resolve_interval
+        self.failure_threshold = failure_threshold
+        self.ejection_time = ejection_time
+        self.slow_factor = slow_factor
+        self.decay = decay
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._replicas: Dict[str, _Replica] = {}
+        self._next = 0
+        self._resolved = 0.0
+        self._update(endpoints or self._resolve())
+
+    def _resolve(self) -> List[str]:
+        try:
+            addresses = list(self.resolver())
+        except Exception as e:
+            self.logger.error("Endpoint resolver failed: %s", e)
+            return []
+        self._resolved = time.monotonic()
+        return addresses
+
+    def _update(self, addresses: Sequence[str]):
+        if not addresses:
+            return
+        # Keep the state of replicas that are still listed
+        self._replicas = {address: self._replicas.get(address) or _Replica(address) for address in addresses}
+
+    @property
+    def endpoints(self) -> List[str]:
+        return list(self._replicas)
+
+    def pick(self) -> str:
+        """
+        Choose the replica for the next request.
+
+        :raises NoReplicasError: If no endpoints were given and the resolver has not returned any.
+        """
+        if self.resolver is not None and time.monotonic() - self._resolved >= self.resolve_interval:
+            addresses = self._resolve()
+            with self._lock:
+                self._update(addresses)
+        with self._lock:
+            now = time.monotonic()
+            replicas = list(self._replicas.values())
+            if not replicas:
+                raise NoReplicasError("No replicas available: the resolver has not returned any endpoints")
+            candidates = [replica for replica in replicas if replica.healthy(now)] or replicas
+            if self.strategy == "round_robin":
+                replica = candidates[self._next % len(candidates)]
+                self._next += 1
+            elif self.strategy == "least_outstanding":
+                fewest = min(replica.outstanding for replica in candidates)
+                replica = random.choice([r for r in candidates if r.outstanding == fewest])
+            else:
+                pair = random.sample(candidates, 2) if len(candidates) > 1 else candidates
+                # Unmeasured replicas score 0 so they get probed
+                replica = min(pair, key=lambda r: (r.latency or 0.0) * (r.outstanding + 1))
+            replica.outstanding += 1
+            return replica.address
+
+    def release(self, address: str, latency: Optional[float], failed: bool = False):
+        """
+        Record the outcome of a request sent to a replica chosen by pick().
+
+        :param address: The replica.
+        :param latency: Seconds the request took.
+        :param failed: Whether the request failed.
+        """
+        with self._lock:
+            replica = self._replicas.get(address)
+            if replica is None:
+                return  # Removed by the resolver meanwhile
+            now = time.monotonic()
+            replica.outstanding = max(replica.outstanding - 1, 0)
+            replica.requests += 1
+            if latency is not None:
+                replica.latency = latency if replica.latency is None else \
+                    (1 - self.decay) * replica.latency + self.decay * latency
+            if failed:
+                replica.errors += 1
+                replica.consecutive_failures += 1
+                if replica.consecutive_failures >= self.failure_threshold:
+                    self._eject(replica, now, f"{replica.consecutive_failures} consecutive failures")
+            else:
+                replica.consecutive_failures = 0
+                if replica.ejections and now - replica.ejected_until > self.ejection_time:
+                    replica.ejections = 0  # Healthy for a while, so the next ejection starts short again
+                if self.slow_factor and self._is_slow(replica, now):
+                    self._eject(replica, now, f"latency {replica.latency:.3f}s")
+
+    def _is_slow(self, replica: _Replica, now: float) -> bool:
+        others = sorted(
+            r.latency for r in self._replicas.values()
+            if r is not replica and r.latency is not None and r.healthy(now)
+        )
+        if len(others) < 2 or replica.latency is None:
+            return False
+        return replica.latency > self.slow_factor * others[len(others) // 2]
+
+    def _eject(self, replica: _Replica, now: float, reason: str):
+        if not replica.healthy(now):
+            return
+        ejected = sum(1 for r in self._replicas.values() if not r.healthy(now))
+        if ejected + 1 > len(self._replicas) // 2:
+            return
+        duration = self.ejection_time * 2 ** replica.ejections
+        replica.ejected_until = now + duration
+        replica.ejections += 1
+        replica.consecutive_failures = 0
+        self.logger.warning("Ejecting %s for %.0fs (%s).", replica.address, duration, reason)
+
+    def call(self, request: Callable[[str], Any], failed: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Run a request against a chosen replica and record its outcome.
+
+        :param request: Callable taking the replica address and performing the request.
+        :param failed: Callable telling whether a returned result counts as a failure;
+                       exceptions always do and are re-raised.
+        """
+        address = self.pick()
+        started = time.monotonic()
+        try:
+            result = request(address)
+        except Exception:
+            self.release(address, time.monotonic() - started, failed=True)
+            raise
+        self.release(address, time.monotonic() - started, failed=bool(failed and failed(result)))
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return the load and health of every replica.
+        """
+        with self._lock:
+            now = time.monotonic()
+            return {
+                replica.address: {
+                    "outstanding": replica.outstanding,
+                    "latency": replica.latency,
+                    "requests": replica.requests,
+                    "errors": replica.errors,
+                    "healthy": replica.healthy(now),
+                }
+                for replica in self._replicas.values()
+            }
+
+
+def create_load_balancer(**kwargs) -> Optional[LoadBalancer]:
+    """
+    Build a balancer from the ``endpoints``, ``resolver`` and ``load_balancing``
+    options, or from a comma-separated ``endpoint``. Returns None for a single endpoint.
+    """
+    endpoints = kwargs.get("endpoints")
+    if not endpoints and "," in (kwargs.get("endpoint") or ""):
+        endpoints = [endpoint.strip() for endpoint in kwargs["endpoint"].split(",") if endpoint.strip()]
+    resolver = kwargs.get("resolver")
+    if resolver is None and (not endpoints or len(endpoints) < 2):
+        return None
+    return LoadBalancer(
+        endpoints=endpoints,
+        resolver=resolver,
+        strategy=kwargs.get("load_balancing", "round_robin"),
+        resolve_interval=kwargs.get("resolve_interval", 30.0),
+        failure_threshold=kwargs.get("failure_threshold", 3),
+        ejection_time=kwargs.get("ejection_time", 30.0)
+    )
@@ -8,4 +8,16 @@ class Message:
     """
     action: str
     data: Any
-    metadata: Dict[str, Any] = field(default_factory=dict)
\ No newline at end of file
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+def unwrap(message: Message) -> Message:
+    """
+    Return the message as the sender built it.
+
+    Broker protocols (AMQP, Kafka) return the sent envelope as the data of a
+    "receive" message; other protocols return the sent message itself.
+    """
+    data = message.data
+    if isinstance(data, dict) and "action" in data and "data" in data and set(data) <= {"action", "data", "metadata"}:
+        return Message(action=data["action"], data=data["data"], metadata=data.get("metadata") or {})
+    return message
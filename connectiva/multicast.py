@@ -0,0 +1,172 @@
+# connectiva/multicast.py
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Union
+from connectiva.codec import dumps
+from connectiva.message import Message
+from connectiva.connectiva import Connectiva
+from connectiva.interfaces import ROUTING_HEADERS
+
+
+class Multicast:
+    """
+    Publishes each message to several endpoints at once.
+
+    Sends run concurrently on a thread pool, so the total latency is that of
+    the slowest target rather than the sum of all of them. Each target has its
+    own timeout and the results are reported per target. Clients are not
+    generally thread-safe, so a target runs one call at a time: a send that
+    timed out keeps the target busy until it returns, and sends in the meantime
+    skip that target with an error instead of overlapping it.
+    """
+
+    def __init__(self,
+                 targets: Union[List[Any], Dict[str, Any]],
+                 timeout: Union[float, Dict[str, float]] = 10.0,
+                 max_workers: Optional[int] = None,
+                 encode_once: bool = True):
+        """
+        :param targets: Connectiva instances, or configuration dictionaries to build them from.
+                        A dictionary maps target names to either.
+        :param timeout: Seconds to wait for each target, or a dictionary of timeouts by target name.
+        :param max_workers: Size of the thread pool; defaults to two threads per target.
+        :param encode_once: Serialize each message once and hand the same bytes to every
+                            target through send_raw(); set False to let each target encode it
+                            with send(). The priority, key and target_partition metadata go
+                            along as headers.
+        """
+        if not isinstance(targets, dict):
+            named = {}
+            for index, target in enumerate(targets):
+                endpoint = target.get("endpoint") if isinstance(target, dict) else getattr(target, "config", {}).get("endpoint")
+                name = str(endpoint or index)
+                named[name if name not in named else f"{name}#{index}"] = target
+            targets = named
+
+        self.targets = {
+            name: Connectiva(**target) if isinstance(target, dict) else target
+            for name, target in targets.items()
+        }
+        self.timeouts = {
+            name: timeout.get(name, 10.0) if isinstance(timeout, dict) else timeout
+            for name in self.targets
+        }
+        self.encode_once = encode_once
+        # Held while a call runs on the target
+        self._busy = {name: threading.Lock() for name in self.targets}
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or 2 * len(self.targets),
+            thread_name_prefix="multicast"
+        )
+
+    def _each(self, method: str, *args, wait: bool = False) -> Dict[str, Any]:
+        """
+        Call a method on every target concurrently and collect the per-target results.
+        Targets still busy with an earlier call are skipped, unless ``wait`` is set
+        to queue the call behind it.
+        """
+        started = time.monotonic()
+        results = {}
+        latencies = {}
+        futures = {}
+        for name, target in self.targets.items():
+            busy = self._busy[name]
+            if not wait and not busy.acquire(blocking=False):
+                self.logger.warning("Target %s is still busy with an earlier call; skipping it.", name)
+                results[name] = {"error": "Earlier call still running"}
+                latencies[name] = 0.0
+                continue
+            futures[name] = self._executor.submit(self._locked, busy, not wait, getattr(target, method), *args)
+        for name, future in futures.items():
+            remaining = max(started + self.timeouts[name] - time.monotonic(), 0.0)
+            try:
+                results[name], latencies[name] = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                self.logger.warning("Target %s timed out after %.1fs.", name, self.timeouts[name])
+                results[name] = {"error": f"Timed out after {self.timeouts[name]}s"}
+                latencies[name] = self.timeouts[name]
+            except Exception as e:
+                self.logger.error("Target %s failed: %s", name, e)
+                results[name] = {"error": str(e)}
+                latencies[name] = time.monotonic() - started
+        return {"results": {name: results[name] for name in self.targets},
+                "latency": {name: latencies[name] for name in self.targets}}
+
+    @classmethod
+    def _locked(cls, busy: threading.Lock, acquired: bool, func, *args):
+        """
+        Run a call while holding the target's lock, taking it first unless the caller already did.
+        """
+        if not acquired:
+            busy.acquire()
+        try:
+            return cls._timed(func, *args)
+        finally:
+            busy.release()
+
+    @staticmethod
+    def _timed(func, *args):
+        started = time.monotonic()
+        result = func(*args)
+        return result, time.monotonic() - started
+
+    def connect(self) -> Dict[str, Any]:
+        """
+        Connect every target concurrently.
+        """
+        return self._each("connect")
+
+    def send(self, message: Message) -> Dict[str, Any]:
+        """
+        Send a message to every target.
+
+        :param message: The message to publish.
+        :return: The overall status ("sent", "partial" or "failed") with per-target results and latencies.
+        """
+        try:
+            # Serialize once up front: an unencodable message fails here instead of once per target
+            body = dumps(message.__dict__)
+        except (TypeError, ValueError) as e:
+            return {
+                "status": "failed",
+                "results": {name: {"error": str(e)} for name in self.targets},
+                "latency": {name: 0.0 for name in self.targets},
+            }
+
+        self.logger.info("Multicasting message to %d targets...", len(self.targets))
+        if self.encode_once:
+            # Routing metadata travels as headers so targets place the message as send() would
+            headers = {key: message.metadata[key] for key in ROUTING_HEADERS if message.metadata.get(key) is not None}
+            outcome = self._each("send_raw", body, headers or None)
+        else:
+            outcome = self._each("send", message)
+        failed = sum(
+            1 for result in outcome["results"].values()
+            if not isinstance(result, dict) or "error" in result
+        )
+        if not failed:
+            outcome["status"] = "sent"
+        elif failed < len(self.targets):
+            outcome["status"] = "partial"
+        else:
+            outcome["status"] = "failed"
+        return outcome
+
+    def disconnect(self):
+        """
+        Disconnect every target and shut down the thread pool. A target still busy
+        with a timed-out call is disconnected once that call returns.
+        """
+        self._each("disconnect", wait=True)
+        self._executor.shutdown(wait=False)
+
+    def __enter__(self) -> "Multicast":
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.disconnect()
@@ -0,0 +1,258 @@
+# connectiva/outbox.py
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+from connectiva.message import Message
+
+
+class Outbox:
+    """
+    Durable local buffer that decouples callers from a slow or unavailable endpoint.
+
+    Messages are appended to a SQLite database in WAL mode and a background
+    drainer ships them in batches through ``send_batch``. Delivery is in order
+    and at-least-once: a batch is only removed from the outbox up to its first
+    failed message, and the rest is retried with exponential backoff. With
+    ``max_attempts`` set, a message that keeps failing is moved to a dead letter
+    table so it no longer holds up the messages behind it.
+    """
+
+    def __init__(self,
+                 directory: str,
+                 send_batch: Callable[[List[Message]], List[Dict[str, Any]]],
+                 name: str = "outbox",
+                 batch_size: int = 100,
+                 retry_backoff: float = 0.5,
+                 max_backoff: float = 30.0,
+                 poll_interval: float = 1.0,
+                 max_attempts: Optional[int] = None):
+        """
+        :param directory: Directory holding the outbox database.
+        :param send_batch: Callable that sends a list of messages and returns one result per message.
+        :param name: Name of the database file, without extension.
+        :param batch_size: Maximum number of messages shipped per batch.
+        :param retry_backoff: Initial delay in seconds after a failed batch, doubled on each failure.
+        :param max_backoff: Upper bound for the retry delay.
+        :param poll_interval: Seconds the drainer sleeps when the outbox is empty.
+        :param max_attempts: Deliveries tried before a message is dead-lettered; None retries forever.
+        """
+        self.send_batch = send_batch
+        self.batch_size = batch_size
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{name}.db")
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._drained = 0
+        self._failed_batches = 0
+        self._last_error: Optional[str] = None
+        self._recent = deque()  # (timestamp, count) of recent drains, for the drain rate
+        with self._lock:
+            self._open()
+
+    def _open(self) -> sqlite3.Connection:
+        """
+        Open the database unless it is open already. Caller must hold the lock.
+        """
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(outbox)")]
+            if "attempts" not in columns:
+                # Outboxes created before delivery attempts were counted
+                self._db.execute("ALTER TABLE outbox ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS dead_letters ("
+                "id INTEGER PRIMARY KEY, payload TEXT NOT NULL, created REAL NOT NULL, error TEXT)"
+            )
+        return self._db
+
+    def append(self, message: Message) -> int:
+        """
+        Persist a message for delivery.
+
+        :param message: The message to buffer.
+        :return: The outbox id of the message.
+        :raises TypeError: If the message cannot be serialized as JSON.
+        """
+        payload = json.dumps(message.__dict__)
+        with self._lock:
+            cursor = self._open().execute(
+                "INSERT INTO outbox (payload, created) VALUES (?, ?)", (payload, time.time())
+            )
+        self._wakeup.set()
+        return cursor.lastrowid
+
+    def start(self):
+        """
+        Start the background drainer.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            self._open()  # Reopens the database after close()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._drain, name="outbox-drainer", daemon=True)
+        self._thread.start()
+        self.logger.info("Outbox drainer started for %s.", self.path)
+
+    def stop(self, flush: bool = True, timeout: Optional[float] = None):
+        """
+        Stop the drainer.
+
+        :param flush: Keep draining until the outbox is empty or the timeout expires.
+        :param timeout: Seconds to wait for the flush.
+        """
+        if flush and self._thread is not None:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while self.depth() and self._thread.is_alive():
+                if deadline is not None and time.monotonic() >= deadline:
+                    self.logger.warning("Outbox stopped with %d messages pending.", self.depth())
+                    break
+                time.sleep(0.05)
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        """
+        Stop the drainer without flushing and close the database. Messages are kept
+        for the next start().
+        """
+        self.stop(flush=False)
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def depth(self) -> int:
+        """
+        Return the number of messages waiting for delivery.
+        """
+        with self._lock:
+            return self._open().execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return buffer depth, drain progress and the recent drain rate in messages per second.
+        """
+        with self._lock:
+            database = self._open()
+            depth, oldest = database.execute("SELECT COUNT(*), MIN(created) FROM outbox").fetchone()
+            dead_letters = database.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+            now = time.monotonic()
+            while self._recent and now - self._recent[0][0] > 60:
+                self._recent.popleft()
+            window = now - self._recent[0][0] if self._recent else 0.0
+            recent = sum(count for _, count in self._recent)
+            return {
+                "depth": depth,
+                "oldest_age": time.time() - oldest if oldest is not None else 0.0,
+                "drained": self._drained,
+                "failed_batches": self._failed_batches,
+                "dead_letters": dead_letters,
+                "drain_rate": recent / window if window > 0 else float(recent),
+                "last_error": self._last_error,
+            }
+
+    def dead_letters(self) -> List[Dict[str, Any]]:
+        """
+        Return the messages given up on after ``max_attempts`` deliveries, oldest first.
+
+        :return: Dictionaries with the outbox ``id``, the ``message`` and the last ``error``.
+        """
+        with self._lock:
+            rows = self._open().execute("SELECT id, payload, error FROM dead_letters ORDER BY id").fetchall()
+        return [
+            {"id": row_id, "message": Message(**json.loads(payload)), "error": error}
+            for row_id, payload, error in rows
+        ]
+
+    def _next_batch(self) -> List[tuple]:
+        with self._lock:
+            return self._open().execute(
+                "SELECT id, payload, attempts FROM outbox ORDER BY id LIMIT ?", (self.batch_size,)
+            ).fetchall()
+
+    def _failed(self, row: tuple):
+        """
+        Count a failed delivery of the message holding up the outbox, and move it
+        to the dead letters once it has used up its attempts.
+        """
+        row_id, _, attempts = row
+        with self._lock:
+            database = self._open()
+            if self.max_attempts is None or attempts + 1 < self.max_attempts:
+                database.execute("UPDATE outbox SET attempts = attempts + 1 WHERE id = ?", (row_id,))
+                return
+            database.execute("BEGIN")
+            database.execute(
+                "INSERT INTO dead_letters (id, payload, created, error) "
+                "SELECT id, payload, created, ? FROM outbox WHERE id = ?", (self._last_error, row_id)
+            )
+            database.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+            database.execute("COMMIT")
+        self.logger.error("Giving up on outbox message %d after %d attempts: %s", row_id, attempts + 1, self._last_error)
+
+    def _drain(self):
+        backoff = self.retry_backoff
+        while not self._stopping.is_set():
+            rows = self._next_batch()
+            if not rows:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            messages = [Message(**json.loads(payload)) for _, payload, _ in rows]
+            try:
+                results = self.send_batch(messages)
+            except Exception as e:
+                results = [{"error": str(e)} for _ in messages]
+
+            # Only commit the prefix that was delivered, so order is preserved on retry
+            delivered = 0
+            for result in list(results)[:len(rows)]:
+                if not isinstance(result, dict) or "error" in result:
+                    self._last_error = str(result.get("error") if isinstance(result, dict) else result)
+                    break
+                delivered += 1
+            else:
+                if delivered < len(rows):
+                    # send_batch returned fewer results than messages
+                    self._last_error = f"No result for {len(rows) - delivered} messages"
+
+            if delivered:
+                with self._lock:
+                    self._open().execute("DELETE FROM outbox WHERE id <= ?", (rows[delivered - 1][0],))
+                    self._drained += delivered
+                    self._recent.append((time.monotonic(), delivered))
+                backoff = self.retry_backoff
+
+            if delivered < len(rows):
+                self._failed_batches += 1
+                self._failed(rows[delivered])
+                self.logger.warning("Outbox delivery failed (%s), retrying in %.1fs.", self._last_error, backoff)
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
@@ -0,0 +1,446 @@
+# connectiva/pipeline.py
+
+import time
+import queue
+import asyncio
+import inspect
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from connectiva.message import Message
+from connectiva.profiling import inherit_trace
+
+# Sentinel passed through the queues when the pipeline drains
+_STOP = object()
+
+
+class StageMetrics:
+    """
+    Throughput and latency counters for one pipeline stage.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, duration: float, count: int = 1, error: bool = False):
+        """
+        Record one call that handled ``count`` messages in ``duration`` seconds.
+        """
+        with self._lock:
+            self.count += count
+            self.total_time += duration
+            self.max_time = max(self.max_time, duration)
+            if error:
+                self.errors += 1
+
+    def snapshot(self, elapsed: float) -> Dict[str, Any]:
+        """
+        Return the counters together with throughput over ``elapsed`` seconds.
+        """
+        with self._lock:
+            return {
+                "count": self.count,
+                "errors": self.errors,
+                "throughput": self.count / elapsed if elapsed > 0 else 0.0,
+                "avg_latency": self.total_time / self.count if self.count else 0.0,
+                "max_latency": self.max_time,
+            }
+
+
+class _AckTracker:
+    """
+    Acknowledges source messages in the order they were received, once every
+    message derived from them has been confirmed by the sink.
+
+    Confirmations arrive on the worker and sink threads, but source clients such
+    as pika channels and Kafka consumers are not thread-safe, so released messages
+    are queued and acknowledged by the thread that receives, through drain().
+    """
+
+    def __init__(self, ack: Callable[[Message], None]):
+        self.ack = ack
+        self.acked = 0
+        self._entries: Dict[int, list] = {}
+        self._next = 0
+        self._lock = threading.Lock()
+        self._ready: "queue.Queue" = queue.Queue()
+
+    def register(self, seq: int, message: Message):
+        with self._lock:
+            # [source message, outputs still pending, outputs known]
+            self._entries[seq] = [message, 0, False]
+
+    def expand(self, seq: int, outputs: int):
+        """
+        Record how many sink messages were derived from source message ``seq``.
+        """
+        with self._lock:
+            entry = self._entries[seq]
+            entry[1] += outputs
+            entry[2] = True
+            self._release()
+
+    def complete(self, seq: int):
+        """
+        Record that the sink confirmed one message derived from ``seq``.
+        """
+        with self._lock:
+            self._entries[seq][1] -= 1
+            self._release()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _release(self):
+        # Called with the lock held, so releases from different threads keep source order
+        while self._next in self._entries:
+            message, outstanding, known = self._entries[self._next]
+            if not known or outstanding > 0:
+                break
+            del self._entries[self._next]
+            self._ready.put(message)
+            self._next += 1
+
+    def drain(self, timeout: float = 0.0):
+        """
+        Acknowledge the released messages on the calling thread, waiting up to
+        ``timeout`` seconds for the first one.
+        """
+        try:
+            message = self._ready.get(timeout=timeout) if timeout > 0 else self._ready.get_nowait()
+        except queue.Empty:
+            return
+        while True:
+            try:
+                self.ack(message)
+            except Exception as e:
+                logging.getLogger(Pipeline.__name__).error("Failed to acknowledge message: %s", e)
+            self.acked += 1
+            try:
+                message = self._ready.get_nowait()
+            except queue.Empty:
+                return
+
+
+class Pipeline:
+    """
+    Streams messages from a source endpoint through transform stages into a sink endpoint.
+
+    Stages are callables taking a Message and returning a Message, a list of
+    messages, a generator of messages, or None to drop it; coroutine functions
+    and async generators are also accepted. Transforms run on ``workers`` threads,
+    bounded queues between the reader, the workers and the sink apply backpressure,
+    and messages are sent to the sink in batches of up to ``batch_size``. A source
+    message is acknowledged only after the sink has confirmed everything derived from it.
+    """
+
+    def __init__(self,
+                 source,
+                 *stages: Callable,
+                 sink,
+                 workers: int = 1,
+                 queue_size: int = 100,
+                 batch_size: int = 1,
+                 batch_linger: float = 0.0,
+                 poll_interval: float = 0.1,
+                 max_retries: int = 3,
+                 retry_backoff: float = 0.5,
+                 on_error: Optional[Callable[[Message, Any], None]] = None):
+        """
+        :param source: Connectiva instance (or CommunicationMethod) to receive from.
+        :param stages: Transform callables applied in order.
+        :param sink: Connectiva instance (or CommunicationMethod) to send to.
+        :param workers: Number of threads running the transform stages.
+        :param queue_size: Capacity of the queues between reader, workers and sink.
+        :param batch_size: Maximum number of messages sent to the sink in one batch.
+        :param batch_linger: Seconds to wait for a batch to fill before sending it.
+        :param poll_interval: Seconds to wait after the source reports no message.
+        :param max_retries: Times a failed sink send is retried before giving up.
+        :param retry_backoff: Initial delay in seconds between retries, doubled each time.
+        :param on_error: Called with the message and the error when a stage or the sink fails.
+                         Without it, a failure stops the pipeline and leaves the source unacknowledged.
+        """
+        self.source = source
+        self.stages = list(stages)
+        self.sink = sink
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_linger = batch_linger
+        self.poll_interval = poll_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.on_error = on_error
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.error: Optional[Any] = None
+
+        self._inbound: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._outbound: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._tracker = _AckTracker(self.source.ack)
+        self._stopping = threading.Event()
+        self._aborted = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._workers_left = 0
+        self._workers_lock = threading.Lock()
+        self._started_at = None
+        self._source_metrics = StageMetrics()
+        self._sink_metrics = StageMetrics()
+        self._stage_names = [f"{i}:{getattr(stage, '__name__', type(stage).__name__)}" for i, stage in enumerate(self.stages)]
+        self._stage_metrics = {name: StageMetrics() for name in self._stage_names}
+
+    def start(self) -> "Pipeline":
+        """
+        Start the reader, worker and sink threads.
+        """
+        self._started_at = time.monotonic()
+        self._workers_left = self.workers
+        self._threads = [threading.Thread(target=self._read, name="pipeline-reader", daemon=True)]
+        self._threads += [
+            threading.Thread(target=self._work, name=f"pipeline-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        self._threads.append(threading.Thread(target=self._write, name="pipeline-sink", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        self.logger.info("Pipeline started with %d workers.", self.workers)
+        return self
+
+    def stop(self, drain: bool = True, timeout: Optional[float] = None):
+        """
+        Stop reading from the source and wait for the threads to exit.
+
+        :param drain: Finish transforming and sending messages already read; otherwise drop them unacknowledged.
+        :param timeout: Seconds to wait for each thread.
+        """
+        self._stopping.set()
+        if not drain:
+            self._aborted.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self.logger.info("Pipeline stopped.")
+
+    def join(self, timeout: Optional[float] = None):
+        """
+        Wait for the pipeline to stop, either through stop() or after a failure.
+        """
+        for thread in self._threads:
+            thread.join(timeout)
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def __enter__(self) -> "Pipeline":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Return per-stage throughput and latency together with queue depths and ack progress.
+        """
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        return {
+            "elapsed": elapsed,
+            "source": self._source_metrics.snapshot(elapsed),
+            "stages": {name: metrics.snapshot(elapsed) for name, metrics in self._stage_metrics.items()},
+            "sink": self._sink_metrics.snapshot(elapsed),
+            "acked": self._tracker.acked,
+            "in_flight": self._tracker.pending(),
+            "inbound_depth": self._inbound.qsize(),
+            "outbound_depth": self._outbound.qsize(),
+        }
+
+    def _fail(self, message: Message, error: Any) -> bool:
+        """
+        Report a failure. Returns True when the message should be treated as handled.
+        """
+        if self.on_error is not None:
+            try:
+                self.on_error(message, error)
+                return True
+            except Exception as e:
+                error = e
+        self.logger.error("Pipeline stopping after failure: %s", error)
+        self.error = error
+        self._stopping.set()
+        self._aborted.set()
+        return False
+
+    def _put(self, target: "queue.Queue", item, waiting: Optional[Callable[[], None]] = None) -> bool:
+        """
+        Put an item on a bounded queue, blocking for backpressure until the pipeline aborts.
+        ``waiting`` is called each time the queue is found full.
+        """
+        while not self._aborted.is_set():
+            try:
+                target.put(item, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                if waiting is not None:
+                    waiting()
+        return False
+
+    def _read(self):
+        # Source acks are drained here, between receives, as the source may not be thread-safe
+        seq = 0
+        while not self._stopping.is_set():
+            self._tracker.drain()
+            started = time.monotonic()
+            message = self.source.receive()
+            if message.action == "error":
+                self._tracker.drain(self.poll_interval)
+                continue
+            self._source_metrics.record(time.monotonic() - started)
+            self._tracker.register(seq, message)
+            if not self._put(self._inbound, (seq, message), self._tracker.drain):
+                break
+            seq += 1
+        for _ in range(self.workers):
+            self._put(self._inbound, _STOP, self._tracker.drain)
+        # Keep acknowledging until the sink has confirmed what was already read
+        sink = self._threads[-1]
+        while sink.is_alive():
+            self._tracker.drain(self.poll_interval)
+        self._tracker.drain()
+
+    def _work(self):
+        loop = asyncio.new_event_loop()
+        try:
+            while not self._aborted.is_set():
+                try:
+                    item = self._inbound.get(timeout=self.poll_interval)
+                except queue.Empty:
+                    continue
+                if item is _STOP:
+                    break
+                seq, message = item
+                try:
+                    outputs = self._transform(message, loop)
+                except Exception as e:
+                    if self._fail(message, e):
+                        self._tracker.expand(seq, 0)
+                    continue
+                self._tracker.expand(seq, len(outputs))
+                for output in outputs:
+                    if not self._put(self._outbound, (seq, output)):
+                        return
+        finally:
+            loop.close()
+            with self._workers_lock:
+                self._workers_left -= 1
+                last = self._workers_left == 0
+            if last:
+                self._put(self._outbound, _STOP)
+
+    def _transform(self, message: Message, loop: asyncio.AbstractEventLoop) -> List[Message]:
+        """
+        Run a message through every stage and return the messages destined for the sink.
+        """
+        current = [message]
+        for name, stage in zip(self._stage_names, self.stages):
+            produced = []
+            for item in current:
+                started = time.monotonic()
+                try:
+                    produced.extend(self._call_stage(stage, item, loop))
+                except Exception:
+                    self._stage_metrics[name].record(time.monotonic() - started, error=True)
+                    raise
+                self._stage_metrics[name].record(time.monotonic() - started)
+            current = produced
+        return inherit_trace(message, current)
+
+    @staticmethod
+    def _call_stage(stage: Callable, message: Message, loop: asyncio.AbstractEventLoop) -> List[Message]:
+        """
+        Call one stage and normalise its result to a list of messages.
+        """
+        result = stage(message)
+        if inspect.isasyncgen(result):
+            async def collect():
+                return [item async for item in result]
+            result = loop.run_until_complete(collect())
+        elif inspect.isawaitable(result):
+            result = loop.run_until_complete(result)
+
+        if result is None:
+            return []
+        if isinstance(result, Message):
+            return [result]
+        return [item for item in result if item is not None]
+
+    def _next_batch(self) -> Tuple[List[Tuple[int, Message]], bool]:
+        """
+        Collect up to ``batch_size`` messages, waiting at most ``batch_linger`` once the first arrives.
+        Returns the batch and whether the end of the stream was reached.
+        """
+        batch = []
+        while not batch:
+            if self._aborted.is_set():
+                return batch, True
+            try:
+                item = self._outbound.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+
+        deadline = time.monotonic() + self.batch_linger
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._outbound.get(timeout=remaining) if remaining > 0 else self._outbound.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _write(self):
+        finished = False
+        while not finished:
+            batch, finished = self._next_batch()
+            if not batch or self._aborted.is_set():
+                continue
+            self._send(batch)
+
+    def _send(self, batch: List[Tuple[int, Message]]):
+        """
+        Send a batch to the sink, retrying failed messages, and complete the confirmed ones.
+        """
+        pending = batch
+        delay = self.retry_backoff
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            try:
+                results = self.sink.send_batch([message for _, message in pending])
+            except Exception as e:
+                results = [{"error": str(e)}] * len(pending)
+            failed = [
+                (item, result) for item, result in zip(pending, results)
+                if not isinstance(result, dict) or "error" in result
+            ]
+            self._sink_metrics.record(time.monotonic() - started, count=len(pending) - len(failed), error=bool(failed))
+
+            for item, result in zip(pending, results):
+                if isinstance(result, dict) and "error" not in result:
+                    self._tracker.complete(item[0])
+            if not failed:
+                return
+            pending = [item for item, _ in failed]
+            if attempt < self.max_retries:
+                self.logger.warning("Retrying %d messages the sink rejected.", len(pending))
+                time.sleep(delay)
+                delay *= 2
+
+        for (seq, message), (_, result) in zip(pending, failed):
+            if self._fail(message, result):
+                self._tracker.complete(seq)
@@ -0,0 +1,204 @@
+# connectiva/profiling.py
+
+import json
+import time
+import random
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+from connectiva.interfaces import STAGES, CommunicationMethod
+from connectiva.message import Message, unwrap
+
+# Metadata key carrying the W3C trace context (https://www.w3.org/TR/trace-context/)
+TRACEPARENT = "traceparent"
+
+# Spans measured between two stages of a send
+INTERVALS = (
+    ("connectiva", "begin", "pre_serialize"),
+    ("serialize", "pre_serialize", "post_serialize"),
+    ("prepare", "post_serialize", "pre_io"),
+    ("io", "pre_io", "post_io"),
+    ("ack", "post_io", "ack"),
+)
+
+
+def _parse_traceparent(value: Any) -> Optional[List[str]]:
+    if not isinstance(value, str):
+        return None
+    parts = value.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts
+
+
+def child_traceparent(parent: Optional[str] = None) -> str:
+    """
+    Return a traceparent for a new span: a child of ``parent`` when it is a
+    valid traceparent, otherwise the root of a new sampled trace.
+    """
+    span_id = uuid4().hex[:16]
+    parts = _parse_traceparent(parent)
+    if parts is None:
+        return f"00-{uuid4().hex}-{span_id}-01"
+    return f"{parts[0]}-{parts[1]}-{span_id}-{parts[3]}"
+
+
+def trace_id(message: Message) -> Optional[str]:
+    """
+    Return the trace id a message belongs to, for sent and received messages alike.
+    """
+    parts = _parse_traceparent(unwrap(message).metadata.get(TRACEPARENT))
+    return parts[1] if parts else None
+
+
+def inherit_trace(source: Message, outputs: List[Message]) -> List[Message]:
+    """
+    Carry the trace context of a received message over to the messages derived
+    from it, so the next hop continues the same trace.
+    """
+    traceparent = unwrap(source).metadata.get(TRACEPARENT)
+    if traceparent is None:
+        return outputs
+    return [
+        output if TRACEPARENT in output.metadata
+        else Message(action=output.action, data=output.data, metadata=dict(output.metadata, traceparent=traceparent))
+        for output in outputs
+    ]
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+class StageProfiler:
+    """
+    Samples sends and breaks their latency down into stages.
+
+    Attached to a protocol, the profiler listens to its stage hooks and records
+    how long a sampled message spent in Connectiva itself, in serialization,
+    between serialization and I/O, in I/O and waiting for the acknowledgement.
+    Sends slower than ``slow_threshold`` are kept as traces and, when
+    ``trace_file`` is set, appended to it as JSON lines.
+    """
+
+    def __init__(self,
+                 sample_rate: float = 0.01,
+                 slow_threshold: Optional[float] = None,
+                 trace_file: Optional[str] = None,
+                 max_samples: int = 10000,
+                 max_traces: int = 100):
+        """
+        :param sample_rate: Fraction of sends to profile.
+        :param slow_threshold: Seconds after which a send is recorded as a slow trace.
+        :param trace_file: JSON lines file receiving slow traces.
+        :param max_samples: Number of most recent samples kept per stage.
+        :param max_traces: Number of most recent slow traces kept in memory.
+        """
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.trace_file = trace_file
+        self.max_samples = max_samples
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.slow_traces: "deque[Dict[str, Any]]" = deque(maxlen=max_traces)
+        self._samples: Dict[str, "deque[float]"] = {
+            name: deque(maxlen=max_samples) for name in [interval[0] for interval in INTERVALS] + ["total"]
+        }
+        # Timestamps of sends in progress, keyed by message identity; holding the
+        # message keeps its id from being reused while it is tracked
+        self._inflight: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._managed = False
+        self._sampled = 0
+        self._lock = threading.Lock()
+
+    def attach(self, method: CommunicationMethod):
+        """
+        Listen to the stage hooks of a protocol.
+        """
+        for stage in STAGES:
+            method.add_hook(stage, self._record)
+
+    def detach(self, method: CommunicationMethod):
+        for stage in STAGES:
+            method.remove_hook(stage, self._record)
+
+    def begin(self, message: Message):
+        """
+        Mark the moment Connectiva accepted a message, and decide whether to sample it.
+        Without begin() calls, messages are sampled at their first stage.
+        """
+        self._managed = True
+        if random.random() < self.sample_rate:
+            self._track(message, "begin", time.monotonic())
+
+    def _track(self, message: Message, stage: str, timestamp: float):
+        with self._lock:
+            self._inflight[id(message)] = {"message": message, stage: timestamp}
+            self._sampled += 1
+            if len(self._inflight) > self.max_samples:
+                self._inflight.popitem(last=False)  # A send that failed before its ack
+
+    def _record(self, message: Message, stage: str, timestamp: float):
+        with self._lock:
+            entry = self._inflight.get(id(message))
+            if entry is not None:
+                entry[stage] = timestamp
+        if entry is None:
+            if not self._managed and random.random() < self.sample_rate:
+                self._track(message, stage, timestamp)
+            return
+        if stage == "ack":
+            with self._lock:
+                self._inflight.pop(id(message), None)
+            self._finish(message, entry)
+
+    def _finish(self, message: Message, entry: Dict[str, Any]):
+        durations = {}
+        for name, start, end in INTERVALS:
+            if start in entry and end in entry:
+                durations[name] = entry[end] - entry[start]
+        stamps = [value for key, value in entry.items() if key != "message"]
+        durations["total"] = max(stamps) - min(stamps)
+        with self._lock:
+            for name, duration in durations.items():
+                self._samples[name].append(duration)
+        if self.slow_threshold is not None and durations["total"] >= self.slow_threshold:
+            self._trace(message, durations)
+
+    def _trace(self, message: Message, durations: Dict[str, float]):
+        trace = {
+            "time": time.time(),
+            "action": message.action,
+            TRACEPARENT: message.metadata.get(TRACEPARENT),
+            "message_id": message.metadata.get("message_id"),
+            "stages": durations,
+        }
+        self.slow_traces.append(trace)
+        self.logger.warning("Slow send (%.3fs): %s", durations["total"], durations)
+        if self.trace_file:
+            try:
+                with self._lock, open(self.trace_file, "a") as file:
+                    file.write(json.dumps(trace) + "\n")
+            except OSError as e:
+                self.logger.error("Failed to write slow trace: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return the latency distribution of every stage in seconds.
+        """
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items()}
+            stats: Dict[str, Any] = {"sampled": self._sampled, "slow": len(self.slow_traces)}
+        for name, ordered in samples.items():
+            if not ordered:
+                continue
+            stats[name] = {
+                "count": len(ordered),
+                "mean": sum(ordered) / len(ordered),
+                "p50": _percentile(ordered, 0.5),
+                "p90": _percentile(ordered, 0.9),
+                "p99": _percentile(ordered, 0.99),
+                "max": ordered[-1],
+            }
+        return stats
@@ -20,6 +20,7 @@ class ProtocolDetector:
         "wss://": "WebSocket",
         "graphql://": "GraphQL",
         "file://": "File",  
+        "memory://": "Memory",
     }
 
     @staticmethod
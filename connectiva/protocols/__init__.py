@@ -5,6 +5,7 @@ from .kafka_protocol import KafkaProtocol
 from .file_protocol import FileProtocol
 from .websocket_protocol import WebSocketProtocol
 from .graphql_protocol import GraphQLProtocol
+from .memory_protocol import MemoryProtocol
 
 __all__ = [
     "RestProtocol",
@@ -13,5 +14,6 @@ __all__ = [
     "KafkaProtocol",
     "FileProtocol",
     "WebSocketProtocol",
-    "GraphQLProtocol"
+    "GraphQLProtocol",
+    "MemoryProtocol"
 ]
@@ -1,8 +1,101 @@
 import pika
 import json
+import time
 import logging
-from typing import Dict, Any
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, Optional, Union
 from connectiva import CommunicationMethod, Message
+from connectiva.codec import create_codec
+from connectiva.rpc import PendingRequests, stamp_request, reply_address, reply_message, timeout_message
+
+
+class _DirectReplyConsumer:
+    """
+    Shared consumer of RabbitMQ's direct reply-to pseudo-queue.
+
+    It owns a dedicated connection on its own thread. pika connections are not
+    thread-safe, so requests are published from that thread through
+    ``add_callback_threadsafe`` (direct reply-to requires publishing on the consuming channel).
+    """
+
+    REPLY_TO = "amq.rabbitmq.reply-to"
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.pending = PendingRequests()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.connection = None
+        self.channel = None
+        self._error = None
+        self._ready = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="amqp-replies", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        try:
+            self.connection = pika.BlockingConnection(pika.URLParameters(self.endpoint))
+            self.channel = self.connection.channel()
+            self.channel.basic_consume(queue=self.REPLY_TO, on_message_callback=self._on_reply, auto_ack=True)
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        try:
+            while not self._stopping.is_set():
+                self.connection.process_data_events(time_limit=0.1)
+        except Exception as e:
+            self.logger.error("Reply consumer stopped: %s", e)
+            self.pending.fail_all(e)
+        finally:
+            if self.connection.is_open:
+                self.connection.close()
+
+    def _on_reply(self, channel, method, properties, body):
+        correlation_id = properties.correlation_id
+        try:
+            reply = reply_message(json.loads(body), correlation_id)
+        except ValueError as e:
+            # An exception here would stop the consumer, so the caller gets the error instead
+            self.logger.error("Unreadable reply for correlation id %s: %s", correlation_id, e)
+            reply = Message(action="error", data={}, metadata={"error": f"Unreadable reply: {e}", "correlation_id": correlation_id})
+        if not self.pending.resolve(correlation_id, reply):
+            self.logger.debug("Dropping reply for unknown correlation id %s.", correlation_id)
+
+    def publish(self, routing_key: str, body: str, correlation_id: str, timeout: Optional[float] = None):
+        """
+        Publish a request from the consumer thread and wait until it has been handed to pika.
+        Raises TimeoutError when the consumer thread does not get to it within ``timeout`` seconds.
+        """
+        done = Future()
+
+        def publish():
+            try:
+                self.channel.basic_publish(
+                    exchange='',
+                    routing_key=routing_key,
+                    body=body,
+                    properties=pika.BasicProperties(reply_to=self.REPLY_TO, correlation_id=correlation_id)
+                )
+                done.set_result(None)
+            except Exception as e:
+                done.set_exception(e)
+
+        self.connection.add_callback_threadsafe(publish)
+        done.result(timeout)
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def close(self):
+        self._stopping.set()
+        self._thread.join()
+
 
 class AMQPProtocol(CommunicationMethod):
     """
@@ -12,8 +105,13 @@ class AMQPProtocol(CommunicationMethod):
     def __init__(self, **kwargs):
         self.endpoint = kwargs.get("endpoint")
         self.queue_name = kwargs.get("queue_name")
+        self.auto_ack = kwargs.get("auto_ack", True)  # Set False to ack only through ack()
+        self.max_priority = kwargs.get("max_priority")  # Declare a priority queue with priorities 0..max_priority
+        self.codec = create_codec(**kwargs)
         self.connection = None
         self.channel = None
+        self._replies = None
+        self._replies_lock = threading.Lock()
 
         # Set up logger
         self.logger = logging.getLogger(self.__class__.__name__)
@@ -23,16 +121,61 @@ class AMQPProtocol(CommunicationMethod):
         try:
             self.connection = pika.BlockingConnection(pika.URLParameters(self.endpoint))
             self.channel = self.connection.channel()
-            self.channel.queue_declare(queue=self.queue_name)
+            # The broker refuses to redeclare an existing queue with different arguments
+            arguments = {"x-max-priority": self.max_priority} if self.max_priority else None
+            self.channel.queue_declare(queue=self.queue_name, arguments=arguments)
             self.logger.info("Connected to AMQP broker!")
         except Exception as e:
             self.logger.error("Failed to connect to AMQP broker: %s", e)
             raise
 
     def send(self, message: Message) -> Dict[str, Any]:
+        return self._send_encoded(message, self._encode_message(message))
+
+    def _send_encoded(self, message: Message, encoded: Future) -> Dict[str, Any]:
         self.logger.info("Sending message to queue '%s'...", self.queue_name)
         try:
-            self.channel.basic_publish(exchange='', routing_key=self.queue_name, body=json.dumps(message.__dict__))
+            body = encoded.result()
+            self._stage("post_serialize", message)
+            self._stage("pre_io", message)
+            self.channel.basic_publish(
+                exchange='',
+                routing_key=self.queue_name,
+                body=body,
+                properties=self._properties(message)
+            )
+            self._stage("post_io", message)
+            # Without publisher confirms the broker acknowledges nothing, so the publish is the ack
+            self._stage("ack", message)
+            self.logger.info("Message sent successfully!")
+            return {"status": "sent"}
+        except Exception as e:
+            self.logger.error("Failed to send message: %s", e)
+            return {"error": str(e)}
+
+    def _properties(self, message: Message) -> Optional[pika.BasicProperties]:
+        """
+        Carry ``metadata["priority"]`` as the AMQP message priority on priority queues.
+        """
+        priority = self._priority(message.metadata.get("priority"))
+        return pika.BasicProperties(priority=priority) if priority is not None else None
+
+    def _priority(self, priority: Any) -> Optional[int]:
+        if not self.max_priority or priority is None:
+            return None
+        return min(max(int(priority), 0), self.max_priority)
+
+    def send_raw(self, body: Union[bytes, memoryview], headers: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Publish an encoded body as is, with ``headers`` as AMQP message headers.
+        A ``priority`` header also sets the message priority on priority queues.
+        """
+        self.logger.info("Sending raw message to queue '%s'...", self.queue_name)
+        try:
+            properties = None
+            if headers:
+                properties = pika.BasicProperties(headers=headers, priority=self._priority(headers.get("priority")))
+            self.channel.basic_publish(exchange='', routing_key=self.queue_name, body=body, properties=properties)
             self.logger.info("Message sent successfully!")
             return {"status": "sent"}
         except Exception as e:
@@ -40,6 +183,15 @@ class AMQPProtocol(CommunicationMethod):
             return {"error": str(e)}
 
     def receive(self) -> Message:
+        return self._receive(decode=True)
+
+    def receive_raw(self) -> Message:
+        """
+        Receive the next message with its body as undecoded bytes.
+        """
+        return self._receive(decode=False)
+
+    def _receive(self, decode: bool) -> Message:
         self.logger.info("Receiving message from queue '%s'...", self.queue_name)
         try:
             # Use basic_get to receive a message
@@ -47,10 +199,18 @@ class AMQPProtocol(CommunicationMethod):
             
             # Check if a message was received
             if method_frame:
-                self.channel.basic_ack(method_frame.delivery_tag)
+                if self.auto_ack:
+                    self.channel.basic_ack(method_frame.delivery_tag)
                 self.logger.info("Message received successfully!")
-                message_data = json.loads(body)
-                return Message(action="receive", data=message_data)
+                message_data = self._decode_body(body) if decode else body
+                metadata = {"delivery_tag": method_frame.delivery_tag}
+                if header_frame.headers:
+                    metadata["headers"] = header_frame.headers
+                if header_frame.reply_to:
+                    metadata["reply_to"] = header_frame.reply_to
+                if header_frame.correlation_id:
+                    metadata["correlation_id"] = header_frame.correlation_id
+                return Message(action="receive", data=message_data, metadata=metadata)
             else:
                 # Return an error message if no message was found
                 self.logger.warning("No message received.")
@@ -59,8 +219,74 @@ class AMQPProtocol(CommunicationMethod):
             self.logger.error("Failed to receive message: %s", e)
             return Message(action="error", data={}, metadata={"error": str(e)})
 
+    def request(self, message: Message, timeout: float = 10.0) -> Message:
+        """
+        Send a request to the queue and wait for its reply. Replies arrive through
+        direct reply-to on one shared consumer, so concurrent requests share a connection.
+
+        :param message: The request message.
+        :param timeout: Seconds to wait for the reply.
+        :return: The reply message, or an error message on timeout.
+        """
+        with self._replies_lock:
+            if self._replies is not None and not self._replies.is_alive():
+                # The consumer stopped on an error and failed its waiting requests; start over
+                self._replies = None
+            if self._replies is None:
+                self._replies = _DirectReplyConsumer(self.endpoint)
+            replies = self._replies
+        correlation_id, future = replies.pending.create()
+        request = stamp_request(message, correlation_id, _DirectReplyConsumer.REPLY_TO)
+        self.logger.info("Sending request %s to queue '%s'...", correlation_id, self.queue_name)
+        deadline = time.monotonic() + timeout
+        try:
+            replies.publish(self.queue_name, json.dumps(request.__dict__), correlation_id, timeout)
+            return future.result(timeout=max(deadline - time.monotonic(), 0.0))
+        except FutureTimeoutError:
+            replies.pending.discard(correlation_id)
+            self.logger.warning("Request %s timed out.", correlation_id)
+            return timeout_message(timeout)
+        except Exception as e:
+            replies.pending.discard(correlation_id)
+            self.logger.error("Request failed: %s", e)
+            return Message(action="error", data={}, metadata={"error": str(e)})
+
+    def reply(self, request: Message, response: Message) -> Dict[str, Any]:
+        """
+        Send the response to a request received through receive().
+        """
+        reply_to, correlation_id = reply_address(request)
+        if reply_to is None:
+            return {"error": "Message has no reply address"}
+        self.logger.info("Replying to request %s...", correlation_id)
+        try:
+            body = dict(response.__dict__, metadata=dict(response.metadata, correlation_id=correlation_id))
+            self.channel.basic_publish(
+                exchange='',
+                routing_key=reply_to,
+                body=json.dumps(body),
+                properties=pika.BasicProperties(correlation_id=correlation_id)
+            )
+            return {"status": "sent"}
+        except Exception as e:
+            self.logger.error("Failed to send reply: %s", e)
+            return {"error": str(e)}
+
+    def ack(self, message: Message):
+        """
+        Acknowledge a message received with auto_ack disabled.
+        """
+        delivery_tag = message.metadata.get("delivery_tag")
+        if self.auto_ack or delivery_tag is None:
+            return
+        self.logger.debug("Acknowledging delivery tag %s...", delivery_tag)
+        self.channel.basic_ack(delivery_tag)
+
     def disconnect(self):
         self.logger.info("Disconnecting from AMQP broker...")
+        if self._replies is not None:
+            self._replies.close()
+            self._replies = None
         if self.connection:
             self.connection.close()
             self.logger.info("Disconnected from AMQP broker.")
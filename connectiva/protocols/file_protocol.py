@@ -1,36 +1,142 @@
 import os
-import json
+import time
+import zlib
 import fcntl
 import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
 from uuid import uuid4
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Union
 from connectiva import CommunicationMethod, Message
+from connectiva.codec import create_codec
 
 
 class FileProtocol(CommunicationMethod):
     """
     File sharing communication class with atomic file naming and processing.
+
+    Message files are named after their send time, so sorting names gives the
+    send order without stat calls. With ``shards`` set, files are spread over
+    hash-named subdirectories so no single directory grows too large. Consumed
+    files are renamed with ``processed_prefix``, or moved to
+    ``processed_directory``, and a retention policy deletes old processed files
+    in the background.
+
+    With ``priority_lanes`` set, ``metadata["priority"]`` selects a lane (higher
+    is more urgent) that is encoded in the file name. Lanes with pending files
+    are drained by smooth weighted round-robin over ``lane_weights``, so urgent
+    messages overtake bulk backlogs without starving them.
+
+    Several consumer processes can share a spool by giving each a ``consumer_id``.
+    Consumers then claim files by renaming them into their own inflight
+    directory, which is atomic, so no locking is needed and a file lost to
+    another consumer is simply skipped. With ``consumers`` and ``consumer_index``
+    each consumer only scans the shards it owns. A claim is a lease: files left
+    in an inflight directory for longer than ``lease_timeout`` (e.g. by a
+    crashed consumer) are moved back to the spool and delivered again.
     """
 
     def __init__(self, **kwargs):
         self.directory = kwargs.get("directory", ".")
         self.prefix = kwargs.get("prefix", "msg_")
         self.processed_prefix = kwargs.get("processed_prefix", "processed_")  # Fixed parameter name
+        self.processed_directory = kwargs.get("processed_directory")  # Move consumed files here instead of renaming in place
+        self.shards = kwargs.get("shards", 0)  # Number of subdirectories to spread files over; 0 keeps a flat directory
+        self.retention_age = kwargs.get("retention_age")  # Seconds processed files are kept
+        self.retention_count = kwargs.get("retention_count")  # Maximum number of processed files kept
+        self.retention_bytes = kwargs.get("retention_bytes")  # Maximum total size of processed files
+        self.compaction_interval = kwargs.get("compaction_interval", 60.0)  # Seconds between background compactions
+        self.consumer_id = kwargs.get("consumer_id")  # Enables lease-based claiming for multiple consumers
+        self.consumers = kwargs.get("consumers")  # Number of consumers splitting the shards between them
+        self.consumer_index = kwargs.get("consumer_index", 0)  # This consumer's position among them
+        self.inflight_directory = kwargs.get("inflight_directory") or os.path.join(self.directory, ".inflight")
+        self.lease_timeout = kwargs.get("lease_timeout", 60.0)  # Seconds before another consumer may take over a claim
+        self.claim_batch = kwargs.get("claim_batch", 1)  # Files claimed per directory scan
+        self.auto_ack = kwargs.get("auto_ack", True)  # Set False to keep claims until ack()
+        self.priority_lanes = kwargs.get("priority_lanes", 0)  # Number of priority lanes; 0 disables priorities
+        # Share of receives each lane gets while all lanes have messages; higher lanes get more by default
+        self.lane_weights = kwargs.get("lane_weights") or [2 ** lane for lane in range(self.priority_lanes)]
+        if len(self.lane_weights) != self.priority_lanes:
+            raise ValueError(f"Expected {self.priority_lanes} lane weights, got {len(self.lane_weights)}")
+        self.codec = create_codec(**kwargs)
         self.logger = logging.getLogger(self.__class__.__name__)
+        self._cursor = 0
+        self._claimed = deque()  # Inflight files claimed but not yet returned by receive()
+        self._last_recovery = 0.0
+        self._lane_credit = [0] * self.priority_lanes
+        self._lane_lock = threading.Lock()  # Receives may scan from several threads
+        self._compactor = None
+        self._stopping = threading.Event()
 
-        # Ensure the directory exists
-        if not os.path.exists(self.directory):
-            os.makedirs(self.directory)
-            self.logger.debug(f"Directory {self.directory} created.")
+        # Ensure the directories exist
+        for directory in self._shard_directories(self.directory) + self._shard_directories(self.processed_directory):
+            if not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+                self.logger.debug(f"Directory {directory} created.")
+        if self.consumer_id is not None:
+            os.makedirs(self._inflight_path(), exist_ok=True)
+
+    def _shard_name(self, index: int) -> str:
+        return f"{index:0{len(f'{self.shards - 1:x}')}x}"
+
+    def _shard_directories(self, root: Optional[str]) -> List[str]:
+        """
+        Return the directories holding message files under a root directory.
+        """
+        if root is None:
+            return []
+        if not self.shards:
+            return [root]
+        return [os.path.join(root, self._shard_name(index)) for index in range(self.shards)]
+
+    def _has_retention(self) -> bool:
+        return any(limit is not None for limit in (self.retention_age, self.retention_count, self.retention_bytes))
+
+    def _inflight_path(self, filename: str = "") -> str:
+        return os.path.join(self.inflight_directory, str(self.consumer_id), filename)
+
+    def _owned_directories(self) -> List[str]:
+        """
+        Return the spool directories this consumer reads from.
+        """
+        directories = self._shard_directories(self.directory)
+        if self.consumer_id is None or not self.consumers or not self.shards:
+            return directories
+        return [d for index, d in enumerate(directories) if index % self.consumers == self.consumer_index]
 
     def connect(self):
         self.logger.info(f"Accessing directory at {self.directory}...")
+        if self.consumer_id is not None:
+            self.recover()
+        if self._has_retention() and self._compactor is None:
+            self._stopping.clear()
+            self._compactor = threading.Thread(target=self._compact_periodically, name="file-compactor", daemon=True)
+            self._compactor.start()
+
+    def _lane(self, message: Message) -> int:
+        try:
+            priority = int(message.metadata.get("priority") or 0)
+        except (TypeError, ValueError):
+            priority = 0
+        return min(max(priority, 0), self.priority_lanes - 1)
+
+    def _generate_filename(self, lane: Optional[int] = None) -> str:
+        """
+        Generate a unique filename for each message, sortable by send time within its priority lane.
+        """
+        if lane is None:
+            return f"{self.prefix}{time.time_ns():020d}_{uuid4().hex}.json"
+        return f"{self.prefix}p{lane}_{time.time_ns():020d}_{uuid4().hex}.json"
 
-    def _generate_filename(self) -> str:
+    def _file_directory(self, filename: str) -> str:
         """
-        Generate a unique filename for each message.
+        Return the directory a new message file goes to, hashing its name onto a shard.
         """
-        return f"{self.prefix}{uuid4().hex}.json"
+        if not self.shards:
+            return self.directory
+        shard = zlib.crc32(filename.encode()) % self.shards
+        return os.path.join(self.directory, self._shard_name(shard))
 
     def _lock_file(self, file):
         """
@@ -63,67 +169,341 @@ class FileProtocol(CommunicationMethod):
         :param message: Message object containing data to be written.
         :return: Dictionary indicating the status of the file operation.
         """
-        filename = self._generate_filename()
-        file_path = os.path.join(self.directory, filename)
+        return self._send_encoded(message, self._encode_message(message))
+
+    def _send_encoded(self, message: Message, encoded: Future) -> Dict[str, Any]:
+        filename = self._generate_filename(self._lane(message) if self.priority_lanes else None)
+        file_path = os.path.join(self._file_directory(filename), filename)
         self.logger.info(f"Writing message to file {file_path}...")
 
+        # Write under a hidden name first so consumers never see a partially written file
+        temporary_path = os.path.join(os.path.dirname(file_path), f".{filename}.tmp")
+        try:
+            content = encoded.result()
+            self._stage("post_serialize", message)
+            self._stage("pre_io", message)
+            with open(temporary_path, 'wb') as file:
+                self._lock_file(file)
+                file.write(content)
+                self._unlock_file(file)
+            self._stage("post_io", message)
+            os.rename(temporary_path, file_path)
+            self._stage("ack", message)  # Visible to consumers from here on
+            self.logger.info("Message written successfully!")
+            return {"status": "file_written", "file_path": file_path}
+        except Exception as e:
+            self.logger.error(f"Failed to write message: {e}")
+            return {"error": str(e)}
+
+    def send_raw(self, body: Union[bytes, memoryview], headers: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Write an encoded body to a uniquely named file as is. Files have no room
+        for headers, so ``headers`` are not stored, except that a ``priority``
+        header selects the priority lane.
+
+        :param body: The encoded message.
+        :param headers: Headers of the message.
+        :return: Dictionary indicating the status of the file operation.
+        """
+        headers = headers or {}
+        lane = self._lane(Message(action="raw", data=None, metadata=headers)) if self.priority_lanes else None
+        filename = self._generate_filename(lane)
+        file_path = os.path.join(self._file_directory(filename), filename)
+        self.logger.info(f"Writing raw message to file {file_path}...")
+        temporary_path = os.path.join(os.path.dirname(file_path), f".{filename}.tmp")
         try:
-            with open(file_path, 'w') as file:
+            with open(temporary_path, 'wb') as file:
                 self._lock_file(file)
-                json.dump(message.__dict__, file)
+                file.write(body)
                 self._unlock_file(file)
+            os.rename(temporary_path, file_path)
             self.logger.info("Message written successfully!")
             return {"status": "file_written", "file_path": file_path}
         except Exception as e:
             self.logger.error(f"Failed to write message: {e}")
             return {"error": str(e)}
 
+    def _pending(self, directory: str) -> List[str]:
+        """
+        List the unprocessed message files of a directory, oldest first.
+        """
+        with os.scandir(directory) as entries:
+            names = sorted(entry.name for entry in entries if entry.name.startswith(self.prefix) and entry.is_file())
+        if not self.priority_lanes:
+            return names
+
+        lanes = [[] for _ in range(self.priority_lanes)]
+        for name in names:
+            lanes[self._lane_of(name)].append(name)
+        pending = [lane for lane in range(self.priority_lanes) if lanes[lane]]
+        if not pending:
+            return []
+        # Smooth weighted round-robin between the lanes that have files
+        with self._lane_lock:
+            for lane in pending:
+                self._lane_credit[lane] += self.lane_weights[lane]
+            chosen = max(pending, key=lambda lane: self._lane_credit[lane])
+            self._lane_credit[chosen] -= sum(self.lane_weights[lane] for lane in pending)
+        return lanes[chosen] + [name for lane in reversed(pending) if lane != chosen for name in lanes[lane]]
+
+    def _lane_of(self, filename: str) -> int:
+        """
+        Return the priority lane encoded in a file name; files without one belong to the lowest lane.
+        """
+        rest = filename[len(self.prefix):]
+        if rest.startswith("p"):
+            lane = rest[1:rest.find("_")]
+            if lane.isdigit():
+                return min(int(lane), self.priority_lanes - 1)
+        return 0
+
+    def _processed_path(self, directory: str, filename: str) -> str:
+        """
+        Return where a consumed file goes: the processed directory (same shard), or a renamed file in place.
+        """
+        if self.processed_directory is None:
+            return os.path.join(directory, self.processed_prefix + filename)
+        shard = os.path.relpath(directory, self.directory)
+        return os.path.normpath(os.path.join(self.processed_directory, shard, filename))
+
+    def _rotated(self, directories: List[str]) -> List[str]:
+        """
+        Return the directories starting from the next one in turn, so shards are drained fairly.
+        """
+        start = self._cursor % len(directories)
+        self._cursor = (start + 1) % len(directories)
+        return directories[start:] + directories[:start]
+
     def receive(self) -> Message:
         """
         Read and process the oldest unprocessed message file.
+        With shards, the shards are visited in turn and the oldest file of the first non-empty one is read.
 
         :return: Message object containing data read from the file.
         """
+        return self._receive(decode=True)
+
+    def receive_raw(self) -> Message:
+        """
+        Read the oldest unprocessed message file without decoding it.
+
+        :return: Message whose data is the file content as bytes.
+        """
+        return self._receive(decode=False)
+
+    def _message(self, content: bytes, decode: bool) -> Message:
+        if decode:
+            return Message(**self._decode_body(content))
+        return Message(action="receive", data=content, metadata={})
+
+    def _receive(self, decode: bool) -> Message:
         self.logger.info(f"Scanning directory {self.directory} for messages...")
-        files = sorted(
-            [f for f in os.listdir(self.directory) if f.startswith(self.prefix)],
-            key=lambda f: os.path.getctime(os.path.join(self.directory, f))
-        )
+        if self.consumer_id is not None:
+            return self._receive_claimed(decode)
 
-        if not files:
-            self.logger.info("No new messages found.")
-            return Message(action="error", data={}, metadata={"error": "No message found"})
+        error = None
+        for directory in self._rotated(self._shard_directories(self.directory)):
+            for filename in self._pending(directory):
+                file_path = os.path.join(directory, filename)
+                new_file_path = self._processed_path(directory, filename)
 
-        for filename in files:
-            file_path = os.path.join(self.directory, filename)
-            new_file_path = os.path.join(self.directory, self.processed_prefix + filename)
+                try:
+                    # Lock the file and rename it to indicate processing
+                    with open(file_path, 'rb+') as file:
+                        self._lock_file(file)
 
-            try:
-                # Lock the file and rename it to indicate processing
-                with open(file_path, 'r+') as file:
-                    self._lock_file(file)
+                        # Check if the file has already been processed
+                        if filename.startswith(self.processed_prefix):
+                            self._unlock_file(file)
+                            continue
 
-                    # Check if the file has already been processed
-                    if filename.startswith(self.processed_prefix):
+                        os.rename(file_path, new_file_path)
+                        self.logger.info(f"Renamed file to {new_file_path} for processing.")
+
+                        # Read the message
+                        file.seek(0)  # Reset file pointer to the beginning
+                        message = self._message(file.read(), decode)
                         self._unlock_file(file)
+                        self.logger.info("Message read successfully!")
+                        return message
+
+                except FileNotFoundError:
+                    continue  # Taken by another consumer
+                except Exception as e:
+                    # Move on to the next file instead of stalling on this one
+                    self.logger.error(f"Failed to read message {file_path}: {e}")
+                    error = str(e)
+
+        if error is not None:
+            return Message(action="error", data={}, metadata={"error": error})
+        self.logger.info("No new messages found.")
+        return Message(action="error", data={}, metadata={"error": "No message found"})
+
+    def _claim(self, limit: int) -> int:
+        """
+        Claim up to ``limit`` of the oldest files of the owned directories by
+        moving them into this consumer's inflight directory.
+
+        :return: The number of files claimed.
+        """
+        claimed = 0
+        for directory in self._rotated(self._owned_directories()):
+            for filename in self._pending(directory):
+                source = os.path.join(directory, filename)
+                target = self._inflight_path(filename)
+                try:
+                    os.utime(source)  # Start the lease before the file becomes visible as inflight
+                    os.rename(source, target)
+                except FileNotFoundError:
+                    continue  # Claimed by another consumer first
+                self._claimed.append(target)
+                claimed += 1
+                if claimed >= limit:
+                    return claimed
+            if claimed:
+                return claimed
+        return claimed
+
+    def _receive_claimed(self, decode: bool = True) -> Message:
+        if time.monotonic() - self._last_recovery > self.lease_timeout / 2:
+            self.recover()
+        while True:
+            if not self._claimed and not self._claim(self.claim_batch):
+                self.logger.info("No new messages found.")
+                return Message(action="error", data={}, metadata={"error": "No message found"})
+            path = self._claimed.popleft()
+            try:
+                with open(path, 'rb') as file:
+                    message = self._message(file.read(), decode)
+            except FileNotFoundError:
+                continue  # The lease expired and the file was recovered by another consumer
+            except (ValueError, zlib.error) as e:
+                self.logger.error(f"Skipping unreadable message {path}: {e}")
+                self._settle(path)
+                continue
+            if self.auto_ack:
+                self._settle(path)
+            else:
+                message.metadata["claim"] = path
+            self.logger.info("Message claimed successfully!")
+            return message
+
+    def _settle(self, path: str):
+        """
+        Move a claimed file to where processed files go.
+        """
+        filename = os.path.basename(path)
+        try:
+            os.rename(path, self._processed_path(self._file_directory(filename), filename))
+        except FileNotFoundError:
+            self.logger.warning(f"Claim on {filename} was lost before it was acknowledged.")
+
+    def ack(self, message: Message):
+        """
+        Release the claim on a message received with auto_ack disabled.
+        """
+        path = message.metadata.get("claim")
+        if path:
+            self._settle(path)
+
+    def renew(self, message: Message):
+        """
+        Extend the lease on a message that takes long to process.
+        """
+        path = message.metadata.get("claim")
+        if path:
+            os.utime(path)
+
+    def recover(self) -> int:
+        """
+        Move files whose lease expired, from the inflight directory of any
+        consumer, back to the spool.
+
+        :return: The number of files recovered.
+        """
+        self._last_recovery = time.monotonic()
+        if not os.path.isdir(self.inflight_directory):
+            return 0
+        recovered = 0
+        now = time.time()
+        with os.scandir(self.inflight_directory) as consumers:
+            directories = [consumer.path for consumer in consumers if consumer.is_dir()]
+        for directory in directories:
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                continue  # Removed by its consumer in the meantime
+            for entry in entries:
+                try:
+                    if not entry.is_file() or now - entry.stat().st_mtime <= self.lease_timeout:
                         continue
+                    os.rename(entry.path, os.path.join(self._file_directory(entry.name), entry.name))
+                except FileNotFoundError:
+                    continue
+                recovered += 1
+        if recovered:
+            self.logger.warning(f"Recovered {recovered} messages with expired leases.")
+        return recovered
 
-                    os.rename(file_path, new_file_path)
-                    self.logger.info(f"Renamed file to {new_file_path} for processing.")
+    def _processed_files(self) -> List[tuple]:
+        """
+        Return ``(mtime, size, path)`` of every processed file, oldest first.
+        """
+        if self.processed_directory is not None:
+            directories, matches = self._shard_directories(self.processed_directory), lambda name: True
+        else:
+            directories, matches = self._shard_directories(self.directory), lambda name: name.startswith(self.processed_prefix)
+        files = []
+        for directory in directories:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if matches(entry.name) and entry.is_file():
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+        return files
 
-                    # Read the message
-                    file.seek(0)  # Reset file pointer to the beginning
-                    data = json.load(file)
-                    self._unlock_file(file)
-                    self.logger.info("Message read successfully!")
-                    return Message(**data)
+    def compact(self) -> Dict[str, Any]:
+        """
+        Delete processed files beyond the retention policy: older than
+        ``retention_age``, and the oldest ones beyond ``retention_count`` or ``retention_bytes``.
 
-            except Exception as e:
-                self.logger.error(f"Failed to read message: {e}")
-                return Message(action="error", data={}, metadata={"error": str(e)})
+        :return: The number of files deleted and the bytes freed.
+        """
+        files = self._processed_files()
+        total = sum(size for _, size, _ in files)
+        now = time.time()
+        deleted = 0
+        freed = 0
+        for mtime, size, path in files:
+            expired = self.retention_age is not None and now - mtime > self.retention_age
+            over_count = self.retention_count is not None and len(files) - deleted > self.retention_count
+            over_bytes = self.retention_bytes is not None and total - freed > self.retention_bytes
+            if not (expired or over_count or over_bytes):
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            deleted += 1
+            freed += size
+        if deleted:
+            self.logger.info(f"Compaction deleted {deleted} processed files ({freed} bytes).")
+        return {"deleted": deleted, "freed": freed}
 
-        return Message(action="error", data={}, metadata={"error": "No message found"})
+    def _compact_periodically(self):
+        while not self._stopping.wait(self.compaction_interval):
+            try:
+                self.compact()
+            except OSError as e:
+                self.logger.error(f"Compaction failed: {e}")
 
     def disconnect(self):
         self.logger.info("Closing directory access...")
-
+        if self._compactor is not None:
+            self._stopping.set()
+            self._compactor.join()
+            self._compactor = None
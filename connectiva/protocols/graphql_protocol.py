@@ -1,7 +1,97 @@
+import json
+import time
+import queue
+import hashlib
+import logging
+import threading
 import requests
-from typing import Dict, Any
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
 from ..interfaces import CommunicationMethod
 from ..message import Message
+from ..response_cache import create_response_cache
+from ..rate_limit import create_rate_limiter
+from .graphql_subscriptions import Subscription, SubscriptionClient
+
+
+@lru_cache(maxsize=1024)
+def _query_hash(query: str) -> str:
+    """
+    Return the sha256 hex digest used to identify a persisted query.
+    """
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+class _OperationBatcher:
+    """
+    Collects operations sent within a short window and posts them as a single array request.
+    """
+
+    def __init__(self, execute, interval: float, max_batch_size: int):
+        self.execute = execute
+        self.interval = interval
+        self.max_batch_size = max_batch_size
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="graphql-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, payload: Dict[str, Any]) -> Future:
+        """
+        Queue an operation and return a future resolving to its result.
+        """
+        future = Future()
+        self._queue.put((payload, future))
+        return future
+
+    def close(self):
+        """
+        Flush pending operations and stop the worker thread.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        """
+        Gather operations until the window elapses or the batch is full, then flush them.
+        """
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+    def _flush(self, batch):
+        """
+        Execute a batch and resolve each caller's future with its own result.
+        """
+        self.logger.debug("Posting batch of %d GraphQL operations.", len(batch))
+        try:
+            results = list(self.execute([payload for payload, _ in batch]))
+        except Exception as e:
+            results = [{"error": str(e)} for _ in batch]
+        if len(results) < len(batch):
+            self.logger.error("Got %d results for %d batched operations.", len(results), len(batch))
+            results += [{"error": "No result for operation"} for _ in range(len(batch) - len(results))]
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
 
 class GraphQLProtocol(CommunicationMethod):
     """
@@ -10,24 +100,286 @@ class GraphQLProtocol(CommunicationMethod):
 
     def __init__(self, **kwargs):
         self.graphql_url = kwargs.get("graphql_url")
+        self.cache = create_response_cache(**kwargs)
+        self.limiter = create_rate_limiter(self.graphql_url, **kwargs)
+        self.persisted_queries = kwargs.get("persisted_queries", False)
+        self.batch_interval = kwargs.get("batch_interval", 0)  # Seconds to wait for more operations; 0 disables batching
+        self.max_batch_size = kwargs.get("max_batch_size", 10)
+        self.subscription_url = kwargs.get("subscription_url") or self._default_subscription_url(self.graphql_url)
+        self.connection_params = kwargs.get("connection_params")
+        self.receive_timeout = kwargs.get("receive_timeout", 5.0)  # Seconds receive() waits for a subscription result
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._batcher = None
+        self._batcher_lock = threading.Lock()
+        self._subscription_client = None
+        self._subscription_lock = threading.Lock()
+        self._subscription_results: "queue.Queue" = queue.Queue()
+
+    @staticmethod
+    def _default_subscription_url(graphql_url: Optional[str]) -> Optional[str]:
+        """
+        Derive the WebSocket URL for subscriptions from the HTTP endpoint.
+        """
+        if not graphql_url:
+            return None
+        if graphql_url.startswith("https://"):
+            return "wss://" + graphql_url[len("https://"):]
+        if graphql_url.startswith("http://"):
+            return "ws://" + graphql_url[len("http://"):]
+        return graphql_url
+
+    @staticmethod
+    def _is_mutation(message: Message) -> bool:
+        """
+        Check whether the message carries a mutation, which must never be served from cache.
+        """
+        if message.action == "mutation":
+            return True
+        return GraphQLProtocol._has_mutation(message.data)
+
+    @staticmethod
+    def _has_mutation(payload: Any) -> bool:
+        """
+        Check whether an operation, or any operation of a batch, is a mutation.
+        """
+        if isinstance(payload, list):
+            return any(GraphQLProtocol._has_mutation(operation) for operation in payload)
+        query = payload.get("query", "") if isinstance(payload, dict) else ""
+        return isinstance(query, str) and query.lstrip().startswith("mutation")
+
+    @staticmethod
+    def _is_subscription(message: Message) -> bool:
+        """
+        Check whether the message carries a subscription operation.
+        """
+        if message.action == "subscribe":
+            return True
+        query = message.data.get("query", "") if isinstance(message.data, dict) else ""
+        return isinstance(query, str) and query.lstrip().startswith("subscription")
+
+    @staticmethod
+    def _operation(message: Message) -> Dict[str, Any]:
+        """
+        Build the request body for a message. Messages whose data is a GraphQL operation
+        (a dict with a ``query``) are posted as a standard GraphQL request; anything else
+        is posted as the whole message.
+        """
+        if isinstance(message.data, dict) and "query" in message.data:
+            return {
+                key: message.data[key]
+                for key in ("query", "variables", "operationName", "extensions")
+                if key in message.data
+            }
+        return message.__dict__
+
+    def _persisted(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Replace the query text with its sha256 hash (Automatic Persisted Queries).
+        """
+        if not self.persisted_queries or not isinstance(payload.get("query"), str):
+            return payload
+        persisted = {key: value for key, value in payload.items() if key != "query"}
+        extensions = dict(persisted.get("extensions") or {})
+        extensions["persistedQuery"] = {"version": 1, "sha256Hash": _query_hash(payload["query"])}
+        persisted["extensions"] = extensions
+        return persisted
+
+    def _registering(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Return the full-text payload carrying the persisted query extension, so the server registers the hash.
+        """
+        registering = dict(self._persisted(payload))
+        registering["query"] = payload["query"]
+        return registering
+
+    @staticmethod
+    def _is_persisted_query_not_found(result: Any) -> bool:
+        """
+        Check whether a result reports that the server does not know the query hash.
+        """
+        if not isinstance(result, dict):
+            return False
+        for error in result.get("errors") or []:
+            if not isinstance(error, dict):
+                continue
+            code = (error.get("extensions") or {}).get("code")
+            if error.get("message") == "PersistedQueryNotFound" or code == "PERSISTED_QUERY_NOT_FOUND":
+                return True
+        return False
 
     def connect(self):
         print(f"Connecting to GraphQL endpoint at {self.graphql_url}...")
 
+    def _http_post(self, payload: Any, headers: Dict[str, str], idempotent: bool = True) -> requests.Response:
+        """
+        POST a payload, through the rate limiter when one is configured.
+        Mutations are not idempotent, so the limiter does not retry them after a 503.
+        """
+        if self.limiter is None:
+            return requests.post(self.graphql_url, json=payload, headers=headers)
+        return self.limiter.call(
+            lambda: requests.post(self.graphql_url, json=payload, headers=headers),
+            idempotent=idempotent
+        )
+
+    def _post(self, payload: Any, headers: Dict[str, str], idempotent: Optional[bool] = None) -> requests.Response:
+        """
+        POST a payload to the GraphQL endpoint, passing 304 Not Modified responses through.
+        """
+        if idempotent is None:
+            idempotent = not self._has_mutation(payload)
+        response = self._http_post(payload, headers, idempotent)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    def _post_operation(self, payload: Dict[str, Any], headers: Dict[str, str]) -> requests.Response:
+        """
+        POST a single operation, retrying with the full query text when the server
+        does not know the persisted query hash.
+        """
+        persisted = self._persisted(payload)
+        if persisted is payload:
+            return self._post(payload, headers)
+
+        # Servers answer an unknown hash with either 200 or 400 and a PersistedQueryNotFound error
+        response = self._http_post(persisted, headers, not self._has_mutation(payload))
+        if response.status_code in (200, 400) and self._is_persisted_query_not_found(self._json_or_none(response)):
+            self.logger.debug("Persisted query not found, sending full query text.")
+            return self._post(self._registering(payload), headers)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    @staticmethod
+    def _json_or_none(response: requests.Response) -> Any:
+        """
+        Decode a response body, returning None when it is not JSON.
+        """
+        try:
+            return response.json()
+        except ValueError:
+            return None
+
+    def _post_batch(self, payloads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        POST several operations as one array request and demultiplex the results.
+        Operations whose persisted hash is unknown are resent together with their full text.
+        """
+        idempotent = not self._has_mutation(payloads)
+        results = self._post([self._persisted(payload) for payload in payloads], {}, idempotent).json()
+        if not isinstance(results, list) or len(results) != len(payloads):
+            raise requests.RequestException("Batched response does not match the number of operations")
+
+        missing = [i for i, result in enumerate(results) if self._is_persisted_query_not_found(result)]
+        if missing and self.persisted_queries:
+            self.logger.debug("Resending %d operations with unknown persisted queries.", len(missing))
+            retried = self._post([self._registering(payloads[i]) for i in missing], {}).json()
+            if not isinstance(retried, list) or len(retried) != len(missing):
+                raise requests.RequestException("Batched response does not match the number of operations")
+            for i, result in zip(missing, retried):
+                results[i] = result
+        return results
+
+    def _get_batcher(self) -> _OperationBatcher:
+        """
+        Start the batcher on first use.
+        """
+        with self._batcher_lock:
+            if self._batcher is None:
+                self._batcher = _OperationBatcher(self._post_batch, self.batch_interval, self.max_batch_size)
+            return self._batcher
+
     def send(self, message: Message) -> Dict[str, Any]:
         print("Sending GraphQL query...")
+        self._stage("pre_serialize", message)
+        payload = self._operation(message)
+        self._stage("post_serialize", message)
+        if self._is_subscription(message):
+            try:
+                self._stage("pre_io", message)
+                subscription = self.subscribe(message, results=self._subscription_results)
+                self._stage("post_io", message)
+                self._stage("ack", message)  # The server accepted the subscription
+                print(f"Subscription {subscription.id} started!")
+                return {"status": "subscribed", "subscription_id": subscription.id}
+            except Exception as e:
+                print(f"Failed to start subscription: {e}")
+                return {"error": str(e)}
         try:
-            response = requests.post(self.graphql_url, json=message.__dict__)
-            response.raise_for_status()
+            self._stage("pre_io", message)
+            if self.cache is not None and not self._is_mutation(message):
+                key = ("POST", self.graphql_url, json.dumps(payload, sort_keys=True, default=str))
+                result = self.cache.fetch(key, lambda headers: self._post_operation(payload, headers))
+            elif self.batch_interval:
+                result = self._get_batcher().submit(payload).result()
+            else:
+                result = self._post_operation(payload, {}).json()
+            self._stage("post_io", message)
+            self._stage("ack", message)
             print("Query sent successfully!")
-            return response.json()
+            return result
         except requests.RequestException as e:
             print(f"Failed to send query: {e}")
             return {"error": str(e)}
 
+    def send_batch(self, messages: List[Message]) -> List[Dict[str, Any]]:
+        """
+        Send several operations as array POSTs of at most ``max_batch_size`` operations.
+
+        :param messages: The messages to send.
+        :return: One result per message, in the same order.
+        """
+        print(f"Sending batch of {len(messages)} GraphQL queries...")
+        payloads = [self._operation(message) for message in messages]
+        results = []
+        for start in range(0, len(payloads), self.max_batch_size):
+            chunk = payloads[start:start + self.max_batch_size]
+            try:
+                results.extend(self._post_batch(chunk))
+            except requests.RequestException as e:
+                print(f"Failed to send batch: {e}")
+                results.extend({"error": str(e)} for _ in chunk)
+        return results
+
+    def subscribe(self, message: Message, results: Optional["queue.Queue"] = None) -> Subscription:
+        """
+        Start a subscription over the shared ``graphql-transport-ws`` socket,
+        opening the socket on first use.
+
+        :param message: Message whose data is the subscription operation.
+        :param results: Queue to deliver results to; by default the subscription has its own.
+        :return: A Subscription that iterates over results as the server pushes them.
+        """
+        with self._subscription_lock:
+            if self._subscription_client is None or not self._subscription_client.connected:
+                if self._subscription_client is not None:
+                    # The socket dropped; stop its event loop before opening a new one
+                    self._subscription_client.close()
+                client = SubscriptionClient(self.subscription_url, self.connection_params)
+                client.connect()
+                self._subscription_client = client
+            client = self._subscription_client
+        return client.subscribe(self._operation(message), results)
+
     def receive(self) -> Message:
-        print("Receiving data from GraphQL is query-based, usually not applicable.")
-        return Message(action="receive", data={})
+        if self._subscription_client is None:
+            print("Receiving data from GraphQL is query-based, usually not applicable.")
+            return Message(action="receive", data={})
+
+        try:
+            return self._subscription_results.get(timeout=self.receive_timeout)
+        except queue.Empty:
+            self.logger.info("No subscription result received within the timeout period.")
+            return Message(action="error", data={}, metadata={"error": "No message found"})
 
     def disconnect(self):
         print("Disconnecting from GraphQL endpoint...")
+        with self._subscription_lock:
+            if self._subscription_client is not None:
+                self._subscription_client.close()
+                self._subscription_client = None
+        with self._batcher_lock:
+            if self._batcher is not None:
+                self._batcher.close()
+                self._batcher = None
@@ -0,0 +1,244 @@
+# connectiva/protocols/graphql_subscriptions.py
+
+import json
+import queue
+import asyncio
+import logging
+import itertools
+import threading
+import websockets
+from typing import Dict, Any, Optional
+from connectiva import Message
+
+# Sentinel placed on a subscription queue once the server completes it
+_COMPLETE = object()
+
+
+class Subscription:
+    """
+    Iterator over the results the server pushes for a single subscription.
+    """
+
+    def __init__(self, client: "SubscriptionClient", subscription_id: str, results: Optional["queue.Queue"] = None):
+        self.client = client
+        self.id = subscription_id
+        self.completed = False
+        # Results go to a caller-provided queue when several subscriptions share one stream
+        self._shared = results is not None
+        self._results = results if results is not None else queue.Queue()
+
+    def _deliver(self, message: Message):
+        self._results.put(message)
+
+    def _complete(self):
+        self.completed = True
+        if not self._shared:
+            self._results.put(_COMPLETE)
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Message]:
+        """
+        Wait for the next result.
+
+        :param timeout: Seconds to wait, or None to wait indefinitely.
+        :return: The next result, or None on timeout or once the subscription is complete.
+        """
+        try:
+            item = self._results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if item is _COMPLETE:
+            # Keep the sentinel so later calls also see the end of the stream
+            self._results.put(_COMPLETE)
+            return None
+        return item
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Message:
+        message = self.get()
+        if message is None:
+            raise StopIteration
+        return message
+
+    def close(self):
+        """
+        Stop the subscription on the server.
+        """
+        self.client.unsubscribe(self.id)
+
+
+class SubscriptionClient:
+    """
+    Client for the ``graphql-transport-ws`` protocol that multiplexes many subscriptions
+    over one WebSocket. The socket is served by an event loop on a background thread.
+    """
+
+    subprotocol = "graphql-transport-ws"
+
+    def __init__(self, url: str, connection_params: Optional[Dict[str, Any]] = None, ack_timeout: float = 10.0):
+        """
+        :param url: The ws:// or wss:// URL of the subscription endpoint.
+        :param connection_params: Payload sent with ``connection_init``.
+        :param ack_timeout: Seconds to wait for ``connection_ack``.
+        """
+        self.url = url
+        self.connection_params = connection_params
+        self.ack_timeout = ack_timeout
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.websocket = None
+        self._loop = None
+        self._thread = None
+        self._reader = None
+        self._ids = itertools.count(1)
+        self._subscriptions: Dict[str, Subscription] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self.websocket is not None
+
+    def connect(self):
+        """
+        Open the socket and complete the ``connection_init`` / ``connection_ack`` handshake.
+        """
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="graphql-subscriptions", daemon=True)
+        self._thread.start()
+        try:
+            asyncio.run_coroutine_threadsafe(self._connect_async(), self._loop).result()
+        except Exception:
+            self._stop_loop()
+            raise
+
+    async def _connect_async(self):
+        self.logger.info("Connecting to GraphQL subscriptions at %s...", self.url)
+        websocket = await websockets.connect(self.url, subprotocols=[self.subprotocol])
+        init = {"type": "connection_init"}
+        if self.connection_params is not None:
+            init["payload"] = self.connection_params
+        await websocket.send(json.dumps(init))
+
+        reply = json.loads(await asyncio.wait_for(websocket.recv(), self.ack_timeout))
+        if reply.get("type") != "connection_ack":
+            await websocket.close()
+            raise ConnectionError(f"Expected connection_ack, got {reply.get('type')}")
+
+        self.websocket = websocket
+        self._reader = self._loop.create_task(self._read_loop())
+        self.logger.info("Connected to GraphQL subscriptions.")
+
+    async def _read_loop(self):
+        """
+        Route incoming frames to their subscriptions by id.
+        """
+        try:
+            async for raw in self.websocket:
+                try:
+                    frame = json.loads(raw)
+                except ValueError as e:
+                    self.logger.warning("Ignoring malformed frame: %s", e)
+                    continue
+                if not isinstance(frame, dict):
+                    self.logger.warning("Ignoring frame that is not an object: %r", frame)
+                    continue
+                frame_type = frame.get("type")
+                if frame_type == "ping":
+                    await self.websocket.send(json.dumps({"type": "pong"}))
+                    continue
+
+                with self._lock:
+                    subscription = self._subscriptions.get(frame.get("id"))
+                if subscription is None:
+                    continue
+
+                if frame_type == "next":
+                    subscription._deliver(Message(
+                        action="receive",
+                        data=frame.get("payload"),
+                        metadata={"subscription_id": subscription.id}
+                    ))
+                elif frame_type == "error":
+                    subscription._deliver(Message(
+                        action="error",
+                        data={},
+                        metadata={"error": frame.get("payload"), "subscription_id": subscription.id}
+                    ))
+                    self._finish(subscription.id)
+                elif frame_type == "complete":
+                    self._finish(subscription.id)
+        except websockets.exceptions.ConnectionClosed as e:
+            self.logger.info("GraphQL subscription socket closed: %s", e)
+        finally:
+            self.websocket = None
+            with self._lock:
+                remaining = list(self._subscriptions)
+            for subscription_id in remaining:
+                self._finish(subscription_id)
+
+    def _finish(self, subscription_id: str):
+        with self._lock:
+            subscription = self._subscriptions.pop(subscription_id, None)
+        if subscription is not None:
+            subscription._complete()
+
+    def subscribe(self, payload: Dict[str, Any], results: Optional["queue.Queue"] = None) -> Subscription:
+        """
+        Start a subscription.
+
+        :param payload: The GraphQL request (``query``, ``variables``, ``operationName``).
+        :param results: Queue to deliver results to; a private queue is used when omitted.
+        :return: The Subscription, which iterates over pushed results.
+        :raises ConnectionError: When the socket is not connected.
+        """
+        websocket = self.websocket
+        if websocket is None or self._loop is None:
+            raise ConnectionError("Not connected to GraphQL subscriptions")
+        subscription = Subscription(self, str(next(self._ids)), results)
+        with self._lock:
+            self._subscriptions[subscription.id] = subscription
+        frame = json.dumps({"id": subscription.id, "type": "subscribe", "payload": payload})
+        try:
+            asyncio.run_coroutine_threadsafe(websocket.send(frame), self._loop).result()
+        except Exception:
+            with self._lock:
+                self._subscriptions.pop(subscription.id, None)
+            raise
+        self.logger.debug("Started subscription %s.", subscription.id)
+        return subscription
+
+    def unsubscribe(self, subscription_id: str):
+        """
+        Complete a subscription from the client side.
+
+        :param subscription_id: The id of the subscription to stop.
+        """
+        with self._lock:
+            active = subscription_id in self._subscriptions
+        if active and self.websocket is not None:
+            frame = json.dumps({"id": subscription_id, "type": "complete"})
+            asyncio.run_coroutine_threadsafe(self.websocket.send(frame), self._loop).result()
+        self._finish(subscription_id)
+
+    def close(self):
+        """
+        Close the socket, completing every subscription, and stop the event loop.
+        """
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._close_async(), self._loop).result()
+        self._stop_loop()
+
+    async def _close_async(self):
+        if self.websocket is not None:
+            await self.websocket.close()
+        if self._reader is not None:
+            await self._reader
+            self._reader = None
+
+    def _stop_loop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+        self._thread = None
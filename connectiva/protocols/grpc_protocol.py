@@ -2,6 +2,7 @@ import grpc
 from typing import Dict, Any
 from ..interfaces import CommunicationMethod
 from ..message import Message
+from ..load_balancer import create_load_balancer
 
 class GrpcProtocol(CommunicationMethod):
     """
@@ -9,22 +10,43 @@ class GrpcProtocol(CommunicationMethod):
     """
 
     def __init__(self, **kwargs):
-        self.grpc_address = kwargs.get("endpoint").replace("grpc://", "")
+        self.balancer = create_load_balancer(**kwargs)
+        addresses = self.balancer.endpoints if self.balancer else [kwargs.get("endpoint")]
+        self.grpc_address = addresses[0].replace("grpc://", "")
         # Initialize your gRPC channel and stubs here
-        self.channel = grpc.insecure_channel(self.grpc_address)
+        self.channels: Dict[str, grpc.Channel] = {}
+        self.channel = self._channel(self.grpc_address)
         # self.stub = YourGrpcStub(self.channel)
 
+    def _channel(self, address: str) -> grpc.Channel:
+        """
+        Return the channel to a replica, opening it on first use.
+        """
+        if address not in self.channels:
+            self.channels[address] = grpc.insecure_channel(address)
+        return self.channels[address]
+
     def connect(self):
         print(f"Connecting to gRPC server at {self.grpc_address}...")
 
+    def _send_to(self, address: str, message: Message) -> Dict[str, Any]:
+        print(f"Sending message to gRPC server at {address}...")
+        # Convert message to the appropriate gRPC message format
+        # Example: grpc_message = YourGrpcMessage(**message.__dict__)
+        # response = YourGrpcStub(self._channel(address)).YourMethod(grpc_message)
+        return {}  # Replace with actual response conversion
+
     def send(self, message: Message) -> Dict[str, Any]:
-        print(f"Sending message to gRPC server at {self.grpc_address}...")
         try:
-            # Convert message to the appropriate gRPC message format
-            # Example: grpc_message = YourGrpcMessage(**message.__dict__)
-            # response = self.stub.YourMethod(grpc_message)
+            self._stage("pre_io", message)
+            if self.balancer is not None:
+                result = self.balancer.call(lambda address: self._send_to(address.replace("grpc://", ""), message))
+            else:
+                result = self._send_to(self.grpc_address, message)
+            self._stage("post_io", message)
+            self._stage("ack", message)  # Unary calls return once the server has answered
             print("Message sent successfully!")
-            return {}  # Replace with actual response conversion
+            return result
         except grpc.RpcError as e:
             print(f"Failed to send message: {e}")
             return {"error": str(e)}
@@ -36,4 +58,5 @@ class GrpcProtocol(CommunicationMethod):
 
     def disconnect(self):
         print("Disconnecting from gRPC server...")
-        self.channel.close()
+        for channel in self.channels.values():
+            channel.close()
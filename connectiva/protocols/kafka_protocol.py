@@ -1,13 +1,104 @@
 from kafka import KafkaProducer, KafkaConsumer, KafkaAdminClient
 from kafka.admin import NewTopic
 from kafka.errors import KafkaError, TopicAlreadyExistsError
-from kafka.structs import TopicPartition
-from typing import Dict, Any
+from kafka.structs import TopicPartition, OffsetAndMetadata
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, List, Optional, Set, Tuple, Union
+from uuid import uuid4
 from connectiva import CommunicationMethod, Message
+from connectiva.codec import create_codec, loads, resolved
+from connectiva.rpc import PendingRequests, stamp_request, reply_address, reply_message, timeout_message
 import json
+import zlib
 import logging
+import threading
+import time
 import re
 
+# Message metadata keys that are mapped onto the Kafka record instead of the value.
+# The partition to write to is only taken from "target_partition": received messages
+# carry the "partition" they were read from, which means nothing on another topic.
+ROUTING_KEYS = ("key", "target_partition", "headers")
+
+# Topics known to exist, per broker set, shared by all clients in the process so
+# reconnects and additional clients skip the admin round trip
+_known_topics: Dict[Tuple[str, ...], Set[str]] = {}
+_known_topics_lock = threading.Lock()
+
+
+class _ReplyTopicConsumer:
+    """
+    Shared consumer of this client's reply topic, routing replies to waiting
+    requests by the correlation id in their metadata.
+    """
+
+    def __init__(self, broker_list: list, topic: str, poll_timeout_ms: int = 100, metadata_timeout: float = 10.0):
+        self.topic = topic
+        self.pending = PendingRequests()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.consumer = KafkaConsumer(
+            bootstrap_servers=broker_list,
+            enable_auto_commit=False
+        )
+        try:
+            partitions = self._partitions(metadata_timeout)
+        except KafkaError:
+            self.consumer.close()
+            raise
+        assigned = [TopicPartition(topic, p) for p in partitions]
+        self.consumer.assign(assigned)
+        self.consumer.seek_to_end()
+        for partition in assigned:
+            # Resolve the end offsets now so no reply sent after this point is skipped
+            self.consumer.position(partition)
+        self.poll_timeout_ms = poll_timeout_ms
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="kafka-replies", daemon=True)
+        self._thread.start()
+
+    def _partitions(self, timeout: float) -> Set[int]:
+        """
+        Return the partitions of the reply topic. Metadata of a topic that was just
+        created may not list it yet, so ask again until it does.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            partitions = self.consumer.partitions_for_topic(self.topic)
+            if partitions:
+                return partitions
+            if time.monotonic() >= deadline:
+                raise KafkaError(f"No partitions known for reply topic {self.topic} after {timeout}s")
+            time.sleep(0.1)
+
+    def _run(self):
+        try:
+            while not self._stopping.is_set():
+                records = self.consumer.poll(timeout_ms=self.poll_timeout_ms)
+                for batch in records.values():
+                    for record in batch:
+                        try:
+                            value = loads(record.value)
+                        except (ValueError, zlib.error) as e:
+                            # Without a readable body there is no correlation id to route it by
+                            self.logger.error(f"Dropping unreadable reply: {e}")
+                            continue
+                        metadata = (value.get("metadata") or {}) if isinstance(value, dict) else {}
+                        correlation_id = metadata.get("correlation_id")
+                        if not self.pending.resolve(correlation_id, reply_message(value, correlation_id)):
+                            self.logger.debug(f"Dropping reply for unknown correlation id {correlation_id}.")
+        except Exception as e:
+            self.logger.error(f"Reply consumer stopped: {e}")
+            self.pending.fail_all(e)
+        finally:
+            self.consumer.close()
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def close(self):
+        self._stopping.set()
+        self._thread.join()
+
 class KafkaProtocol(CommunicationMethod):
     """
     Kafka communication class for producing and consuming messages from Kafka topics.
@@ -24,9 +115,18 @@ class KafkaProtocol(CommunicationMethod):
         self.partitions = kwargs.get("partitions", 1)
         self.replication_factor = kwargs.get("replication_factor", 1)
         self.consumer_timeout = kwargs.get("consumer_timeout", 5000)  # Timeout for consumer in milliseconds
+        self.enable_auto_commit = kwargs.get("enable_auto_commit", True)  # Set False to commit only through ack()
+        # Without a configured reply topic, request() creates one for this client and disconnect() deletes it
+        self.reply_topic = kwargs.get("reply_topic") or f"{self.topic}.replies.{uuid4().hex[:12]}"
+        self._owns_reply_topic = not kwargs.get("reply_topic")
+        self.auto_create_topic = kwargs.get("create_topic", True)  # Set False to skip the admin client on connect
+        self.warm_up = kwargs.get("warm_up", False)  # Fetch topic metadata during connect instead of on first use
+        self.codec = create_codec(**kwargs)
+        self.connect_time = None  # Seconds the last connect() took
         self.producer = None
         self.consumer = None
-        self.admin_client = None
+        self._replies = None
+        self._replies_lock = threading.Lock()
 
         # Parse the endpoint to get broker list
         self.broker_list = self._parse_endpoint(self.endpoint)
@@ -46,83 +146,260 @@ class KafkaProtocol(CommunicationMethod):
         self.logger.debug(f"Parsed brokers: {brokers}")
         return brokers
 
-    def create_topic(self):
+    def create_topic(self, topic: Optional[str] = None):
         """
         Create Kafka topic if it does not exist.
+
+        :param topic: Topic to create; defaults to the configured topic.
         """
+        topic = topic or self.topic
+        brokers = tuple(sorted(self.broker_list))
+        with _known_topics_lock:
+            if topic in _known_topics.get(brokers, ()):
+                self.logger.debug(f"Topic {topic} is known to exist.")
+                return
+        admin_client = None
         try:
-            self.admin_client = KafkaAdminClient(bootstrap_servers=self.broker_list)
-            topic_list = self.admin_client.list_topics()
-            if self.topic not in topic_list:
-                self.logger.info(f"Creating topic {self.topic}...")
+            admin_client = KafkaAdminClient(bootstrap_servers=self.broker_list)
+            topic_list = admin_client.list_topics()
+            with _known_topics_lock:
+                _known_topics.setdefault(brokers, set()).update(topic_list)
+            if topic not in topic_list:
+                self.logger.info(f"Creating topic {topic}...")
                 new_topic = NewTopic(
-                    name=self.topic,
+                    name=topic,
                     num_partitions=self.partitions,
                     replication_factor=self.replication_factor
                 )
-                self.admin_client.create_topics([new_topic])
-                self.logger.info(f"Topic {self.topic} created successfully!")
+                admin_client.create_topics([new_topic])
+                with _known_topics_lock:
+                    _known_topics[brokers].add(topic)
+                self.logger.info(f"Topic {topic} created successfully!")
             else:
-                self.logger.info(f"Topic {self.topic} already exists.")
+                self.logger.info(f"Topic {topic} already exists.")
         except TopicAlreadyExistsError:
-            self.logger.info(f"Topic {self.topic} already exists.")
+            self.logger.info(f"Topic {topic} already exists.")
         except KafkaError as e:
             self.logger.error(f"Failed to create topic: {e}")
             raise
         finally:
-            if self.admin_client:
-                self.admin_client.close()
+            if admin_client is not None:
+                admin_client.close()
+
+    def _delete_reply_topic(self):
+        """
+        Delete the reply topic generated for this client.
+        """
+        brokers = tuple(sorted(self.broker_list))
+        admin_client = None
+        try:
+            admin_client = KafkaAdminClient(bootstrap_servers=self.broker_list)
+            admin_client.delete_topics([self.reply_topic])
+            self.logger.info(f"Reply topic {self.reply_topic} deleted.")
+        except KafkaError as e:
+            self.logger.error(f"Failed to delete reply topic {self.reply_topic}: {e}")
+        finally:
+            if admin_client is not None:
+                admin_client.close()
+            with _known_topics_lock:
+                _known_topics.get(brokers, set()).discard(self.reply_topic)
 
     def connect(self):
         self.logger.info(f"Connecting to Kafka brokers at {self.broker_list}...")
+        started = time.monotonic()
         try:
             # Create the topic if it doesn't exist
-            self.create_topic()
+            if self.auto_create_topic:
+                self.create_topic()
 
-            # Initialize Kafka producer
-            self.producer = KafkaProducer(
-                bootstrap_servers=self.broker_list,
-                value_serializer=lambda v: json.dumps(v).encode('utf-8')
-            )
-            self.logger.info("Kafka producer connected.")
-
-            # Initialize Kafka consumer
-            if self.group_id:
-                self.consumer = KafkaConsumer(
-                    self.topic,
-                    bootstrap_servers=self.broker_list,
-                    group_id=self.group_id,
-                    auto_offset_reset='earliest',  # Start from the earliest message
-                    enable_auto_commit=True,  # Automatically commit offsets
-                    consumer_timeout_ms=self.consumer_timeout,  # Set consumer timeout
-                    value_deserializer=lambda x: json.loads(x.decode('utf-8'))
-                )
-                self.logger.info("Kafka consumer connected.")
-                self.consumer.subscribe([self.topic])  # Subscribe to the topic
-            else:
-                self.logger.info("No consumer group ID provided; skipping consumer initialization.")
+            # The producer and consumer bootstrap independently, so build them side by side
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                producer = executor.submit(self._create_producer)
+                consumer = executor.submit(self._create_consumer)
+                self.producer = producer.result()
+                self.consumer = consumer.result()
 
+            self.connect_time = time.monotonic() - started
+            self.logger.info(f"Connected to Kafka in {self.connect_time:.3f}s.")
         except KafkaError as e:
             self.logger.error(f"Failed to connect to Kafka: {e}")
             raise
 
+    def _create_producer(self) -> KafkaProducer:
+        producer = KafkaProducer(
+            bootstrap_servers=self.broker_list,
+            value_serializer=lambda v: v if isinstance(v, (bytes, bytearray, memoryview)) else json.dumps(v).encode('utf-8')
+        )
+        if self.warm_up:
+            # Blocks until the partition metadata of the topic is cached
+            producer.partitions_for(self.topic)
+        self.logger.info("Kafka producer connected.")
+        return producer
+
+    def _create_consumer(self) -> Optional[KafkaConsumer]:
+        if not self.group_id:
+            self.logger.info("No consumer group ID provided; skipping consumer initialization.")
+            return None
+        # Values are left as bytes, so receive_raw() can hand them over undecoded
+        consumer = KafkaConsumer(
+            self.topic,
+            bootstrap_servers=self.broker_list,
+            group_id=self.group_id,
+            auto_offset_reset='earliest',  # Start from the earliest message
+            enable_auto_commit=self.enable_auto_commit,  # Automatically commit offsets
+            consumer_timeout_ms=self.consumer_timeout  # Set consumer timeout
+        )
+        self.logger.info("Kafka consumer connected.")
+        consumer.subscribe([self.topic])  # Subscribe to the topic
+        if self.warm_up:
+            consumer.partitions_for_topic(self.topic)
+        return consumer
+
+    @staticmethod
+    def _encode(value: Any) -> bytes:
+        if isinstance(value, bytes):
+            return value
+        if isinstance(value, str):
+            return value.encode('utf-8')
+        return json.dumps(value).encode('utf-8')
+
+    @staticmethod
+    def _decode(value: Optional[bytes]) -> Any:
+        if value is None:
+            return None
+        try:
+            return value.decode('utf-8')
+        except UnicodeDecodeError:
+            return value
+
+    @staticmethod
+    def _value(message: Message) -> Dict[str, Any]:
+        metadata = {k: v for k, v in message.metadata.items() if k not in ROUTING_KEYS}
+        return dict(message.__dict__, metadata=metadata)
+
+    def _encode_message(self, message: Message) -> Future:
+        self._stage("pre_serialize", message)
+        if self.codec is not None:
+            return self.codec.encode(self._value(message))
+        return resolved(self._encode, self._value(message))
+
+    def _record(self, message: Message, value: Optional[bytes] = None) -> Dict[str, Any]:
+        """
+        Build the producer.send() arguments for a message.
+
+        The ``key``, ``target_partition`` and ``headers`` metadata entries go onto
+        the record itself: the key selects the partition (so messages with the same
+        key stay ordered) unless a partition is set explicitly, and headers travel
+        without being part of the value.
+        The value is serialized here unless it is passed already encoded, so the
+        producer only has to send bytes.
+        """
+        record = {"value": value if value is not None else self._encode(self._value(message))}
+        if message.metadata.get("key") is not None:
+            record["key"] = self._encode(message.metadata["key"])
+        if message.metadata.get("target_partition") is not None:
+            record["partition"] = int(message.metadata["target_partition"])
+        if message.metadata.get("headers"):
+            record["headers"] = [(name, self._encode(value)) for name, value in message.metadata["headers"].items()]
+        return record
+
     def send(self, message: Message) -> Dict[str, Any]:
         self.logger.info(f"Sending message to Kafka topic '{self.topic}'...")
+        encoded = self._encode_message(message)
         try:
-            future = self.producer.send(self.topic, value=message.__dict__)  # Send the entire message
+            record = self._record(message, encoded.result())
+            self._stage("post_serialize", message)
+            self._stage("pre_io", message)
+            future = self.producer.send(self.topic, **record)  # Send the entire message
+            self._stage("post_io", message)
             result = future.get(timeout=10)  # Block until a single message is sent
-            self.logger.info(f"Message sent successfully! Offset: {result.offset}")
-            return {"status": "sent", "offset": result.offset}
+            self._stage("ack", message)
+            self.logger.info(f"Message sent successfully! Partition: {result.partition}, offset: {result.offset}")
+            return {"status": "sent", "partition": result.partition, "offset": result.offset}
+        except KafkaError as e:
+            self.logger.error(f"Failed to send message: {e}")
+            return {"error": str(e)}
+
+    def send_batch(self, messages: List[Message]) -> List[Dict[str, Any]]:
+        """
+        Send several messages, letting the producer pack them into as few requests
+        as possible, and wait for all acknowledgements at once.
+        """
+        self.logger.info(f"Sending batch of {len(messages)} messages to Kafka topic '{self.topic}'...")
+        # With a codec pool, later messages are encoded while earlier ones are handed to the producer
+        futures = []
+        for message, value in self._encode_ahead(messages):
+            try:
+                record = self._record(message, value.result())
+                self._stage("post_serialize", message)
+                self._stage("pre_io", message)
+                futures.append(self.producer.send(self.topic, **record))
+                self._stage("post_io", message)
+            except KafkaError as e:
+                futures.append(e)
+        self.producer.flush()
+        results = []
+        for message, future in zip(messages, futures):
+            try:
+                if isinstance(future, KafkaError):
+                    raise future
+                result = future.get(timeout=10)
+                self._stage("ack", message)
+                results.append({"status": "sent", "partition": result.partition, "offset": result.offset})
+            except KafkaError as e:
+                self.logger.error(f"Failed to send message: {e}")
+                results.append({"error": str(e)})
+        return results
+
+    def send_raw(self, body: Union[bytes, memoryview], headers: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Send an encoded body as the record value, with ``headers`` as record headers.
+        ``key`` and ``target_partition`` headers set the record key and partition instead.
+        """
+        self.logger.info(f"Sending raw message to Kafka topic '{self.topic}'...")
+        try:
+            headers = dict(headers or {})
+            record = self._record(Message(action="raw", data=None, metadata={
+                "key": headers.pop("key", None),
+                "target_partition": headers.pop("target_partition", None),
+                "headers": headers,
+            }), body)
+            result = self.producer.send(self.topic, **record).get(timeout=10)
+            self.logger.info(f"Message sent successfully! Partition: {result.partition}, offset: {result.offset}")
+            return {"status": "sent", "partition": result.partition, "offset": result.offset}
         except KafkaError as e:
             self.logger.error(f"Failed to send message: {e}")
             return {"error": str(e)}
 
     def receive(self) -> Message:
+        return self._receive(decode=True)
+
+    def receive_raw(self) -> Message:
+        """
+        Receive the next record with its value as undecoded bytes.
+        """
+        return self._receive(decode=False)
+
+    def _receive(self, decode: bool) -> Message:
         self.logger.info(f"Receiving message from Kafka topic '{self.topic}'...")
         try:
             for message in self.consumer:
-                self.logger.info(f"Message received successfully! Message: {message.value}")
-                return Message(action="receive", data=message.value)  # Return the entire message
+                self.logger.info(f"Message received successfully! Offset: {message.offset}")
+                metadata = {
+                    "topic": message.topic,
+                    "partition": message.partition,
+                    "offset": message.offset,
+                    "key": self._decode(message.key),
+                    "headers": {name: self._decode(value) for name, value in message.headers or []},
+                    "timestamp": message.timestamp,
+                }
+                try:
+                    data = self._decode_body(message.value) if decode else message.value  # Return the entire message
+                except (ValueError, zlib.error) as e:
+                    # The offset has moved past the record; report it so the caller can ack and move on
+                    self.logger.error(f"Unreadable message at offset {message.offset}: {e}")
+                    return Message(action="error", data={}, metadata=dict(metadata, error=f"Unreadable message: {e}"))
+                return Message(action="receive", data=data, metadata=metadata)
             self.logger.info("No message received within the timeout period.")
             return Message(action="error", data={}, metadata={"error": "No message found"})
         except StopIteration:
@@ -132,6 +409,84 @@ class KafkaProtocol(CommunicationMethod):
             self.logger.error(f"Failed to receive message: {e}")
             return Message(action="error", data={}, metadata={"error": str(e)})
 
+    def request(self, message: Message, timeout: float = 10.0) -> Message:
+        """
+        Send a request to the topic and wait for its reply. Replies come back on a
+        reply topic owned by this client and are routed by correlation id, so
+        concurrent requests share one consumer. The reply topic is the configured
+        ``reply_topic``, or one created for this client and deleted on disconnect().
+
+        :param message: The request message.
+        :param timeout: Seconds to wait for the reply.
+        :return: The reply message, or an error message on timeout.
+        """
+        try:
+            replies = self._reply_consumer()
+        except KafkaError as e:
+            self.logger.error(f"Failed to start the reply consumer: {e}")
+            return Message(action="error", data={}, metadata={"error": str(e)})
+        correlation_id, future = replies.pending.create()
+        request = stamp_request(message, correlation_id, self.reply_topic)
+        self.logger.info(f"Sending request {correlation_id} to Kafka topic '{self.topic}'...")
+        try:
+            self.producer.send(self.topic, **self._record(request))
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            replies.pending.discard(correlation_id)
+            self.logger.warning(f"Request {correlation_id} timed out.")
+            return timeout_message(timeout)
+        except Exception as e:
+            # Includes the error the reply consumer failed waiting requests with
+            replies.pending.discard(correlation_id)
+            self.logger.error(f"Request failed: {e}")
+            return Message(action="error", data={}, metadata={"error": str(e)})
+
+    def _reply_consumer(self) -> _ReplyTopicConsumer:
+        """
+        Start the reply consumer on first use, or again after it stopped on an error.
+        """
+        with self._replies_lock:
+            if self._replies is not None and not self._replies.is_alive():
+                self._replies = None
+            if self._replies is None:
+                self.create_topic(self.reply_topic)
+                self._replies = _ReplyTopicConsumer(self.broker_list, self.reply_topic)
+            return self._replies
+
+    def reply(self, request: Message, response: Message) -> Dict[str, Any]:
+        """
+        Send the response to a request received through receive().
+        """
+        reply_to, correlation_id = reply_address(request)
+        if reply_to is None:
+            return {"error": "Message has no reply address"}
+        self.logger.info(f"Replying to request {correlation_id} on topic '{reply_to}'...")
+        try:
+            body = Message(
+                action=response.action,
+                data=response.data,
+                metadata=dict(response.metadata, correlation_id=correlation_id)
+            )
+            self.producer.send(reply_to, **self._record(body)).get(timeout=10)
+            return {"status": "sent"}
+        except KafkaError as e:
+            self.logger.error(f"Failed to send reply: {e}")
+            return {"error": str(e)}
+
+    def ack(self, message: Message):
+        """
+        Commit the offset after a message received with auto-commit disabled.
+        """
+        if self.enable_auto_commit or "offset" not in message.metadata:
+            return
+        partition = TopicPartition(message.metadata["topic"], message.metadata["partition"])
+        try:
+            self.consumer.commit({partition: OffsetAndMetadata(message.metadata["offset"] + 1, None)})
+            self.logger.debug(f"Committed offset {message.metadata['offset'] + 1} for {partition}.")
+        except KafkaError as e:
+            self.logger.error(f"Failed to commit offset: {e}")
+            raise
+
     def seek_to_end(self):
         """Move the consumer to the end of the log for the current topic."""
         if self.consumer:
@@ -151,6 +506,11 @@ class KafkaProtocol(CommunicationMethod):
     def disconnect(self):
         self.logger.info("Disconnecting from Kafka...")
         try:
+            if self._replies is not None:
+                self._replies.close()
+                self._replies = None
+                if self._owns_reply_topic:
+                    self._delete_reply_topic()
             if self.producer:
                 self.producer.close()
                 self.logger.info("Kafka producer disconnected.")
@@ -0,0 +1,166 @@
+# connectiva/protocols/memory_protocol.py
+
+import zlib
+import queue
+import logging
+import threading
+from typing import Dict, Any, NamedTuple, Optional, Union
+from connectiva import CommunicationMethod, Message
+from connectiva.codec import dumps
+
+
+class _RawBody(NamedTuple):
+    """
+    An encoded body queued by send_raw(), decoded only when received through receive().
+    """
+    body: Union[bytes, memoryview]
+    headers: Dict[str, Any]
+
+
+class _MemoryQueue:
+    """
+    A named in-process queue shared by every MemoryProtocol using the same name.
+    """
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.queue: "queue.Queue[Union[Message, _RawBody]]" = queue.Queue(maxsize=capacity)
+        self.sent = 0
+        self.received = 0
+        self.lock = threading.Lock()
+
+    def count(self, sent: int = 0, received: int = 0):
+        with self.lock:
+            self.sent += sent
+            self.received += received
+
+
+_queues: Dict[str, _MemoryQueue] = {}
+_queues_lock = threading.Lock()
+
+
+def get_queue(name: str, capacity: int = 0) -> _MemoryQueue:
+    """
+    Return the queue registered under a name, creating it on first use.
+    The capacity is fixed by whoever creates the queue.
+    """
+    with _queues_lock:
+        if name not in _queues:
+            _queues[name] = _MemoryQueue(name, capacity)
+        return _queues[name]
+
+
+def delete_queue(name: Optional[str] = None):
+    """
+    Drop a queue and the messages in it, or every queue when no name is given.
+    """
+    with _queues_lock:
+        if name is None:
+            _queues.clear()
+        else:
+            _queues.pop(name, None)
+
+
+class MemoryProtocol(CommunicationMethod):
+    """
+    In-process communication through named queues, for components of one process.
+
+    Messages are handed over by reference, without serialization, so receivers
+    must treat them as read-only. Any number of producers and consumers can share
+    a queue; each message goes to exactly one consumer.
+    """
+
+    def __init__(self, **kwargs):
+        self.endpoint = kwargs.get("endpoint", "memory://default")
+        self.name = self.endpoint[len("memory://"):] if self.endpoint.startswith("memory://") else self.endpoint
+        self.capacity = kwargs.get("capacity", 0)  # Maximum queued messages; 0 means unbounded
+        self.block = kwargs.get("block", True)  # Wait for room when the queue is full
+        self.send_timeout = kwargs.get("send_timeout")  # Seconds to wait for room; None waits indefinitely
+        self.receive_timeout = kwargs.get("receive_timeout", 0.0)  # Seconds receive() waits; None waits indefinitely
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.queue = None
+
+    def connect(self):
+        self.logger.info(f"Attaching to in-process queue '{self.name}'...")
+        self.queue = get_queue(self.name, self.capacity)
+
+    def _queue(self) -> _MemoryQueue:
+        if self.queue is None:
+            self.connect()
+        return self.queue
+
+    def send(self, message: Message) -> Dict[str, Any]:
+        # Messages are passed by reference, so there is no serialization stage
+        self._stage("pre_io", message)
+        result = self._put(message)
+        if "error" not in result:
+            self._stage("post_io", message)
+            self._stage("ack", message)
+        return result
+
+    def _put(self, item: Union[Message, _RawBody]) -> Dict[str, Any]:
+        memory_queue = self._queue()
+        try:
+            memory_queue.queue.put(item, block=self.block, timeout=self.send_timeout)
+        except queue.Full:
+            self.logger.warning(f"Queue '{self.name}' is full.")
+            return {"error": f"Queue '{self.name}' is full"}
+        memory_queue.count(sent=1)
+        return {"status": "sent", "depth": memory_queue.queue.qsize()}
+
+    def send_raw(self, body: Union[bytes, memoryview], headers: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Queue an encoded body by reference, with its headers. receive() decodes
+        it like any other protocol would; receive_raw() hands it over as is.
+        """
+        return self._put(_RawBody(body, headers or {}))
+
+    def receive_raw(self) -> Message:
+        """
+        Receive the next message as bytes. Messages that were queued with send()
+        are serialized on the way out.
+        """
+        item = self._get()
+        if isinstance(item, _RawBody):
+            return Message(action="receive", data=item.body, metadata={"headers": item.headers})
+        if item.action == "error":
+            return item
+        return Message(action="receive", data=dumps(item.__dict__), metadata={"headers": {}})
+
+    def receive(self) -> Message:
+        item = self._get()
+        if not isinstance(item, _RawBody):
+            return item
+        try:
+            return Message(**self._decode_body(item.body))
+        except (ValueError, TypeError, zlib.error) as e:
+            self.logger.error(f"Unreadable message in queue '{self.name}': {e}")
+            return Message(action="error", data={}, metadata={"error": f"Unreadable message: {e}"})
+
+    def _get(self) -> Union[Message, _RawBody]:
+        memory_queue = self._queue()
+        try:
+            if self.receive_timeout == 0:
+                item = memory_queue.queue.get_nowait()
+            else:
+                item = memory_queue.queue.get(timeout=self.receive_timeout)
+        except queue.Empty:
+            return Message(action="error", data={}, metadata={"error": "No message found"})
+        memory_queue.count(received=1)
+        return item
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return the depth of the queue and how many messages went through it.
+        """
+        memory_queue = self._queue()
+        return {
+            "depth": memory_queue.queue.qsize(),
+            "capacity": memory_queue.queue.maxsize,
+            "sent": memory_queue.sent,
+            "received": memory_queue.received,
+        }
+
+    def disconnect(self):
+        self.logger.info(f"Detaching from in-process queue '{self.name}'.")
+        self.queue = None
@@ -1,41 +1,325 @@
 # connectiva/protocols/rest_protocol.py
 
+import json
+import time
+import urllib3
 import requests
-from typing import Dict, Any
+from concurrent.futures import Future
+from typing import Dict, Any, Iterator, Optional, Union
 from connectiva import Message, CommunicationMethod
+from connectiva.codec import ZLIB_MAGIC, create_codec
+from connectiva.response_cache import create_response_cache
+from connectiva.rate_limit import create_rate_limiter
+from connectiva.load_balancer import NoReplicasError, create_load_balancer
 
+# Response headers that describe the body as it was on the wire or the connection
+# it came over; requests has already undone the encoding, so they are not passed on
+_UNFORWARDED_HEADERS = {
+    "content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive",
+    "proxy-connection", "te", "trailer", "upgrade",
+}
 class RestProtocol(CommunicationMethod):
     """
     REST API communication class.
+
+    Besides polling with receive(), stream() delivers messages as the server
+    pushes them, in one of three ``stream_mode`` options:
+
+    - ``sse``: Server-Sent Events (``text/event-stream``) over a kept-alive connection.
+    - ``ndjson``: newline-delimited JSON over a kept-alive chunked response.
+    - ``long_poll``: repeated GETs the server holds for up to ``long_poll_wait`` seconds
+      until messages are available.
+
+    Dropped connections are re-established after ``reconnect_delay`` seconds
+    and resume after the last received event id, sent as ``Last-Event-ID``.
     """
 
+    STREAM_MODES = ("sse", "ndjson", "long_poll")
+
     def __init__(self, **kwargs):
+        self.balancer = create_load_balancer(**kwargs)
         self.base_url = kwargs.get("endpoint")
+        if self.base_url and "," in self.base_url:
+            self.base_url = self.balancer.endpoints[0]
+        self.cache = create_response_cache(**kwargs)
+        self.limiter = create_rate_limiter(self.base_url, **kwargs)
+        self._limiter_options = kwargs  # Each replica gets its own limiter, see _limited()
+        # Compressed request bodies are sent with Content-Encoding: deflate, which many servers reject
+        self.compress_requests = kwargs.get("compress_requests", False)
+        self.codec = create_codec(**(kwargs if self.compress_requests else dict(kwargs, compression_level=None)))
+        self.stream_mode = kwargs.get("stream_mode", "sse")  # "sse", "ndjson" or "long_poll"
+        self.stream_url = kwargs.get("stream_url") or f"{self.base_url}/endpoint"
+        self.stream_timeout = kwargs.get("stream_timeout", 60.0)  # Reconnect after this many idle seconds
+        self.long_poll_wait = kwargs.get("long_poll_wait", 30.0)  # Seconds the server may hold a long poll
+        self.reconnect_delay = kwargs.get("reconnect_delay", 1.0)  # Seconds to wait before reconnecting
+        self.last_event_id = kwargs.get("last_event_id")  # Resume the stream after this event
+        self._stream_response = None
+        if self.stream_mode not in self.STREAM_MODES:
+            raise ValueError(f"Unknown stream mode: {self.stream_mode}")
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Perform an HTTP request, on a replica chosen by the load balancer and
+        through the rate limiter when they are configured.
+        """
+        if self.balancer is None:
+            return self._limited(method, url, **kwargs)
+        path = url[len(self.base_url):]
+        try:
+            return self.balancer.call(
+                lambda replica: self._limited(method, replica.rstrip("/") + path, **kwargs),
+                failed=lambda response: response.status_code >= 500
+            )
+        except NoReplicasError as e:
+            raise requests.ConnectionError(str(e))
+
+    def _limited(self, method: str, url: str, **kwargs) -> requests.Response:
+        # Limits are per host, so replicas behind a balancer are limited separately
+        limiter = self.limiter if self.balancer is None else create_rate_limiter(url, **self._limiter_options)
+        if limiter is None:
+            return requests.request(method, url, **kwargs)
+        return limiter.call(lambda: requests.request(method, url, **kwargs), idempotent=method not in ("POST", "PATCH"))
+
+    def limiter_stats(self) -> Dict[str, Any]:
+        """
+        Return the rate limiter statistics, by replica when the endpoint is balanced.
+        """
+        if self.balancer is None:
+            return self.limiter.stats() if self.limiter is not None else {}
+        limiters = {replica: create_rate_limiter(replica, **self._limiter_options) for replica in self.balancer.endpoints}
+        return {replica: limiter.stats() for replica, limiter in limiters.items() if limiter is not None}
 
     def connect(self):
         print(f"Connecting to REST API at {self.base_url}...")
 
     def send(self, message: Message) -> Dict[str, Any]:
+        return self._send_encoded(message, self._encode_message(message))
+
+    def _send_encoded(self, message: Message, encoded: Future) -> Dict[str, Any]:
         print(f"Sending message to {self.base_url}/endpoint...")
+        url = f"{self.base_url}/endpoint"
         try:
-            response = requests.post(f"{self.base_url}/endpoint", json=message.__dict__)
+            body = encoded.result()
+            self._stage("post_serialize", message)
+            headers = {"Content-Type": "application/json"}
+            if body[:1] == bytes([ZLIB_MAGIC]):
+                headers["Content-Encoding"] = "deflate"  # HTTP "deflate" is the zlib format
+            self._stage("pre_io", message)
+            response = self._request("POST", url, data=body, headers=headers)
+            self._stage("post_io", message)
             response.raise_for_status()
+            self._stage("ack", message)
+            if self.cache is not None:
+                # A successful write makes any cached representation stale
+                self.cache.invalidate(("GET", url))
             print("Message sent successfully!")
             return response.json()
         except requests.RequestException as e:
             print(f"Failed to send message: {e}")
             return {"error": str(e)}
 
-    def receive(self) -> Message:
-        print(f"Receiving message from {self.base_url}/endpoint...")
+    def send_raw(self, body: Union[bytes, memoryview], headers: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        POST an encoded body as is, with ``headers`` as HTTP headers.
+        """
+        print(f"Sending raw message to {self.base_url}/endpoint...")
+        url = f"{self.base_url}/endpoint"
+        http_headers = {"Content-Type": "application/json"}
+        http_headers.update({name: str(value) for name, value in (headers or {}).items()})
         try:
-            response = requests.get(f"{self.base_url}/endpoint")
+            response = self._request("POST", url, data=body, headers=http_headers)
             response.raise_for_status()
+            if self.cache is not None:
+                self.cache.invalidate(("GET", url))
+            print("Message sent successfully!")
+            return {"status": "sent", "status_code": response.status_code}
+        except requests.RequestException as e:
+            print(f"Failed to send message: {e}")
+            return {"error": str(e)}
+
+    def receive_raw(self) -> Message:
+        """
+        GET the next message with its body as undecoded bytes and the response headers as headers.
+        Any content encoding is removed from the body, so the headers describing it are left out.
+        """
+        print(f"Receiving raw message from {self.base_url}/endpoint...")
+        try:
+            response = self._get(f"{self.base_url}/endpoint", {})
+            headers = {name: value for name, value in response.headers.items() if name.lower() not in _UNFORWARDED_HEADERS}
             print("Message received successfully!")
-            return Message(action="receive", data=response.json())
+            return Message(action="receive", data=response.content, metadata={"headers": headers})
         except requests.RequestException as e:
             print(f"Failed to receive message: {e}")
             return Message(action="error", data={}, metadata={"error": str(e)})
 
+    def _get(self, url: str, headers: Dict[str, str]) -> requests.Response:
+        """
+        Perform a GET request, passing 304 Not Modified responses through.
+        """
+        response = self._request("GET", url, headers=headers)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    def receive(self) -> Message:
+        print(f"Receiving message from {self.base_url}/endpoint...")
+        url = f"{self.base_url}/endpoint"
+        try:
+            if self.cache is not None:
+                data = self.cache.fetch(("GET", url), lambda headers: self._get(url, headers))
+            else:
+                data = self._decode_body(self._get(url, {}).content)
+            print("Message received successfully!")
+            return Message(action="receive", data=data)
+        except (requests.RequestException, ValueError) as e:
+            print(f"Failed to receive message: {e}")
+            return Message(action="error", data={}, metadata={"error": str(e)})
+
+    def stream(self) -> Iterator[Message]:
+        """
+        Yield messages as the server delivers them, reconnecting when the
+        connection drops. Runs until the caller stops iterating.
+        """
+        read = {"sse": self._read_sse, "ndjson": self._read_ndjson, "long_poll": self._read_long_poll}[self.stream_mode]
+        print(f"Streaming messages from {self.stream_url} ({self.stream_mode})...")
+        while True:
+            started = time.monotonic()
+            delivered = 0
+            try:
+                for message in read():
+                    delivered += 1
+                    yield message
+                # Long polls end after every response and are renewed right away, unless the
+                # server answered empty without holding the request, which would spin
+                held = time.monotonic() - started >= self.reconnect_delay
+                delay = 0 if self.stream_mode == "long_poll" and (delivered or held) else self.reconnect_delay
+            except (requests.RequestException, urllib3.exceptions.HTTPError) as e:
+                # Reads go through urllib3 directly, so idle timeouts and dropped
+                # connections surface as its exceptions rather than requests'
+                print(f"Stream interrupted: {e}")
+                delay = self.reconnect_delay
+            finally:
+                self._close_stream()
+            time.sleep(delay)
+
+    def _open_stream(self, accept: str, **kwargs) -> requests.Response:
+        headers = {"Accept": accept}
+        if self.last_event_id is not None:
+            headers["Last-Event-ID"] = str(self.last_event_id)
+        headers.update(kwargs.pop("headers", {}))
+        response = self._request("GET", self.stream_url, headers=headers, stream=True, **kwargs)
+        self._stream_response = response
+        response.raise_for_status()
+        return response
+
+    def _close_stream(self):
+        if self._stream_response is not None:
+            self._stream_response.close()
+            self._stream_response = None
+
+    def _event_message(self, payload: Any, event_id: Optional[str] = None, event: Optional[str] = None) -> Message:
+        """
+        Build a message from an event payload, remembering its id for resuming.
+        """
+        metadata = {}
+        if event_id is not None:
+            self.last_event_id = event_id
+            metadata["event_id"] = event_id
+        if event:
+            metadata["event"] = event
+        if isinstance(payload, dict) and "action" in payload and "data" in payload:
+            return Message(action=payload["action"], data=payload["data"], metadata=dict(payload.get("metadata") or {}, **metadata))
+        return Message(action="receive", data=payload, metadata=metadata)
+
+    @staticmethod
+    def _lines(response: requests.Response) -> Iterator[str]:
+        """
+        Yield the lines of a streamed response as soon as each is complete.
+
+        iter_lines() waits for a full chunk, or for the end of responses without
+        chunked encoding, which would hold events back.
+        """
+        read1 = getattr(response.raw, "read1", None)  # urllib3 2
+        if read1 is not None:
+            chunks = iter(lambda: read1(65536, decode_content=True), b"")
+        else:
+            chunks = response.iter_content(chunk_size=1)
+        buffer = b""
+        for chunk in chunks:
+            *lines, buffer = (buffer + chunk).split(b"\n")
+            for line in lines:
+                yield line.rstrip(b"\r").decode("utf-8")
+        if buffer:
+            yield buffer.rstrip(b"\r").decode("utf-8")
+
+    @staticmethod
+    def _parse(text: str) -> Any:
+        try:
+            return json.loads(text)
+        except ValueError:
+            return text
+
+    def _read_sse(self) -> Iterator[Message]:
+        response = self._open_stream("text/event-stream", timeout=(10, self.stream_timeout))
+        data, event, event_id = [], None, None
+        for line in self._lines(response):
+            if not line:
+                if data:
+                    yield self._event_message(self._parse("\n".join(data)), event_id, event)
+                data, event, event_id = [], None, None
+                continue
+            if line.startswith(":"):
+                continue  # Comment, used by servers as keep-alive
+            field, _, value = line.partition(":")
+            value = value[1:] if value.startswith(" ") else value
+            if field == "data":
+                data.append(value)
+            elif field == "event":
+                event = value
+            elif field == "id":
+                event_id = value
+            elif field == "retry" and value.isdigit():
+                self.reconnect_delay = int(value) / 1000
+
+    def _read_ndjson(self) -> Iterator[Message]:
+        response = self._open_stream("application/x-ndjson", timeout=(10, self.stream_timeout))
+        for line in self._lines(response):
+            if not line.strip():
+                continue
+            try:
+                payload = json.loads(line)
+            except ValueError as e:
+                print(f"Skipping malformed line: {e}")
+                continue
+            yield self._json_event(payload)
+
+    def _json_event(self, payload: Any) -> Message:
+        """
+        Build a message from a JSON event, taking its resume position from an ``id``
+        field, which stays in the payload as part of the record.
+        """
+        if isinstance(payload, dict) and "id" in payload:
+            return self._event_message(payload, str(payload["id"]))
+        return self._event_message(payload)
+
+    def _read_long_poll(self) -> Iterator[Message]:
+        # Prefer: wait is the standard way (RFC 7240) to ask the server to hold the request
+        response = self._open_stream(
+            "application/json",
+            headers={"Prefer": f"wait={int(self.long_poll_wait)}"},
+            params={"wait": self.long_poll_wait},
+            timeout=(10, self.long_poll_wait + 10)
+        )
+        if response.status_code in (204, 304) or not response.content:
+            return  # Nothing arrived while the server held the request
+        try:
+            payload = response.json()
+        except ValueError as e:
+            print(f"Skipping malformed response: {e}")
+            return
+        for item in payload if isinstance(payload, list) else [payload]:
+            yield self._json_event(item)
+
     def disconnect(self):
         print("Disconnecting from REST API...")
+        self._close_stream()
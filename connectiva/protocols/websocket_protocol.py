@@ -1,24 +1,86 @@
 # connectiva/protocols/websocket_protocol.py
 
 import asyncio
+import inspect
+import queue
+import threading
+import time
 import websockets
 import json
+from websockets.extensions.permessage_deflate import (
+    ClientPerMessageDeflateFactory,
+    ServerPerMessageDeflateFactory,
+)
 import logging
-from typing import Dict, Any, Tuple
+from concurrent.futures import Future
+from uuid import uuid4
+from typing import Dict, Any, Tuple, Callable, Optional, Union
 from connectiva import CommunicationMethod, Message
+from connectiva.load_balancer import NoReplicasError, create_load_balancer
+
+# permessage-deflate settings used for whichever of deflate_window_bits and
+# deflate_mem_level is not given when the other deflate options are tuned
+DEFLATE_WINDOW_BITS = 12
+DEFLATE_MEM_LEVEL = 5
+
+
+class _Connection:
+    """
+    A client connected to the server, with its own bounded outgoing queue.
+    """
+
+    def __init__(self, websocket, queue_size: int):
+        self.id = uuid4().hex
+        self.websocket = websocket
+        self.queue: "asyncio.Queue" = asyncio.Queue(maxsize=queue_size)
+        self.writer = None
+
 
 class WebSocketProtocol(CommunicationMethod):
     """
     WebSocket protocol that can operate as both a server and client.
+
+    Both modes run their sockets on an event loop in a background thread, so
+    ``connect()`` returns once the client is connected or the server is listening.
+    In server mode incoming messages are passed to the ``on_message`` callback
+    (by default they are echoed back) and queued for ``receive()``; ``send()`` and
+    ``broadcast()`` fan messages out to every connected client. Plain callbacks run
+    in a thread pool so a slow one does not stall other connections; coroutine
+    callbacks run on the loop.
     """
 
     def __init__(self, **kwargs):
         self.mode = kwargs.get("mode", "client")  # "client" or "server"
         self.endpoint = kwargs.get("endpoint", "ws://localhost:8765")
+        self.balancer = create_load_balancer(**kwargs) if self.mode == "client" else None
+        if self.balancer is not None:
+            self.endpoint = self.balancer.endpoints[0]
+        self.on_message: Optional[Callable] = kwargs.get("on_message", self._echo)
+        self.on_connect: Optional[Callable] = kwargs.get("on_connect")
+        self.on_disconnect: Optional[Callable] = kwargs.get("on_disconnect")
+        self.send_queue_size = kwargs.get("send_queue_size", 100)  # Per-connection frames before eviction
+        self.inbox_size = kwargs.get("inbox_size", 1000)  # Messages kept for receive() in server mode
+        self.receive_timeout = kwargs.get("receive_timeout", 5.0)
+        self.close_timeout = kwargs.get("close_timeout", 10)  # Seconds to wait for the closing handshake
+        self.binary = kwargs.get("binary", False)  # Send serialized payloads as binary frames
+        self.compression = kwargs.get("compression", "deflate")  # "deflate" or None
+        self.deflate_window_bits = kwargs.get("deflate_window_bits")  # 9-15, lower saves memory per connection; DEFLATE_WINDOW_BITS if unset
+        self.deflate_mem_level = kwargs.get("deflate_mem_level")  # 1-9, zlib memory level; DEFLATE_MEM_LEVEL if unset
+        self.deflate_level = kwargs.get("deflate_level")  # 0-9, zlib compression level
+        self.max_size = kwargs.get("max_size", 2 ** 20)  # Maximum incoming frame size in bytes
+        self.max_queue = kwargs.get("max_queue", 32)  # Incoming frames buffered before reading pauses
+        self.write_limit = kwargs.get("write_limit", 2 ** 16)  # Outgoing buffer high-water mark in bytes
         self.logger = logging.getLogger(self.__class__.__name__)
         self.websocket = None
+        self._connect_latency = None  # Seconds the balanced connection took, reported on disconnect
         self.server = None
-        self.loop = asyncio.get_event_loop()
+        self.loop = None
+        self._thread = None
+        self.connections: Dict[str, _Connection] = {}
+        self.inbox: "queue.Queue" = queue.Queue(maxsize=self.inbox_size)
+        self._broadcasts = 0
+        self._evicted = 0
+        self._dropped = 0
 
     def _parse_websocket_url(self) -> Tuple[str, int]:
         """
@@ -33,18 +95,129 @@ class WebSocketProtocol(CommunicationMethod):
         except Exception as e:
             raise ValueError(f"Error parsing WebSocket URL: {e}")
 
+    def _start_loop(self):
+        """
+        Start the background event loop that serves the socket(s).
+        """
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self.loop.run_forever, name="websocket-loop", daemon=True)
+            self._thread.start()
+
+    def _stop_loop(self):
+        """
+        Stop the background event loop and wait for its thread to exit.
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self.loop.close()
+            self.loop = None
+            self._thread = None
+
+    def _connected(self) -> bool:
+        """
+        Whether the client has a socket and the loop serving it.
+        """
+        return self.loop is not None and self.websocket is not None
+
+    def _run(self, coro):
+        """
+        Run a coroutine on the background loop and wait for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def _call_in_loop(self, func: Callable, *args):
+        """
+        Call a plain function on the loop thread and return its result. Safe to use
+        from coroutine callbacks, which already run on the loop thread.
+        """
+        if threading.current_thread() is self._thread:
+            return func(*args)
+        future = Future()
+
+        def call():
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+        self.loop.call_soon_threadsafe(call)
+        return future.result()
+
+    @staticmethod
+    def _echo(message: Message, connection_id: str) -> Message:
+        """
+        Default server handler: echo the message content back to the sender.
+        """
+        content = message.data.get("content") if isinstance(message.data, dict) else message.data
+        return Message(action="response", data={"received": content})
+
+    def _serialize(self, message: Message):
+        """
+        Encode a message as a text frame, or as a binary frame in binary mode.
+        """
+        payload = json.dumps(message.__dict__)
+        return payload.encode("utf-8") if self.binary else payload
+
+    def _socket_options(self) -> Dict[str, Any]:
+        """
+        Build the frame size, queue and compression options shared by client and server mode.
+        Deflate options left unset use DEFLATE_WINDOW_BITS and DEFLATE_MEM_LEVEL once any is given.
+        """
+        options = {
+            "close_timeout": self.close_timeout,
+            "max_size": self.max_size,
+            "max_queue": self.max_queue,
+            "write_limit": self.write_limit,
+            "compression": self.compression,
+        }
+        if self.compression == "deflate" and any(
+                setting is not None
+                for setting in (self.deflate_window_bits, self.deflate_mem_level, self.deflate_level)):
+            mem_level = self.deflate_mem_level if self.deflate_mem_level is not None else DEFLATE_MEM_LEVEL
+            compress_settings = {"memLevel": mem_level}
+            if self.deflate_level is not None:
+                compress_settings["level"] = self.deflate_level
+            window_bits = self.deflate_window_bits if self.deflate_window_bits is not None else DEFLATE_WINDOW_BITS
+            if self.mode == "server":
+                factory = ServerPerMessageDeflateFactory(
+                    server_max_window_bits=window_bits,
+                    client_max_window_bits=window_bits,
+                    compress_settings=compress_settings,
+                )
+            else:
+                factory = ClientPerMessageDeflateFactory(
+                    server_max_window_bits=window_bits,
+                    client_max_window_bits=window_bits,
+                    compress_settings=compress_settings,
+                )
+            options["extensions"] = [factory]
+        return options
+
+    @staticmethod
+    def _to_message(raw, connection_id: str) -> Message:
+        """
+        Decode an incoming frame into a Message tagged with the sending connection.
+        """
+        try:
+            decoded = json.loads(raw)
+        except ValueError:
+            decoded = raw
+        if isinstance(decoded, dict) and "action" in decoded and "data" in decoded:
+            metadata = dict(decoded.get("metadata") or {})
+            metadata["connection_id"] = connection_id
+            return Message(action=decoded["action"], data=decoded["data"], metadata=metadata)
+        return Message(action="receive", data=decoded, metadata={"connection_id": connection_id})
+
     async def _start_server(self):
         """
         Starts the WebSocket server.
         """
         host, port = self._parse_websocket_url()
         self.logger.info(f"Starting WebSocket server on {self.endpoint}...")
-        try:
-            self.server = await websockets.serve(self._server_handler, host, port)
-            self.logger.info("WebSocket server started.")
-            await self.server.wait_closed()
-        except Exception as e:
-            self.logger.error(f"Failed to start WebSocket server: {e}")
+        self.server = await websockets.serve(self._server_handler, host, port, **self._socket_options())
+        self.logger.info("WebSocket server started.")
 
     async def _connect_async(self):
         """
@@ -52,41 +225,168 @@ class WebSocketProtocol(CommunicationMethod):
         """
         self.logger.info(f"Connecting to WebSocket at {self.endpoint}...")
         try:
-            self.websocket = await websockets.connect(self.endpoint)
+            self.websocket = await websockets.connect(self.endpoint, **self._socket_options())
             self.logger.info("Connected to WebSocket!")
         except Exception as e:
             self.logger.error(f"Failed to connect to WebSocket: {e}")
 
-    async def _server_handler(self, websocket, path):
+    async def _invoke(self, callback: Optional[Callable], *args):
+        """
+        Call a user callback, awaiting it if it is a coroutine function. Plain
+        callbacks run in the loop's default executor instead of blocking the loop.
+        """
+        if callback is None:
+            return None
+        if inspect.iscoroutinefunction(callback) or callback == self._echo:
+            result = callback(*args)
+        else:
+            result = await asyncio.get_running_loop().run_in_executor(None, callback, *args)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def _server_handler(self, websocket, path=None):
         """
         Handles incoming WebSocket connections.
         """
-        self.logger.info("Client connected.")
+        connection = _Connection(websocket, self.send_queue_size)
+        connection.writer = asyncio.ensure_future(self._writer(connection))
+        self.connections[connection.id] = connection
+        self.logger.info("Client %s connected.", connection.id)
         try:
-            async for message in websocket:
-                self.logger.info(f"Received message: {message}")
-                
-                # Echo the message back with the expected structure
-                received_data = json.loads(message)
-                response = json.dumps({
-                    "action": "response",
-                    "data": {"received": received_data["data"]["content"]}
-                })
-                
-                await websocket.send(response)
+            await self._invoke(self.on_connect, connection.id)
+            async for raw in websocket:
+                message = self._to_message(raw, connection.id)
+                self._to_inbox(message)
+                reply = await self._invoke(self.on_message, message, connection.id)
+                if reply is not None:
+                    self._enqueue(connection, self._serialize(reply))
         except websockets.exceptions.ConnectionClosed as e:
             self.logger.info(f"Client disconnected: {e}")
+        except Exception as e:
+            self.logger.error("Handler failed for client %s: %s", connection.id, e)
+        finally:
+            self._unregister(connection)
+            await self._invoke(self.on_disconnect, connection.id)
+
+    async def _writer(self, connection: _Connection):
+        """
+        Drain a connection's outgoing queue onto its socket.
+        """
+        try:
+            while True:
+                payload = await connection.queue.get()
+                await connection.websocket.send(payload)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def _to_inbox(self, message: Message):
+        """
+        Queue a message for receive(), dropping the oldest one when nobody is reading.
+        """
+        while True:
+            try:
+                self.inbox.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.inbox.get_nowait()
+                    self._dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _enqueue(self, connection: _Connection, payload) -> bool:
+        """
+        Queue a frame for one connection, evicting it when it cannot keep up. Runs on the loop thread.
+        """
+        try:
+            connection.queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            self.logger.warning("Evicting slow consumer %s.", connection.id)
+            self._evicted += 1
+            self._unregister(connection)
+            # A close frame would be stuck behind the same backlog, so drop the connection outright
+            connection.websocket.transport.abort()
+            return False
+
+    def _unregister(self, connection: _Connection):
+        if self.connections.pop(connection.id, None) is not None and connection.writer is not None:
+            connection.writer.cancel()
+
+    def _fan_out(self, payload, connection_id: Optional[str]) -> Dict[str, Any]:
+        """
+        Queue an already serialized frame for one or all connections. Runs on the loop thread.
+        """
+        if connection_id is not None:
+            targets = [self.connections[connection_id]] if connection_id in self.connections else []
+        else:
+            targets = list(self.connections.values())
+            self._broadcasts += 1
+        delivered = sum(1 for connection in targets if self._enqueue(connection, payload))
+        return {"recipients": delivered, "evicted": len(targets) - delivered}
 
     def connect(self):
         """
         Starts the server or connects as a client based on the mode.
         """
+        if self.mode not in ("server", "client"):
+            self.logger.error("Invalid mode specified. Use 'client' or 'server'.")
+            return
+        self._start_loop()
         if self.mode == "server":
-            asyncio.run(self._start_server())
-        elif self.mode == "client":
-            asyncio.run(self._connect_async())
+            try:
+                self._run(self._start_server())
+            except Exception as e:
+                self.logger.error(f"Failed to start WebSocket server: {e}")
+                self._stop_loop()
         else:
-            self.logger.error("Invalid mode specified. Use 'client' or 'server'.")
+            if self.balancer is None:
+                self._run(self._connect_async())
+            else:
+                self._connect_balanced()
+            if self.websocket is None:
+                self._stop_loop()  # Nothing to serve; later calls report "Not connected"
+
+    def _connect_balanced(self):
+        """
+        Connect to a replica chosen by the load balancer, trying the next one if it fails.
+        The connection counts as outstanding on its replica until disconnect().
+        """
+        for _ in range(len(self.balancer.endpoints)):
+            try:
+                self.endpoint = self.balancer.pick()
+            except NoReplicasError as e:
+                self.logger.error(f"Failed to connect to WebSocket: {e}")
+                return
+            started = time.monotonic()
+            self._run(self._connect_async())
+            if self.websocket is not None:
+                self._connect_latency = time.monotonic() - started
+                return
+            self.balancer.release(self.endpoint, time.monotonic() - started, failed=True)
+        self.logger.error("No WebSocket replica accepted the connection.")
+
+    def wait_closed(self):
+        """
+        Block until the server is closed, for processes that only serve WebSockets.
+        """
+        if self.mode == "server" and self.server:
+            self._run(self.server.wait_closed())
+
+    def broadcast(self, message: Message) -> Dict[str, Any]:
+        """
+        Send a message to every connected client. The message is serialized once and
+        the same frame is queued for each connection; clients whose queue is full are evicted.
+
+        :param message: The message to broadcast.
+        :return: A dictionary with the number of recipients and evicted clients.
+        """
+        if self.mode != "server" or self.loop is None:
+            return {"error": "Broadcast requires a running server"}
+        result = self._call_in_loop(self._fan_out, self._serialize(message), None)
+        self.logger.info("Broadcast to %d clients.", result["recipients"])
+        return {"status": "broadcast", **result}
 
     async def _send_async(self, message: Message) -> Dict[str, Any]:
         """
@@ -94,7 +394,13 @@ class WebSocketProtocol(CommunicationMethod):
         """
         self.logger.info("Sending message via WebSocket...")
         try:
-            await self.websocket.send(json.dumps(message.__dict__))
+            self._stage("pre_serialize", message)
+            payload = self._serialize(message)
+            self._stage("post_serialize", message)
+            self._stage("pre_io", message)
+            await self.websocket.send(payload)
+            self._stage("post_io", message)
+            self._stage("ack", message)
             self.logger.info("Message sent successfully!")
             return {"status": "sent"}
         except Exception as e:
@@ -103,13 +409,65 @@ class WebSocketProtocol(CommunicationMethod):
 
     def send(self, message: Message) -> Dict[str, Any]:
         """
-        Unified method to send a message.
+        Unified method to send a message. In server mode the message goes to the
+        connection named by ``metadata["connection_id"]``, or to every client.
         """
         if self.mode == "client":
-            return asyncio.run(self._send_async(message))
-        else:
-            self.logger.error("Sending directly from server mode is not supported.")
-            return {"error": "Invalid operation in server mode"}
+            if not self._connected():
+                return {"error": "Not connected"}
+            return self._run(self._send_async(message))
+        if self.loop is None:
+            return {"error": "Server is not running"}
+        connection_id = message.metadata.get("connection_id")
+        if connection_id is None:
+            return self.broadcast(message)
+        result = self._call_in_loop(self._fan_out, self._serialize(message), connection_id)
+        if not result["recipients"]:
+            return {"error": f"Connection {connection_id} is not available"}
+        return {"status": "sent"}
+
+    def send_raw(self, body: Union[bytes, memoryview], headers: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Send an encoded body as a binary frame. Frames carry no headers; in server
+        mode a ``connection_id`` header picks the client, otherwise all clients get it.
+        """
+        connection_id = (headers or {}).get("connection_id")
+        if self.mode == "client":
+            if not self._connected():
+                return {"error": "Not connected"}
+            return self._run(self._send_raw_async(body))
+        if self.loop is None:
+            return {"error": "Server is not running"}
+        result = self._call_in_loop(self._fan_out, body, connection_id)
+        if connection_id is not None and not result["recipients"]:
+            return {"error": f"Connection {connection_id} is not available"}
+        return {"status": "sent", **result}
+
+    async def _send_raw_async(self, body: Union[bytes, memoryview]) -> Dict[str, Any]:
+        self.logger.info("Sending raw message via WebSocket...")
+        try:
+            await self.websocket.send(body)
+            self.logger.info("Message sent successfully!")
+            return {"status": "sent"}
+        except Exception as e:
+            self.logger.error(f"Failed to send message: {e}")
+            return {"error": str(e)}
+
+    def receive_raw(self) -> Message:
+        """
+        Receive the next frame without decoding it. Only supported in client mode,
+        as the server decodes frames as they arrive.
+        """
+        if self.mode != "client":
+            return super().receive_raw()
+        if not self._connected():
+            return Message(action="error", data={}, metadata={"error": "Not connected"})
+        try:
+            frame = self._run(self.websocket.recv())
+        except Exception as e:
+            self.logger.error(f"Failed to receive message: {e}")
+            return Message(action="error", data={}, metadata={"error": str(e)})
+        return Message(action="receive", data=frame.encode("utf-8") if isinstance(frame, str) else frame, metadata={})
 
     async def _receive_async(self) -> Message:
         """
@@ -126,13 +484,29 @@ class WebSocketProtocol(CommunicationMethod):
 
     def receive(self) -> Message:
         """
-        Unified method to receive a message.
+        Unified method to receive a message. In server mode this returns the next
+        message received from any client.
         """
         if self.mode == "client":
-            return asyncio.run(self._receive_async())
-        else:
-            self.logger.error("Receiving directly from server mode is not supported.")
-            return Message(action="error", data={}, metadata={"error": "Invalid operation in server mode"})
+            if not self._connected():
+                return Message(action="error", data={}, metadata={"error": "Not connected"})
+            return self._run(self._receive_async())
+        try:
+            return self.inbox.get(timeout=self.receive_timeout)
+        except queue.Empty:
+            return Message(action="error", data={}, metadata={"error": "No message found"})
+
+    def server_stats(self) -> Dict[str, Any]:
+        """
+        Return connection and fan-out statistics for server mode.
+        """
+        return {
+            "connections": len(self.connections),
+            "broadcasts": self._broadcasts,
+            "evicted": self._evicted,
+            "inbox_depth": self.inbox.qsize(),
+            "inbox_dropped": self._dropped,
+        }
 
     async def _disconnect_async(self):
         """
@@ -142,14 +516,27 @@ class WebSocketProtocol(CommunicationMethod):
         if self.websocket:
             await self.websocket.close()
 
+    async def _stop_server(self):
+        """
+        Close the listening socket and every client connection.
+        """
+        self.server.close()
+        await self.server.wait_closed()
+
     def disconnect(self):
         """
         Unified method to disconnect.
         """
-        if self.mode == "client":
-            asyncio.run(self._disconnect_async())
+        if self.mode == "client" and self.loop is not None:
+            self._run(self._disconnect_async())
+            self._stop_loop()
+            if self._connect_latency is not None:
+                self.balancer.release(self.endpoint, self._connect_latency)
+                self._connect_latency = None
         elif self.mode == "server" and self.server:
-            self.server.close()
+            self._run(self._stop_server())
+            self.server = None
+            self._stop_loop()
             self.logger.info("WebSocket server stopped.")
         else:
             self.logger.error("No active connection to disconnect.")
@@ -0,0 +1,303 @@
+# connectiva/rate_limit.py
+
+import time
+import random
+import logging
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+# Status codes that mean the server is overloaded and the request may be retried
+THROTTLE_STATUS = (429, 503)
+
+# A 429 is refused before the request is processed; a 503 may come after part of the work
+# was done, so only idempotent requests are retried on it
+UNPROCESSED_STATUS = (429,)
+
+
+class TokenBucket:
+    """
+    Limits the request rate to ``rate`` per second, allowing bursts of up to ``burst`` requests.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """
+        Block until a token is available and take it.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """
+        Hold back all requests for the given time, e.g. as asked by a Retry-After header.
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "tokens": self._tokens,
+                "paused_for": max(self._paused_until - now, 0.0),
+            }
+
+
+class AIMDLimiter:
+    """
+    Adaptive concurrency limit using additive increase / multiplicative decrease.
+
+    The limit grows by about one request per round of successful requests and
+    is cut by ``backoff`` when the server throttles, or when the ``percentile``
+    latency of the last ``window`` requests rises well above the lowest latency
+    observed, so it settles around the highest concurrency the endpoint sustains.
+    Judging latency over a window keeps single slow requests from cutting the limit.
+    """
+
+    def __init__(self,
+                 initial: int = 4,
+                 min_limit: int = 1,
+                 max_limit: int = 100,
+                 backoff: float = 0.5,
+                 latency_tolerance: float = 2.0,
+                 window: int = 20,
+                 percentile: float = 0.9):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.window = window
+        self.percentile = percentile
+        self._samples = deque(maxlen=window)
+        self._inflight = 0
+        self._baseline: Optional[float] = None
+        self._latency: Optional[float] = None
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Block until the number of requests in flight is below the limit.
+        """
+        with self._condition:
+            while self._inflight >= int(self.limit):
+                self._condition.wait()
+            self._inflight += 1
+
+    def release(self, latency: Optional[float], overloaded: bool = False):
+        """
+        Record the outcome of a request and adjust the limit.
+
+        :param latency: Seconds the request took, or None if it failed before completing.
+        :param overloaded: Whether the server signalled overload.
+        """
+        with self._condition:
+            self._inflight -= 1
+            if latency is not None:
+                self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+                # The baseline follows the fastest responses and drifts up slowly if they stop
+                self._baseline = latency if self._baseline is None else min(latency, self._baseline * 1.01)
+                self._samples.append(latency)
+                if len(self._samples) == self.window and \
+                        self._window_latency() > self._baseline * self.latency_tolerance:
+                    overloaded = True
+            if overloaded:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                # Judge the reduced limit on requests sent under it
+                self._samples.clear()
+            elif latency is not None:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def _window_latency(self) -> float:
+        """
+        Return the configured percentile of the latencies in the window. Caller must hold the lock.
+        """
+        ordered = sorted(self._samples)
+        return ordered[min(int(len(ordered) * self.percentile), len(ordered) - 1)]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "limit": int(self.limit),
+                "inflight": self._inflight,
+                "latency": self._latency,
+                "baseline_latency": self._baseline,
+            }
+
+
+def retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header, given either in seconds or as an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """
+    Per-endpoint request limiter combining a token bucket with an adaptive
+    concurrency limit, retrying throttled requests with backoff.
+    """
+
+    def __init__(self,
+                 rate: Optional[float] = None,
+                 burst: Optional[float] = None,
+                 adaptive: bool = True,
+                 max_concurrency: int = 100,
+                 max_retries: int = 3,
+                 retry_backoff: float = 0.5,
+                 max_backoff: float = 30.0):
+        """
+        :param rate: Maximum requests per second, or None for no rate limit.
+        :param burst: Number of requests that may be sent at once after an idle period.
+        :param adaptive: Adapt the number of concurrent requests to the endpoint's latency and throttling.
+        :param max_concurrency: Upper bound for the adaptive concurrency limit.
+        :param max_retries: How often a throttled (429/503) request is retried.
+        :param retry_backoff: Initial retry delay in seconds when the server gives no Retry-After, doubled on each retry.
+        :param max_backoff: Upper bound for the retry delay.
+        """
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.concurrency = AIMDLimiter(max_limit=max_concurrency) if adaptive else None
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._throttled = 0
+        self._retries = 0
+
+    def call(self, request: Callable[[], Any], idempotent: bool = True) -> Any:
+        """
+        Run an HTTP request under the limits, retrying it while the server throttles.
+
+        :param request: Callable performing the request and returning a ``requests.Response``.
+        :param idempotent: Whether the request may be repeated safely. Other requests
+                           are only retried on 429, which the server sends before doing any work.
+        :return: The last response.
+        """
+        backoff = self.retry_backoff
+        for attempt in range(self.max_retries + 1):
+            if self.bucket is not None:
+                self.bucket.acquire()
+            if self.concurrency is not None:
+                self.concurrency.acquire()
+            started = time.monotonic()
+            latency = None
+            overloaded = False
+            try:
+                response = request()
+                latency = time.monotonic() - started
+                overloaded = response.status_code in THROTTLE_STATUS
+            finally:
+                if self.concurrency is not None:
+                    self.concurrency.release(latency, overloaded)
+
+            with self._lock:
+                self._requests += 1
+                if overloaded:
+                    self._throttled += 1
+            if not overloaded or attempt == self.max_retries:
+                return response
+            if not idempotent and response.status_code not in UNPROCESSED_STATUS:
+                return response
+
+            delay = retry_after(response.headers.get("Retry-After"))
+            if delay is not None and self.bucket is not None:
+                self.bucket.pause(delay)
+            if delay is None:
+                delay = backoff * random.uniform(0.5, 1.0)
+                backoff = min(backoff * 2, self.max_backoff)
+            with self._lock:
+                self._retries += 1
+            self.logger.warning("Endpoint throttled (HTTP %d), retrying in %.2fs.", response.status_code, delay)
+            time.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return request and throttling counters with the current state of the limits.
+        """
+        with self._lock:
+            stats = {"requests": self._requests, "throttled": self._throttled, "retries": self._retries}
+        if self.bucket is not None:
+            stats["bucket"] = self.bucket.stats()
+        if self.concurrency is not None:
+            stats["concurrency"] = self.concurrency.stats()
+        return stats
+
+
+# Limiters shared by all protocol instances talking to the same host with the same options
+_limiters: Dict[Tuple[str, tuple], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(url: str, **kwargs) -> RateLimiter:
+    """
+    Return the limiter of the endpoint serving ``url`` with the given options,
+    creating it on first use. Clients of the same endpoint share a limiter when
+    they configure the same limits.
+    """
+    parts = urlsplit(url or "")
+    key = (f"{parts.scheme}://{parts.netloc}", tuple(sorted(kwargs.items())))
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(**kwargs)
+        return _limiters[key]
+
+
+def create_rate_limiter(url: str, **kwargs) -> Optional[RateLimiter]:
+    """
+    Build the limiter of an HTTP protocol from the ``rate_limit``, ``rate_burst``,
+    ``adaptive_concurrency``, ``max_concurrency`` and ``max_retries`` options.
+    A RateLimiter instance may be passed as ``rate_limiter`` to use it directly.
+    """
+    limiter = kwargs.get("rate_limiter")
+    if isinstance(limiter, RateLimiter):
+        return limiter
+    if not kwargs.get("rate_limit") and not kwargs.get("adaptive_concurrency"):
+        return None
+    return limiter_for(
+        url,
+        rate=kwargs.get("rate_limit"),
+        burst=kwargs.get("rate_burst"),
+        adaptive=kwargs.get("adaptive_concurrency", False),
+        max_concurrency=kwargs.get("max_concurrency", 100),
+        max_retries=kwargs.get("max_retries", 3)
+    )
@@ -0,0 +1,234 @@
+# connectiva/response_cache.py
+
+import json
+import time
+import logging
+import threading
+import requests
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _CacheEntry:
+    """
+    A cached response body together with its validators and expiry time.
+    """
+
+    __slots__ = ("body", "etag", "last_modified", "expires_at")
+
+    def __init__(self, body: bytes, etag: Optional[str], last_modified: Optional[str], expires_at: float):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+
+class _InFlight:
+    """
+    A fetch in progress that concurrent callers for the same key wait on.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache for HTTP responses.
+
+    Entries are kept fresh for ``max-age`` seconds from ``Cache-Control`` (or the
+    default TTL), after which they are revalidated with ``If-None-Match`` /
+    ``If-Modified-Since`` so unchanged responses come back as cheap 304s.
+    Concurrent fetches for the same key are coalesced into a single request.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 0.0):
+        """
+        :param max_entries: Maximum number of responses kept before the least recently used is evicted.
+        :param ttl: Freshness lifetime in seconds for responses without a Cache-Control max-age.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._entries: "OrderedDict[Hashable, _CacheEntry]" = OrderedDict()
+        self._in_flight: Dict[Hashable, _InFlight] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._revalidated = 0
+        self._coalesced = 0
+        self._evictions = 0
+
+    def fetch(self, key: Hashable, fetcher: Callable[[Dict[str, str]], Any]) -> Any:
+        """
+        Return the decoded JSON body for ``key``, calling ``fetcher`` only when needed.
+
+        :param key: Hashable key identifying the request.
+        :param fetcher: Callable that takes conditional request headers and returns a
+                        ``requests.Response`` (status 304 is expected to be passed through).
+        :return: The decoded JSON body.
+        :raises requests.RequestException: If the request fails or the body is not JSON,
+                                           as ``Response.json()`` would.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return self._decode(entry.body)
+
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _InFlight()
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return self._decode(flight.value)
+
+        try:
+            flight.value, data = self._load(key, entry, fetcher)
+            return data
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            flight.event.set()
+
+    @staticmethod
+    def _decode(body: bytes) -> Any:
+        """
+        Decode a JSON body, failing like ``Response.json()`` does.
+        """
+        try:
+            return json.loads(body)
+        except json.JSONDecodeError as e:
+            raise requests.exceptions.JSONDecodeError(e.msg, e.doc, e.pos)
+        except UnicodeDecodeError as e:
+            raise requests.exceptions.JSONDecodeError(str(e), "", 0)
+
+    def _load(self, key: Hashable, entry: Optional[_CacheEntry],
+              fetcher: Callable[[Dict[str, str]], Any]) -> Tuple[bytes, Any]:
+        """
+        Fetch or revalidate ``key`` and return the raw response body with its decoded value.
+        Bodies that are not JSON are never stored.
+        """
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        response = fetcher(headers)
+
+        if response.status_code == 304 and entry is None:
+            # Nothing was asked to be revalidated, so there is no body to return
+            raise requests.HTTPError(f"304 Not Modified without a cached response for {key}", response=response)
+        if response.status_code == 304:
+            self.logger.debug("Response for %s not modified.", key)
+            lifetime = self._freshness(response.headers)
+            with self._lock:
+                self._revalidated += 1
+                entry.expires_at = time.monotonic() + (lifetime or 0.0)
+                self._put(key, entry)
+            return entry.body, self._decode(entry.body)
+
+        with self._lock:
+            self._misses += 1
+
+        data = self._decode(response.content)
+        lifetime = self._freshness(response.headers)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if lifetime is not None and (lifetime > 0 or etag or last_modified):
+            new_entry = _CacheEntry(response.content, etag, last_modified, time.monotonic() + lifetime)
+            with self._lock:
+                self._put(key, new_entry)
+        return response.content, data
+
+    def _put(self, key: Hashable, entry: _CacheEntry):
+        """
+        Insert an entry and evict the least recently used ones. Caller must hold the lock.
+        """
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def _freshness(self, headers) -> Optional[float]:
+        """
+        Return the freshness lifetime from Cache-Control, or None if the response must not be stored.
+        """
+        directives = {}
+        for part in headers.get("Cache-Control", "").split(","):
+            name, _, value = part.strip().partition("=")
+            if name:
+                directives[name.lower()] = value.strip('"')
+
+        if "no-store" in directives:
+            return None
+        if "no-cache" in directives:
+            return 0.0
+        if "max-age" in directives:
+            try:
+                return max(float(directives["max-age"]), 0.0)
+            except ValueError:
+                pass
+        return self.ttl
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """
+        Drop a single entry, or every entry when no key is given.
+
+        :param key: The key to drop.
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return hit/miss statistics for the cache.
+
+        :return: A dictionary of counters and the current hit ratio.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses + self._revalidated
+            return {
+                "size": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "revalidated": self._revalidated,
+                "coalesced": self._coalesced,
+                "evictions": self._evictions,
+                "hit_ratio": (self._hits + self._revalidated) / lookups if lookups else 0.0,
+            }
+
+
+def create_response_cache(**kwargs) -> Optional[ResponseCache]:
+    """
+    Build the response cache of an HTTP protocol from the ``cache``, ``cache_size``
+    and ``cache_ttl`` options. A ResponseCache instance may be passed as ``cache``
+    to share it between protocols.
+    """
+    cache = kwargs.get("cache", False)
+    if isinstance(cache, ResponseCache):
+        return cache
+    if cache:
+        return ResponseCache(
+            max_entries=kwargs.get("cache_size", 256),
+            ttl=kwargs.get("cache_ttl", 0.0)
+        )
+    return None
@@ -0,0 +1,97 @@
+# connectiva/rpc.py
+
+import threading
+from concurrent.futures import Future
+from uuid import uuid4
+from typing import Any, Dict, Optional, Tuple
+from connectiva.message import Message, unwrap
+
+
+class PendingRequests:
+    """
+    Map of correlation ids to the futures of callers waiting for a reply.
+    """
+
+    def __init__(self):
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def create(self) -> Tuple[str, Future]:
+        """
+        Register a new request.
+
+        :return: The correlation id and the future its reply will resolve.
+        """
+        correlation_id = uuid4().hex
+        future = Future()
+        with self._lock:
+            self._futures[correlation_id] = future
+        return correlation_id, future
+
+    def resolve(self, correlation_id: Optional[str], reply: Message) -> bool:
+        """
+        Hand a reply to the caller waiting for it.
+
+        :return: False if nobody is waiting for this correlation id (e.g. it timed out).
+        """
+        with self._lock:
+            future = self._futures.pop(correlation_id, None)
+        if future is None:
+            return False
+        future.set_result(reply)
+        return True
+
+    def discard(self, correlation_id: str):
+        with self._lock:
+            self._futures.pop(correlation_id, None)
+
+    def fail_all(self, error: Exception):
+        """
+        Fail every waiting caller, e.g. when the reply consumer stops.
+        """
+        with self._lock:
+            futures, self._futures = self._futures, {}
+        for future in futures.values():
+            future.set_exception(error)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._futures)
+
+
+def stamp_request(message: Message, correlation_id: str, reply_to: str) -> Message:
+    """
+    Return a copy of the message carrying the correlation id and reply address in its metadata.
+    """
+    metadata = dict(message.metadata)
+    metadata["correlation_id"] = correlation_id
+    metadata["reply_to"] = reply_to
+    return Message(action=message.action, data=message.data, metadata=metadata)
+
+
+def reply_address(request: Message) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Find the reply address and correlation id of a received request, whether the
+    protocol exposed them in the message metadata or they are inside the received envelope.
+
+    :return: The ``(reply_to, correlation_id)`` pair.
+    """
+    for metadata in (request.metadata, unwrap(request).metadata):
+        if metadata.get("reply_to") and metadata.get("correlation_id"):
+            return metadata["reply_to"], metadata["correlation_id"]
+    return None, None
+
+
+def reply_message(decoded: Any, correlation_id: Optional[str]) -> Message:
+    """
+    Turn a decoded reply body back into the Message the responder sent.
+    """
+    if isinstance(decoded, dict) and "action" in decoded and "data" in decoded:
+        metadata = dict(decoded.get("metadata") or {})
+        metadata["correlation_id"] = correlation_id
+        return Message(action=decoded["action"], data=decoded["data"], metadata=metadata)
+    return Message(action="receive", data=decoded, metadata={"correlation_id": correlation_id})
+
+
+def timeout_message(timeout: float) -> Message:
+    return Message(action="error", data={}, metadata={"error": f"No reply within {timeout}s"})
@@ -0,0 +1,207 @@
+# connectiva/schema.py
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Union
+import requests
+
+# A field is a name, {"name": ..., "fields": [...]} for a nested record,
+# or {"name": ..., "items": [...]} for a list of records
+Field = Union[str, Dict[str, Any]]
+
+
+def schema_id_for(fields: List[Field]) -> str:
+    """
+    Derive a stable id from the fields of a schema.
+    """
+    return hashlib.sha1(json.dumps(fields, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def _compile(fields: List[Field]):
+    """
+    Build the encoder and decoder of a record with the given fields.
+    """
+    names = [field if isinstance(field, str) else field["name"] for field in fields]
+    encoders: List[tuple] = []
+    decoders: List[tuple] = []
+    for index, field in enumerate(fields):
+        if isinstance(field, str):
+            continue
+        if "fields" in field:
+            encode, decode = _compile(field["fields"])
+        elif "items" in field:
+            encode, decode = _compile_list(field["items"])
+        else:
+            continue
+        encoders.append((index, encode))
+        decoders.append((index, decode))
+
+    # itemgetter pulls all values out of the dict in one C call
+    getter = itemgetter(*names) if len(names) > 1 else (lambda record: (record[names[0]],))
+    known = set(names)
+
+    def encode(record: Dict[str, Any]) -> List[Any]:
+        if not known.issuperset(record):
+            unknown = set(record) - known
+            raise ValueError(f"Fields not in schema: {', '.join(sorted(unknown))}")
+        try:
+            values = list(getter(record))
+        except KeyError:
+            values = [record.get(name) for name in names]  # Missing fields travel as null
+        for index, nested in encoders:
+            if values[index] is not None:
+                values[index] = nested(values[index])
+        return values
+
+    def decode(values: List[Any]) -> Dict[str, Any]:
+        if not isinstance(values, list) or len(values) != len(names):
+            raise ValueError(f"Expected a list of {len(names)} values, got {values!r}")
+        if decoders:
+            values = list(values)
+            for index, nested in decoders:
+                if values[index] is not None:
+                    values[index] = nested(values[index])
+        return dict(zip(names, values))
+
+    return encode, decode
+
+
+def _compile_list(fields: List[Field]):
+    encode, decode = _compile(fields)
+
+    def decode_rows(rows: List[Any]) -> List[Dict[str, Any]]:
+        if not isinstance(rows, list):
+            raise ValueError(f"Expected a list of records, got {rows!r}")
+        return [decode(row) for row in rows]
+
+    return (lambda records: [encode(record) for record in records]), decode_rows
+
+
+class CompiledSchema:
+    """
+    Positional codec for records of a fixed shape.
+
+    Records are encoded as lists of their values in schema order, so field
+    names are not repeated in every payload; nested records and lists of
+    records are encoded the same way.
+    """
+
+    def __init__(self, schema_id: str, fields: List[Field]):
+        self.schema_id = schema_id
+        self.fields = fields
+        self._encode, self._decode = _compile(fields)
+
+    def encode(self, record: Dict[str, Any]) -> List[Any]:
+        """
+        Turn a record into its positional form. Raises ValueError for fields the schema does not know.
+        """
+        return self._encode(record)
+
+    def decode(self, values: List[Any]) -> Dict[str, Any]:
+        """
+        Rebuild a record from its positional form. Raises ValueError when the values do not match the schema.
+        """
+        return self._decode(values)
+
+
+class SchemaRegistry:
+    """
+    Schemas by id, kept as JSON files in a directory and compiled once per process.
+
+    With a ``url``, schemas missing locally are fetched from a registry service
+    (``GET {url}/schemas/{id}``) and mirrored into the directory, and newly
+    registered schemas are published to it (``POST {url}/schemas``).
+    """
+
+    def __init__(self, directory: Optional[str] = None, url: Optional[str] = None, timeout: float = 5.0):
+        """
+        :param directory: Directory holding one ``{id}.json`` file per schema.
+        :param url: Base URL of a registry service to mirror schemas from.
+        :param timeout: Seconds to wait for the registry service.
+        """
+        self.directory = directory
+        self.url = url.rstrip("/") if url else None
+        self.timeout = timeout
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._compiled: Dict[str, CompiledSchema] = {}
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, schema_id: str) -> str:
+        return os.path.join(self.directory, f"{schema_id}.json")
+
+    def _store(self, document: Dict[str, Any]):
+        temporary_path = self._path(document["id"]) + ".tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(document, file)
+        os.replace(temporary_path, self._path(document["id"]))
+
+    def register(self, fields: List[Field], schema_id: Optional[str] = None) -> str:
+        """
+        Store a schema and return its id, derived from the fields unless given.
+        """
+        schema_id = schema_id or schema_id_for(fields)
+        document = {"id": schema_id, "fields": fields}
+        if self.directory:
+            self._store(document)
+        if self.url:
+            response = requests.post(f"{self.url}/schemas", json=document, timeout=self.timeout)
+            response.raise_for_status()
+        with self._lock:
+            self._compiled[schema_id] = CompiledSchema(schema_id, fields)
+        return schema_id
+
+    def get(self, schema_id: str) -> CompiledSchema:
+        """
+        Return the compiled schema of an id, loading it on first use.
+        Raises KeyError when no copy of the schema can be found.
+        """
+        compiled = self._compiled.get(schema_id)
+        if compiled is not None:
+            return compiled
+        document = self._load(schema_id)
+        with self._lock:
+            compiled = self._compiled.setdefault(schema_id, CompiledSchema(schema_id, document["fields"]))
+        return compiled
+
+    def _load(self, schema_id: str) -> Dict[str, Any]:
+        if self.directory and os.path.exists(self._path(schema_id)):
+            with open(self._path(schema_id)) as file:
+                return json.load(file)
+        if self.url:
+            try:
+                response = requests.get(f"{self.url}/schemas/{schema_id}", timeout=self.timeout)
+                if response.status_code == 200:
+                    document = response.json()
+                    if self.directory:
+                        self._store(dict(document, id=schema_id))  # Mirror so later processes need no round trip
+                    return document
+            except requests.RequestException as e:
+                self.logger.error("Failed to fetch schema %s: %s", schema_id, e)
+        raise KeyError(f"Unknown schema: {schema_id}")
+
+    def encode(self, schema_id: str, record: Dict[str, Any]) -> List[Any]:
+        return self.get(schema_id).encode(record)
+
+    def decode(self, schema_id: str, values: List[Any]) -> Dict[str, Any]:
+        return self.get(schema_id).decode(values)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"compiled": len(self._compiled)}
+
+
+def create_schema_registry(registry: Union["SchemaRegistry", str, None], url: Optional[str] = None) -> Optional[SchemaRegistry]:
+    """
+    Build a registry from a directory path and/or service URL, or pass an existing one through.
+    """
+    if isinstance(registry, SchemaRegistry):
+        return registry
+    if registry is None and url is None:
+        return None
+    return SchemaRegistry(directory=registry, url=url)
@@ -0,0 +1,149 @@
+# tests/test_chunking.py
+
+import os
+import json
+import random
+import shutil
+import unittest
+from connectiva import Connectiva, Message
+from connectiva.chunking import Chunker, Reassembler
+
+
+class TestChunking(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.abspath("test_chunks")
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.test_dir, True)
+
+    def _connectiva(self, **kwargs):
+        connectiva = Connectiva(
+            endpoint=f"file://{self.test_dir}",
+            directory=self.test_dir,
+            chunk_size=1000,
+            **kwargs
+        )
+        connectiva.connect()
+        self.addCleanup(connectiva.disconnect)
+        return connectiva
+
+    def test_small_message_is_not_chunked(self):
+        message = Message(action="send", data={"key": "value"})
+        self.assertEqual(Chunker(1000).split(message), [message])
+
+    def test_send_and_reassemble(self):
+        connectiva = self._connectiva()
+        message = Message(action="send", data={"blob": "é" * 5000}, metadata={"source": "test"})
+        result = connectiva.send(message)
+        self.assertEqual(result["status"], "sent")
+        self.assertGreater(result["chunks"], 1)
+
+        received = connectiva.receive()
+        self.assertEqual(received, message)
+        self.assertEqual(connectiva.chunk_stats()["completed"], 1)
+        self.assertEqual(connectiva.chunk_stats()["buffered_bytes"], 0)
+
+    def test_out_of_order_and_interleaved(self):
+        chunks = Chunker(100).split(Message(action="send", data="x" * 1000))
+        random.Random(7).shuffle(chunks)
+        reassembler = Reassembler()
+        other = Message(action="send", data="small")
+
+        results = [reassembler.add(chunk) for chunk in chunks[:3]]
+        results.append(reassembler.add(other))
+        results += [reassembler.add(chunk) for chunk in chunks[3:]]
+
+        complete = [result for result in results if result is not None]
+        self.assertEqual(complete[0], other)
+        self.assertEqual(complete[1], Message(action="send", data="x" * 1000))
+
+    def test_envelope_shape_is_preserved(self):
+        # Broker protocols return the sent envelope as the data of a "receive" message
+        reassembler = Reassembler()
+        original = Message(action="send", data="y" * 500)
+        chunks = Chunker(100).split(original)
+        for offset, chunk in enumerate(chunks):
+            received = Message(action="receive", data=chunk.__dict__, metadata={"offset": offset})
+            complete = reassembler.add(received)
+        self.assertEqual(complete.action, "receive")
+        self.assertEqual(complete.data, original.__dict__)
+        self.assertEqual(complete.metadata["offset"], len(chunks) - 1)
+        self.assertEqual(complete.metadata["chunk_acks"], [{"offset": n} for n in range(len(chunks))])
+
+    def test_escaped_payload_stays_within_chunk_size(self):
+        # Quotes and backslashes double in size when JSON-encoded again by the protocol
+        chunks = Chunker(1000).split(Message(action="send", data='"\\' * 2000))
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(len(json.dumps(chunk.data)), 1000 + 2)
+
+    def test_ack_releases_every_chunk(self):
+        connectiva = self._connectiva(consumer_id="worker", auto_ack=False)
+        message = Message(action="send", data={"blob": "q" * 5000})
+        connectiva.send(message)
+        inflight = os.path.join(self.test_dir, ".inflight", "worker")
+
+        received = connectiva.receive()
+        self.assertEqual(received.data, message.data)
+        self.assertGreater(len(os.listdir(inflight)), 1)
+        connectiva.ack(received)
+        self.assertEqual(os.listdir(inflight), [])
+
+    def test_buffer_is_bounded(self):
+        reassembler = Reassembler(max_bytes=250)
+        first = Chunker(100).split(Message(action="send", data="a" * 500))
+        second = Chunker(100).split(Message(action="send", data="b" * 500))
+        reassembler.add(first[0])
+        reassembler.add(first[1])
+        reassembler.add(second[0])
+        reassembler.add(second[1])
+
+        stats = reassembler.stats()
+        self.assertLessEqual(stats["buffered_bytes"], 250)
+        self.assertEqual(stats["evicted"], 1)
+        self.assertEqual(stats["pending"], 1)
+
+    def test_incomplete_message_expires(self):
+        reassembler = Reassembler(timeout=0)
+        chunks = Chunker(100).split(Message(action="send", data="z" * 500))
+        reassembler.add(chunks[0])
+        reassembler.add(chunks[1])
+        self.assertEqual(reassembler.stats()["expired"], 1)
+
+    def test_receive_stream(self):
+        connectiva = self._connectiva(chunk_timeout=5)
+        message = Message(action="send", data=list(range(2000)))
+        connectiva.send(message)
+
+        pieces = list(connectiva.receive_stream())
+        self.assertGreater(len(pieces), 1)
+        self.assertLessEqual(max(len(piece) for piece in pieces), 1000)
+        self.assertEqual(Message(**json.loads("".join(pieces))), message)
+
+    def test_receive_stream_acks_every_chunk(self):
+        connectiva = self._connectiva(chunk_timeout=5, consumer_id="worker", auto_ack=False)
+        message = Message(action="send", data=list(range(2000)))
+        connectiva.send(message)
+        inflight = os.path.join(self.test_dir, ".inflight", "worker")
+
+        pieces = connectiva.receive_stream()
+        text = next(pieces)
+        self.assertGreater(len(os.listdir(inflight)), 0, "Chunks stay claimed while the stream is read.")
+        text += "".join(pieces)
+        self.assertEqual(Message(**json.loads(text)), message)
+        self.assertEqual(os.listdir(inflight), [])
+
+    def test_chunks_keep_routing_metadata(self):
+        chunks = Chunker(100).split(Message(action="send", data="r" * 500, metadata={"key": "order-7", "priority": 5}))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(chunk.metadata["key"] == "order-7" and chunk.metadata["priority"] == 5 for chunk in chunks))
+
+        unkeyed = Chunker(100).split(Message(action="send", data="r" * 500))
+        self.assertEqual({chunk.metadata["key"] for chunk in unkeyed}, {unkeyed[0].metadata["chunk"]["id"]})
+
+        reassembler = Reassembler()
+        results = [reassembler.add(chunk) for chunk in chunks]
+        self.assertEqual(results[-1].metadata, {"key": "order-7", "priority": 5})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+# tests/test_coalescer.py
+
+import json
+import time
+import unittest
+import threading
+from unittest import mock
+from connectiva import Connectiva, Message
+from connectiva.coalescer import Coalescer
+from connectiva.protocols.memory_protocol import MemoryProtocol, delete_queue
+
+
+class TestCoalescer(unittest.TestCase):
+    def setUp(self):
+        delete_queue()
+        self.addCleanup(delete_queue)
+
+    def test_concurrent_sends_are_batched(self):
+        connectiva = Connectiva(endpoint="memory://coalesced", coalesce_linger=0.05)
+        connectiva.connect()
+        results = [None] * 20
+
+        def sender(index):
+            results[index] = connectiva.send(Message(action="send", data=index))
+
+        threads = [threading.Thread(target=sender, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = connectiva.coalesce_stats()
+        connectiva.disconnect()
+
+        self.assertTrue(all(result["status"] == "sent" for result in results))
+        self.assertEqual(stats["messages"], 20)
+        self.assertLess(stats["batches"], 20)
+        received = sorted(connectiva.receive().data for _ in range(20))
+        self.assertEqual(received, list(range(20)))
+
+    def test_limits_split_batches(self):
+        batches = []
+
+        def send_batch(messages):
+            batches.append([message.data for message in messages])
+            return [{"status": "sent"} for _ in messages]
+
+        size = len(json.dumps(Message(action="send", data=0).__dict__))
+        coalescer = Coalescer(send_batch, linger=0.2, max_batch_size=3, max_batch_bytes=2 * size)
+        futures = [coalescer.submit(Message(action="send", data=i)) for i in range(5)]
+        coalescer.close()
+
+        self.assertTrue(all(future.result()["status"] == "sent" for future in futures))
+        self.assertEqual(batches, [[0, 1], [2, 3], [4]])
+
+    def test_each_caller_gets_its_own_result(self):
+        def send_batch(messages):
+            return [{"error": "odd"} if message.data % 2 else {"status": "sent"} for message in messages]
+
+        coalescer = Coalescer(send_batch, linger=0.05)
+        futures = [coalescer.submit(Message(action="send", data=i)) for i in range(4)]
+        coalescer.close()
+        self.assertEqual([future.result() for future in futures],
+                         [{"status": "sent"}, {"error": "odd"}, {"status": "sent"}, {"error": "odd"}])
+
+    def test_short_results_fail_the_rest(self):
+        coalescer = Coalescer(lambda messages: [{"status": "sent"}], linger=0.05)
+        futures = [coalescer.submit(Message(action="send", data=i)) for i in range(3)]
+        coalescer.close()
+        self.assertEqual(futures[0].result(timeout=1), {"status": "sent"})
+        self.assertIn("error", futures[1].result(timeout=1))
+        self.assertIn("error", futures[2].result(timeout=1))
+
+    def test_send_after_disconnect_does_not_block(self):
+        connectiva = Connectiva(endpoint="memory://closed", coalesce_linger=0.01)
+        connectiva.connect()
+        connectiva.disconnect()
+        self.assertIn("error", connectiva.coalescer.submit(Message(action="send", data=1)).result(timeout=1))
+
+        connectiva.connect()
+        self.assertEqual(connectiva.send(Message(action="send", data=2))["status"], "sent")
+        connectiva.disconnect()
+
+    def test_cannot_be_combined_with_outbox(self):
+        with self.assertRaises(ValueError):
+            Connectiva(endpoint="memory://both", coalesce_linger=0.01, outbox_dir="unused_outbox")
+
+    def test_flush_does_not_overlap_receive(self):
+        calls = {"running": 0, "overlapped": False}
+
+        def exclusive(method):
+            def call(*args, **kwargs):
+                calls["running"] += 1
+                calls["overlapped"] = calls["overlapped"] or calls["running"] > 1
+                try:
+                    time.sleep(0.02)
+                    return method(*args, **kwargs)
+                finally:
+                    calls["running"] -= 1
+            return call
+
+        for name in ("send_batch", "receive"):
+            patch = mock.patch.object(MemoryProtocol, name, exclusive(getattr(MemoryProtocol, name)))
+            patch.start()
+            self.addCleanup(patch.stop)
+        connectiva = Connectiva(endpoint="memory://locked", coalesce_linger=0.01)
+        connectiva.connect()
+        senders = [threading.Thread(target=connectiva.send, args=(Message(action="send", data=i),)) for i in range(10)]
+        for sender in senders:
+            sender.start()
+            connectiva.receive()
+        for sender in senders:
+            sender.join()
+        connectiva.disconnect()
+        self.assertFalse(calls["overlapped"], "The flush thread should not use the strategy during receive().")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# tests/test_codec.py
+
+import os
+import shutil
+import unittest
+from connectiva import Connectiva, Message
+from connectiva.codec import CodecPool, dumps, loads, _executor
+
+
+class TestCodecPool(unittest.TestCase):
+    def test_small_values_are_encoded_inline(self):
+        codec = CodecPool(processes=2, threshold=1024)
+        self.assertEqual(loads(codec.encode({"a": 1}).result()), {"a": 1})
+        self.assertEqual(codec.stats()["inline"], 1)
+        self.assertEqual(codec.stats()["offloaded"], 0)
+
+    def test_large_values_are_offloaded_and_compressed(self):
+        codec = CodecPool(processes=2, threshold=1024, compression_level=6)
+        value = {"action": "send", "data": ["x" * 100] * 100, "metadata": {}}
+        encoded = codec.encode(value).result()
+        self.assertLess(len(encoded), len(dumps(value)))
+        self.assertEqual(loads(encoded), value)
+        self.assertEqual(codec.decode(encoded).result(), value)
+        self.assertEqual(codec.stats()["offloaded"], 1)
+        self.assertEqual(codec.stats()["inline"], 1)  # The compressed form is below the threshold
+
+    def test_loads_accepts_text_and_views(self):
+        self.assertEqual(loads('{"a": 1}'), {"a": 1})
+        self.assertEqual(loads(memoryview(b'{"a": 1}')), {"a": 1})
+
+    def test_workers_are_spawned(self):
+        # Forked workers could inherit locks held by the parent's threads
+        self.assertEqual(_executor(1)._mp_context.get_start_method(), "spawn")
+
+    def test_errors_surface_through_the_future(self):
+        codec = CodecPool(processes=1, threshold=1024)
+        with self.assertRaises(TypeError):
+            codec.encode({"data": object()}).result()
+
+
+class TestFileProtocolWithCodec(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.abspath("test_codec")
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.test_dir, True)
+
+    def test_pipelined_batch_roundtrip(self):
+        producer = Connectiva(endpoint=f"file://{self.test_dir}", directory=self.test_dir,
+                              codec_processes=2, codec_threshold=4096, compression_level=1)
+        consumer = Connectiva(endpoint=f"file://{self.test_dir}", directory=self.test_dir)
+        producer.connect()
+        consumer.connect()
+        self.addCleanup(producer.disconnect)
+        self.addCleanup(consumer.disconnect)
+
+        messages = [Message(action="send", data={"index": i, "blob": "y" * (i % 2) * 10000}) for i in range(10)]
+        results = producer.send_batch(messages)
+        self.assertTrue(all(result["status"] == "file_written" for result in results))
+        self.assertEqual(producer.strategy.codec.stats()["offloaded"], 5)
+
+        # Receivers without a codec pool still read compressed messages
+        received = [consumer.receive() for _ in range(10)]
+        self.assertEqual([message.data["index"] for message in received], list(range(10)))
+        self.assertEqual(received[1].data["blob"], "y" * 10000)
+
+    def test_batch_encodes_a_bounded_window_ahead(self):
+        producer = Connectiva(endpoint=f"file://{self.test_dir}", directory=self.test_dir, codec_processes=1)
+        producer.connect()
+        self.addCleanup(producer.disconnect)
+        strategy = producer.strategy
+        encode, send = strategy._encode_message, strategy._send_encoded
+        encoded, ahead = [], []
+
+        def counting_encode(message):
+            encoded.append(message)
+            return encode(message)
+
+        def counting_send(message, body):
+            ahead.append(len(encoded) - len(ahead))
+            return send(message, body)
+
+        strategy._encode_message, strategy._send_encoded = counting_encode, counting_send
+        producer.send_batch([Message(action="send", data=i) for i in range(10)])
+
+        self.assertEqual(len(ahead), 10)
+        self.assertLessEqual(max(ahead), 3, "At most two messages per worker should be encoded ahead.")
+
+
+if __name__ == "__main__":
+    unittest.main()
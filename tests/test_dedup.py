@@ -0,0 +1,75 @@
+# tests/test_dedup.py
+
+import os
+import shutil
+import unittest
+from connectiva import Connectiva, Message
+from connectiva.dedup import LRUDeduplicator, BloomDeduplicator
+
+
+class TestDeduplication(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.abspath("test_dedup")
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.test_dir, True)
+
+    def test_duplicates_are_dropped_on_receive(self):
+        connectiva = Connectiva(
+            endpoint=f"file://{self.test_dir}",
+            directory=self.test_dir,
+            message_ids=True,
+            dedup="lru"
+        )
+        connectiva.connect()
+        message = Message(action="send", data={"n": 1}, metadata={"message_id": "order-1"})
+        connectiva.send(message)
+        connectiva.send(message)  # Redelivery of the same message
+        connectiva.send(Message(action="send", data={"n": 2}))
+
+        first = connectiva.receive()
+        second = connectiva.receive()
+        third = connectiva.receive()
+        connectiva.disconnect()
+
+        self.assertEqual({first.data["n"], second.data["n"]}, {1, 2})
+        self.assertTrue(all("message_id" in m.metadata for m in (first, second)))
+        self.assertEqual(third.action, "error")
+        stats = connectiva.dedup_stats()
+        self.assertEqual(stats["duplicates"], 1)
+        self.assertAlmostEqual(stats["duplicate_rate"], 1 / 3)
+
+    def test_lru_capacity_and_window(self):
+        dedup = LRUDeduplicator(capacity=2)
+        self.assertFalse(dedup.seen("a"))
+        self.assertFalse(dedup.seen("b"))
+        self.assertFalse(dedup.seen("c"))  # Evicts "a"
+        self.assertTrue(dedup.seen("c"))
+        self.assertFalse(dedup.seen("a"))
+
+        dedup = LRUDeduplicator(window=0)
+        self.assertFalse(dedup.seen("a"))
+        self.assertFalse(dedup.seen("a"))
+
+    def test_bloom_filter(self):
+        dedup = BloomDeduplicator(capacity=10_000, error_rate=0.001)
+        for i in range(5000):
+            self.assertFalse(dedup.seen(f"id-{i}"))
+        self.assertTrue(all(dedup.seen(f"id-{i}") for i in range(4000, 5000)))
+        false_positives = sum(dedup.seen(f"other-{i}") for i in range(2000))
+        self.assertLess(false_positives, 20)
+        self.assertLess(dedup.stats()["memory_bytes"], 20_000)
+
+    def test_state_survives_restart(self):
+        for cls in (LRUDeduplicator, BloomDeduplicator):
+            path = os.path.join(self.test_dir, f"{cls.__name__}.json")
+            dedup = cls(path=path)
+            dedup.seen("order-1")
+            dedup.close()
+
+            restored = cls(path=path)
+            self.assertTrue(restored.seen("order-1"))
+            self.assertFalse(restored.seen("order-2"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,7 @@ import unittest
 import os
 import shutil
 import logging
+import time
 import threading
 from connectiva.connectiva import Connectiva
 from connectiva.message import Message
@@ -147,6 +148,214 @@ class TestFileProtocolWithConnectiva(unittest.TestCase):
             self.assertIn(expected, received_messages, "Locking mechanism failed; message not read correctly.")
 
 
+class TestFileSpoolRetention(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.abspath("test_spool")
+        self.processed_dir = os.path.abspath("test_spool_processed")
+        for directory in (self.test_dir, self.processed_dir):
+            shutil.rmtree(directory, ignore_errors=True)
+            self.addCleanup(shutil.rmtree, directory, True)
+
+    def _connectiva(self, **kwargs):
+        connectiva = Connectiva(endpoint=f"file://{self.test_dir}", directory=self.test_dir, **kwargs)
+        connectiva.connect()
+        self.addCleanup(connectiva.disconnect)
+        return connectiva
+
+    def test_messages_are_received_in_send_order(self):
+        connectiva = self._connectiva()
+        for i in range(10):
+            connectiva.send(Message(action="send", data=i))
+        self.assertEqual([connectiva.receive().data for _ in range(10)], list(range(10)))
+
+    def test_sharded_spool(self):
+        connectiva = self._connectiva(shards=4, processed_directory=self.processed_dir)
+        for i in range(40):
+            connectiva.send(Message(action="send", data=i))
+
+        shards = sorted(os.listdir(self.test_dir))
+        self.assertEqual(shards, ["0", "1", "2", "3"])
+        self.assertEqual(sum(len(os.listdir(os.path.join(self.test_dir, shard))) for shard in shards), 40)
+
+        received = [connectiva.receive().data for _ in range(40)]
+        self.assertEqual(sorted(received), list(range(40)))
+        self.assertEqual(connectiva.receive().action, "error")
+        self.assertEqual(sum(len(os.listdir(os.path.join(self.test_dir, shard))) for shard in shards), 0)
+        processed = sum(len(files) for _, _, files in os.walk(self.processed_dir))
+        self.assertEqual(processed, 40)
+
+    def test_retention_by_count_and_bytes(self):
+        connectiva = self._connectiva(processed_directory=self.processed_dir, retention_count=5)
+        for i in range(12):
+            connectiva.send(Message(action="send", data=i))
+            connectiva.receive()
+
+        result = connectiva.strategy.compact()
+        self.assertEqual(result["deleted"], 7)
+        self.assertEqual(len(os.listdir(self.processed_dir)), 5)
+
+        connectiva.strategy.retention_bytes = 0
+        connectiva.strategy.compact()
+        self.assertEqual(os.listdir(self.processed_dir), [])
+
+    def test_background_compaction_by_age(self):
+        connectiva = self._connectiva(retention_age=0, compaction_interval=0.05)
+        connectiva.send(Message(action="send", data=1))
+        connectiva.receive()
+
+        deadline = time.monotonic() + 5
+        while os.listdir(self.test_dir) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(os.listdir(self.test_dir), [])
+
+
+class TestFileMultiConsumer(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.abspath("test_claims")
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.test_dir, True)
+
+    def _connectiva(self, **kwargs):
+        connectiva = Connectiva(endpoint=f"file://{self.test_dir}", directory=self.test_dir, **kwargs)
+        connectiva.connect()
+        self.addCleanup(connectiva.disconnect)
+        return connectiva
+
+    def test_consumers_split_the_work(self):
+        producer = self._connectiva(shards=4)
+        for i in range(100):
+            producer.send(Message(action="send", data=i))
+
+        results = {}
+
+        def consume(index):
+            consumer = self._connectiva(shards=4, consumer_id=f"c{index}", consumers=2, consumer_index=index, claim_batch=5)
+            received = []
+            while True:
+                message = consumer.receive()
+                if message.action == "error":
+                    break
+                received.append(message.data)
+            results[index] = received
+
+        threads = [threading.Thread(target=consume, args=(i,)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results[0] + results[1]), list(range(100)))
+        self.assertTrue(results[0] and results[1], "Both consumers should get their shards' messages.")
+
+    def test_crashed_consumer_work_is_recovered(self):
+        producer = self._connectiva()
+        producer.send(Message(action="send", data="important"))
+
+        crashed = self._connectiva(consumer_id="crashed", auto_ack=False, lease_timeout=0.2)
+        self.assertEqual(crashed.receive().data, "important")  # Never acknowledged
+
+        survivor = self._connectiva(consumer_id="survivor", lease_timeout=0.2)
+        self.assertEqual(survivor.receive().action, "error")
+        time.sleep(0.3)
+        self.assertEqual(survivor.strategy.recover(), 1)
+        self.assertEqual(survivor.receive().data, "important")
+
+    def test_recovery_skips_stray_files(self):
+        producer = self._connectiva()
+        producer.send(Message(action="send", data="important"))
+        crashed = self._connectiva(consumer_id="crashed", auto_ack=False, lease_timeout=0.2)
+        self.assertEqual(crashed.receive().data, "important")
+        with open(os.path.join(self.test_dir, ".inflight", "stray.txt"), "w") as file:
+            file.write("not a consumer")
+
+        time.sleep(0.3)
+        self.assertEqual(crashed.strategy.recover(), 1)
+
+    def test_ack_releases_claim(self):
+        producer = self._connectiva()
+        producer.send(Message(action="send", data=1))
+        consumer = self._connectiva(consumer_id="worker", auto_ack=False, lease_timeout=0.1)
+        message = consumer.receive()
+        consumer.ack(message)
+
+        time.sleep(0.2)
+        self.assertEqual(consumer.strategy.recover(), 0)
+        self.assertEqual(os.listdir(os.path.join(self.test_dir, ".inflight", "worker")), [])
+
+    def test_batch_claim(self):
+        producer = self._connectiva()
+        for i in range(10):
+            producer.send(Message(action="send", data=i))
+        consumer = self._connectiva(consumer_id="batch", claim_batch=4)
+        self.assertEqual(consumer.receive().data, 0)
+        self.assertEqual(len(os.listdir(os.path.join(self.test_dir, ".inflight", "batch"))), 3)
+        self.assertEqual([consumer.receive().data for _ in range(9)], list(range(1, 10)))
+
+    def test_unreadable_file_does_not_block_the_spool(self):
+        producer = self._connectiva()
+        with open(os.path.join(self.test_dir, "msg_00000000000000000000_broken.json"), "w") as file:
+            file.write("{not json")
+        producer.send(Message(action="send", data="next"))
+        self.assertEqual(producer.receive().data, "next")
+
+
+class TestFilePriorityLanes(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.abspath("test_lanes")
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        self.connectiva = Connectiva(endpoint=f"file://{self.test_dir}", directory=self.test_dir, priority_lanes=2)
+        self.connectiva.connect()
+        self.addCleanup(shutil.rmtree, self.test_dir, True)
+        self.addCleanup(self.connectiva.disconnect)
+
+    def test_urgent_message_overtakes_backlog(self):
+        for i in range(20):
+            self.connectiva.send(Message(action="bulk", data=i))
+        self.connectiva.send(Message(action="control", data="stop", metadata={"priority": 1}))
+
+        self.assertEqual(self.connectiva.receive().action, "control")
+        self.assertEqual([self.connectiva.receive().data for _ in range(20)], list(range(20)))
+
+    def test_lanes_share_by_weight(self):
+        for i in range(30):
+            self.connectiva.send(Message(action="bulk", data=i))
+            self.connectiva.send(Message(action="control", data=i, metadata={"priority": 1}))
+
+        first = [self.connectiva.receive().action for _ in range(30)]
+        self.assertEqual(first.count("control"), 20)
+        self.assertEqual(first.count("bulk"), 10, "The low lane should not starve.")
+
+    def test_lane_weights_must_match_lanes(self):
+        with self.assertRaises(ValueError):
+            Connectiva(endpoint=f"file://{self.test_dir}", directory=self.test_dir, priority_lanes=3, lane_weights=[1, 2])
+
+
+class TestFileRawRelay(unittest.TestCase):
+    def setUp(self):
+        self.source_dir = os.path.abspath("test_raw_source")
+        self.target_dir = os.path.abspath("test_raw_target")
+        for directory in (self.source_dir, self.target_dir):
+            shutil.rmtree(directory, ignore_errors=True)
+            self.addCleanup(shutil.rmtree, directory, True)
+
+    def test_relay_without_decoding(self):
+        source = Connectiva(endpoint=f"file://{self.source_dir}", directory=self.source_dir)
+        target = Connectiva(endpoint=f"file://{self.target_dir}", directory=self.target_dir)
+        message = Message(action="send", data={"key": "value"}, metadata={"origin": "source"})
+        source.send(message)
+
+        raw = source.receive_raw()
+        self.assertIsInstance(raw.data, bytes)
+        self.assertEqual(target.send_raw(memoryview(raw.data))["status"], "file_written")
+        self.assertEqual(target.receive(), message)
+        self.assertEqual(source.receive_raw().action, "error")
+
+    def test_unsupported_protocol(self):
+        connectiva = Connectiva(endpoint="grpc://localhost:50051")
+        self.assertIn("error", connectiva.send_raw(b"{}"))
+        self.assertEqual(connectiva.receive_raw().action, "error")
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -0,0 +1,257 @@
+# tests/test_graphql_protocol.py
+
+import json
+import time
+import asyncio
+import hashlib
+import unittest
+import threading
+import websockets
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from connectiva import Connectiva, Message
+from connectiva.protocols.graphql_protocol import _OperationBatcher
+from connectiva.protocols.graphql_subscriptions import SubscriptionClient
+
+
+class _GraphQLHandler(BaseHTTPRequestHandler):
+    """
+    Minimal GraphQL endpoint supporting array batching and Automatic Persisted Queries.
+    """
+    posts = []
+    persisted = {}
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).posts.append(body)
+        if isinstance(body, list):
+            result = [self._execute(operation) for operation in body]
+        else:
+            result = self._execute(body)
+        encoded = json.dumps(result).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def _execute(self, operation):
+        persisted_query = (operation.get("extensions") or {}).get("persistedQuery")
+        query = operation.get("query")
+        if persisted_query:
+            digest = persisted_query["sha256Hash"]
+            if query is not None:
+                assert hashlib.sha256(query.encode()).hexdigest() == digest
+                type(self).persisted[digest] = query
+            elif digest not in self.persisted:
+                return {"errors": [{"message": "PersistedQueryNotFound"}]}
+            query = self.persisted[digest]
+        return {"data": {"echo": query, "variables": operation.get("variables")}}
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestGraphQLProtocol(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _GraphQLHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.graphql_url = f"http://127.0.0.1:{cls.server.server_address[1]}/graphql"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _GraphQLHandler.posts = []
+        _GraphQLHandler.persisted = {}
+
+    def _connectiva(self, **kwargs):
+        return Connectiva(endpoint="graphql://local", graphql_url=self.graphql_url, **kwargs)
+
+    def test_send_batch_posts_once(self):
+        connectiva = self._connectiva()
+        messages = [Message(action="query", data={"query": f"{{ item{i} }}"}) for i in range(3)]
+        results = connectiva.strategy.send_batch(messages)
+
+        self.assertEqual(len(_GraphQLHandler.posts), 1, "Batch should be a single array POST.")
+        self.assertEqual([r["data"]["echo"] for r in results], [f"{{ item{i} }}" for i in range(3)])
+
+    def test_send_within_window_is_batched(self):
+        connectiva = self._connectiva(batch_interval=0.2, max_batch_size=10)
+        results = [None] * 4
+
+        def sender(index):
+            message = Message(action="query", data={"query": "{ item }", "variables": {"i": index}})
+            results[index] = connectiva.send(message)
+
+        threads = [threading.Thread(target=sender, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        connectiva.disconnect()
+
+        self.assertEqual(len(_GraphQLHandler.posts), 1)
+        self.assertEqual([r["data"]["variables"]["i"] for r in results], [0, 1, 2, 3])
+
+    def test_missing_batch_results_fail_their_operations(self):
+        batcher = _OperationBatcher(lambda payloads: [{"data": 1}], 0.2, 10)
+        futures = [batcher.submit({"query": "{ item }"}) for _ in range(3)]
+        batcher.close()
+
+        results = [future.result(timeout=1) for future in futures]
+        self.assertEqual(results[0], {"data": 1})
+        self.assertTrue(all("error" in result for result in results[1:]))
+        self.assertIsNot(results[1], results[2])
+
+    def test_persisted_query_falls_back_to_full_text(self):
+        connectiva = self._connectiva(persisted_queries=True)
+        message = Message(action="query", data={"query": "{ hero { name } }"})
+
+        first = connectiva.send(message)
+        second = connectiva.send(message)
+
+        self.assertEqual(first["data"]["echo"], "{ hero { name } }")
+        self.assertEqual(second, first)
+        # Hash only, full text on PersistedQueryNotFound, then hash only again
+        self.assertEqual(["query" in post for post in _GraphQLHandler.posts], [False, True, False])
+
+
+class TestGraphQLSubscriptions(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+        cls.loop_thread = threading.Thread(target=cls.loop.run_forever, daemon=True)
+        cls.loop_thread.start()
+        cls.server = asyncio.run_coroutine_threadsafe(cls._serve(), cls.loop).result()
+        port = cls.server.sockets[0].getsockname()[1]
+        cls.graphql_url = f"http://127.0.0.1:{port}/graphql"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+        asyncio.run_coroutine_threadsafe(cls.server.wait_closed(), cls.loop).result()
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.loop_thread.join()
+        cls.loop.close()
+
+    @classmethod
+    async def _serve(cls):
+        return await websockets.serve(cls._handler, "127.0.0.1", 0, subprotocols=["graphql-transport-ws"])
+
+    @staticmethod
+    async def _handler(websocket, path):
+        """
+        Acknowledge the connection and push three results per subscription.
+        A "garbled" subscription is preceded by a malformed frame, and the socket
+        is closed after a "drop" subscription.
+        """
+        init = json.loads(await websocket.recv())
+        assert init["type"] == "connection_init"
+        await websocket.send(json.dumps({"type": "connection_ack"}))
+        async for raw in websocket:
+            frame = json.loads(raw)
+            if frame["type"] != "subscribe":
+                continue
+            name = frame["payload"]["variables"]["name"]
+            if name == "garbled":
+                await websocket.send("not json")
+            for tick in range(3):
+                payload = {"data": {"tick": tick, "name": name}}
+                await websocket.send(json.dumps({"id": frame["id"], "type": "next", "payload": payload}))
+            await websocket.send(json.dumps({"id": frame["id"], "type": "complete"}))
+            if name == "drop":
+                await websocket.close()
+
+    def _connectiva(self):
+        return Connectiva(endpoint="graphql://local", graphql_url=self.graphql_url, receive_timeout=2)
+
+    def test_subscription_iterator(self):
+        connectiva = self._connectiva()
+        message = Message(
+            action="subscribe",
+            data={"query": "subscription ($name: String) { tick }", "variables": {"name": "a"}}
+        )
+        subscription = connectiva.strategy.subscribe(message)
+        ticks = [result.data["data"]["tick"] for result in subscription]
+        connectiva.disconnect()
+
+        self.assertEqual(ticks, [0, 1, 2])
+        self.assertTrue(subscription.completed)
+
+    def _ticks(self, connectiva, name):
+        message = Message(
+            action="subscribe",
+            data={"query": "subscription ($name: String) { tick }", "variables": {"name": name}}
+        )
+        return [result.data["data"]["tick"] for result in connectiva.strategy.subscribe(message)]
+
+    def test_malformed_frame_is_skipped(self):
+        connectiva = self._connectiva()
+        self.addCleanup(connectiva.disconnect)
+        self.assertEqual(self._ticks(connectiva, "garbled"), [0, 1, 2])
+        self.assertEqual(self._ticks(connectiva, "a"), [0, 1, 2])
+
+    def test_dropped_socket_is_replaced(self):
+        connectiva = self._connectiva()
+        self.addCleanup(connectiva.disconnect)
+        self.assertEqual(self._ticks(connectiva, "drop"), [0, 1, 2])
+        dropped = connectiva.strategy._subscription_client
+        for _ in range(100):
+            if not dropped.connected:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(self._ticks(connectiva, "a"), [0, 1, 2])
+        self.assertIsNot(connectiva.strategy._subscription_client, dropped)
+        self.assertIsNone(dropped._thread, "The dropped client's event loop should be stopped.")
+
+    def test_profiled_subscription_completes_its_sample(self):
+        connectiva = Connectiva(endpoint="graphql://local", graphql_url=self.graphql_url, profile_sample_rate=1.0)
+        self.addCleanup(connectiva.disconnect)
+        message = Message(action="query", data={"query": "subscription ($name: String) { tick }", "variables": {"name": "a"}})
+        self.assertEqual(connectiva.send(message)["status"], "subscribed")
+
+        self.assertEqual(len(connectiva.profiler._inflight), 0)
+        self.assertEqual(connectiva.profile_stats()["total"]["count"], 1)
+
+    def test_subscribe_without_socket_fails_cleanly(self):
+        client = SubscriptionClient(self.graphql_url.replace("http", "ws", 1))
+        client.connect()
+        self.addCleanup(client.close)
+        payload = {"query": "subscription { tick }", "variables": {"name": "a"}}
+
+        async def failing_send(frame):
+            raise ConnectionError("socket gone")
+
+        client.websocket.send = failing_send
+        with self.assertRaises(ConnectionError):
+            client.subscribe(payload)
+        self.assertEqual(client._subscriptions, {}, "A subscription that was never sent should not stay registered.")
+
+        websocket, client.websocket = client.websocket, None
+        with self.assertRaises(ConnectionError):
+            client.subscribe(payload)
+        client.websocket = websocket
+
+    def test_multiplexed_receive(self):
+        connectiva = self._connectiva()
+        for name in ("a", "b"):
+            message = Message(
+                action="query",
+                data={"query": "subscription ($name: String) { tick }", "variables": {"name": name}}
+            )
+            self.assertEqual(connectiva.send(message)["status"], "subscribed")
+
+        received = [connectiva.receive() for _ in range(6)]
+        connectiva.disconnect()
+
+        names = sorted(message.data["data"]["name"] for message in received)
+        self.assertEqual(names, ["a", "a", "a", "b", "b", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
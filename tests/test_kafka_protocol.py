@@ -1,7 +1,13 @@
+import json
+import queue
 import unittest
+import threading
 import time
 import logging
+from unittest import mock
 from connectiva import Connectiva, Message
+from kafka.errors import KafkaError
+from connectiva.protocols.kafka_protocol import KafkaProtocol
 
 
 class TestKafkaWithConnectiva(unittest.TestCase):
@@ -68,6 +74,209 @@ class TestKafkaWithConnectiva(unittest.TestCase):
         self.assertEqual(received_message.action, "error", "Action should be 'error' when no message is found")
         self.assertIn("No message found", received_message.metadata.get("error", ""), "Error metadata should indicate no message found")
 
+    def test_key_and_headers(self):
+        self.connectiva.seek_to_end()
+        sent_message = Message(
+            action="send",
+            data={"order": 42},
+            metadata={"key": "customer-7", "headers": {"codec": "json"}, "source": "test"}
+        )
+        send_result = self.connectiva.send(sent_message)
+        self.assertEqual(send_result["status"], "sent")
+        self.assertEqual(send_result["partition"], 0)
+
+        time.sleep(2)
+        received_message = self.connectiva.receive()
+        self.assertEqual(received_message.metadata["key"], "customer-7")
+        self.assertEqual(received_message.metadata["headers"], {"codec": "json"})
+        self.assertEqual(received_message.metadata["offset"], send_result["offset"])
+        # Routing fields travel on the record, not inside the value
+        self.assertEqual(received_message.data["metadata"], {"source": "test"})
+
+    def test_reconnect_without_admin(self):
+        # The topic exists now, so a second client can skip topic creation entirely
+        connectiva = Connectiva(
+            endpoint='kafka://localhost:9092',
+            topic='test_topic',
+            group_id='test_group_warm',
+            create_topic=False,
+            warm_up=True
+        )
+        connectiva.connect()
+        try:
+            self.assertIsNotNone(connectiva.strategy.connect_time)
+            send_result = connectiva.send(Message(action="send", data={"warm": True}))
+            self.assertEqual(send_result["status"], "sent")
+        finally:
+            connectiva.disconnect()
+
+
+class TestKafkaProtocolMocked(unittest.TestCase):
+    """
+    Tests against mocked kafka-python clients, runnable without a broker.
+    """
+
+    def setUp(self):
+        patches = {
+            name: mock.patch(f"connectiva.protocols.kafka_protocol.{name}")
+            for name in ("KafkaProducer", "KafkaConsumer", "KafkaAdminClient")
+        }
+        self.mocks = {name: patch.start() for name, patch in patches.items()}
+        for patch in patches.values():
+            self.addCleanup(patch.stop)
+        self.producer = self.mocks["KafkaProducer"].return_value
+        self.producer.send.return_value.get.return_value = mock.Mock(partition=0, offset=1)
+
+    def _protocol(self, **kwargs):
+        protocol = KafkaProtocol(endpoint="kafka://broker:9092", topic="orders", create_topic=False, **kwargs)
+        protocol.connect()
+        self.addCleanup(protocol.disconnect)
+        return protocol
+
+    def test_received_partition_is_not_reused(self):
+        protocol = self._protocol()
+        # Metadata as returned by receive() on another topic
+        protocol.send(Message(action="send", data={}, metadata={"topic": "events", "partition": 7, "key": "k"}))
+        record = self.producer.send.call_args.kwargs
+        self.assertNotIn("partition", record)
+        self.assertEqual(record["key"], b"k")
+
+        protocol.send(Message(action="send", data={}, metadata={"target_partition": 2}))
+        self.assertEqual(self.producer.send.call_args.kwargs["partition"], 2)
+
+    def test_create_topic_false_skips_admin_client(self):
+        self._protocol()
+        self.mocks["KafkaAdminClient"].assert_not_called()
+
+    def test_admin_clients_are_closed(self):
+        admin = self.mocks["KafkaAdminClient"].return_value
+        admin.list_topics.return_value = []
+        with mock.patch.dict("connectiva.protocols.kafka_protocol._known_topics", clear=True):
+            protocol = KafkaProtocol(endpoint="kafka://broker:9092", topic="orders", create_topic=True)
+            protocol.connect()
+            admin.create_topics.assert_called_once()
+            self.assertEqual(admin.close.call_count, 1)
+
+            admin.list_topics.side_effect = KafkaError("broker down")
+            protocol.disconnect()
+            with self.assertRaises(KafkaError):
+                KafkaProtocol(endpoint="kafka://broker:9092", topic="other", create_topic=True).connect()
+        self.assertEqual(admin.close.call_count, self.mocks["KafkaAdminClient"].call_count)
+
+    def _records(self, protocol, *values):
+        protocol.consumer.__iter__.return_value = iter([
+            mock.Mock(topic="orders", partition=0, offset=offset, key=None, headers=[], timestamp=0, value=value)
+            for offset, value in enumerate(values)
+        ])
+
+    def test_raw_send_maps_routing_headers(self):
+        protocol = self._protocol()
+        protocol.send_raw(b"{}", {"key": "k", "target_partition": 1, "trace": "abc"})
+        record = self.producer.send.call_args.kwargs
+        self.assertEqual(record["value"], b"{}")
+        self.assertEqual(record["key"], b"k")
+        self.assertEqual(record["partition"], 1)
+        self.assertEqual(record["headers"], [("trace", b"abc")])
+
+    def test_raw_receive_and_unreadable_record(self):
+        protocol = self._protocol(group_id="readers")
+        self._records(protocol, b"not json", b'{"action": "send", "data": 1, "metadata": {}}')
+
+        unreadable = protocol.receive()
+        self.assertEqual(unreadable.action, "error")
+        self.assertEqual(unreadable.metadata["offset"], 0)
+        self.assertEqual(protocol.receive().data, {"action": "send", "data": 1, "metadata": {}})
+
+        self._records(protocol, b"not json")
+        self.assertEqual(protocol.receive_raw().data, b"not json")
+
+    def _responder(self, *extra):
+        """
+        Answer every request sent to the mocked producer on the mocked reply consumer,
+        after the raw ``extra`` record values.
+        """
+        replies = queue.Queue()
+
+        def poll(timeout_ms):
+            try:
+                return {"replies": [replies.get(timeout=timeout_ms / 1000)]}
+            except queue.Empty:
+                return {}
+
+        def send(topic, **record):
+            request = json.loads(record["value"])
+            for value in extra:
+                replies.put(mock.Mock(value=value))
+            reply = {"action": "reply", "data": request["data"], "metadata": {"correlation_id": request["metadata"]["correlation_id"]}}
+            replies.put(mock.Mock(value=json.dumps(reply).encode()))
+            return mock.Mock()
+
+        consumer = self.mocks["KafkaConsumer"].return_value
+        consumer.partitions_for_topic.return_value = {0}
+        consumer.poll.side_effect = poll
+        self.producer.send.side_effect = send
+
+    def test_request_reply_deletes_generated_reply_topic(self):
+        self._responder(b"not json")
+        protocol = self._protocol()
+
+        reply = protocol.request(Message(action="get", data={"id": 1}), timeout=1)
+        self.assertEqual((reply.action, reply.data), ("reply", {"id": 1}))
+
+        admin = self.mocks["KafkaAdminClient"].return_value
+        admin.delete_topics.assert_not_called()
+        protocol.disconnect()
+        admin.delete_topics.assert_called_once_with([protocol.reply_topic])
+        self.assertEqual(admin.close.call_count, self.mocks["KafkaAdminClient"].call_count)
+
+    def test_reply_consumer_waits_for_partition_metadata(self):
+        self._responder()
+        consumer = self.mocks["KafkaConsumer"].return_value
+        consumer.partitions_for_topic.side_effect = [None, set(), {0, 1, 2}]
+        protocol = self._protocol()
+
+        self.assertEqual(protocol.request(Message(action="get", data=1), timeout=1).data, 1)
+        assigned = consumer.assign.call_args.args[0]
+        self.assertEqual(sorted(partition.partition for partition in assigned), [0, 1, 2])
+
+    def test_configured_reply_topic_is_kept(self):
+        self._responder()
+        protocol = self._protocol(reply_topic="orders.replies")
+
+        self.assertEqual(protocol.request(Message(action="get", data=1), timeout=1).data, 1)
+        protocol.disconnect()
+        self.mocks["KafkaAdminClient"].return_value.delete_topics.assert_not_called()
+
+    def test_failed_reply_consumer_is_replaced(self):
+        self._responder()
+        consumer = self.mocks["KafkaConsumer"].return_value
+        poll, send = consumer.poll.side_effect, self.producer.send.side_effect
+        sent = threading.Event()
+        failed = threading.Event()
+
+        def failing_poll(timeout_ms):
+            if not failed.is_set():
+                # Fail once the first request is waiting for its reply
+                sent.wait()
+                failed.set()
+                raise KafkaError("connection lost")
+            return poll(timeout_ms)
+
+        def first_send_unanswered(topic, **record):
+            if not sent.is_set():
+                sent.set()
+                return mock.Mock()
+            return send(topic, **record)
+
+        consumer.poll.side_effect = failing_poll
+        self.producer.send.side_effect = first_send_unanswered
+        protocol = self._protocol()
+
+        error = protocol.request(Message(action="get", data=1), timeout=1)
+        self.assertEqual(error.action, "error")
+        self.assertIn("connection lost", error.metadata["error"])
+        self.assertEqual(protocol.request(Message(action="get", data=2), timeout=1).data, 2)
+
 
 if __name__ == '__main__':
     unittest.main()
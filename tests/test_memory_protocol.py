@@ -0,0 +1,107 @@
+# tests/test_memory_protocol.py
+
+import json
+import time
+import unittest
+import threading
+from connectiva import Connectiva, Message
+from connectiva.protocols.memory_protocol import delete_queue
+
+
+class TestMemoryProtocolWithConnectiva(unittest.TestCase):
+    def setUp(self):
+        delete_queue()
+        self.addCleanup(delete_queue)
+
+    def test_send_and_receive_by_reference(self):
+        producer = Connectiva(endpoint="memory://orders")
+        consumer = Connectiva(endpoint="memory://orders")
+        producer.connect()
+        consumer.connect()
+
+        message = Message(action="send", data={"key": "value"})
+        result = producer.send(message)
+        self.assertEqual(result["status"], "sent")
+        self.assertIs(consumer.receive(), message)
+
+    def test_raw_send_and_receive(self):
+        connectiva = Connectiva(endpoint="memory://raw")
+        connectiva.connect()
+        body = memoryview(b'{"action": "send", "data": 1, "metadata": {}}')
+        connectiva.send_raw(body, {"trace": "abc"})
+        received = connectiva.receive_raw()
+        self.assertIs(received.data, body)
+        self.assertEqual(received.metadata["headers"], {"trace": "abc"})
+
+        connectiva.send(Message(action="send", data=2))
+        self.assertEqual(json.loads(connectiva.receive_raw().data), {"action": "send", "data": 2, "metadata": {}})
+
+    def test_raw_body_is_decoded_by_receive(self):
+        connectiva = Connectiva(endpoint="memory://raw-decoded")
+        connectiva.connect()
+        connectiva.send_raw(b'{"action": "send", "data": 1, "metadata": {}}')
+        self.assertEqual(connectiva.receive(), Message(action="send", data=1))
+
+        connectiva.send_raw(b"not json")
+        self.assertEqual(connectiva.receive().action, "error")
+
+    def test_receive_no_message(self):
+        connectiva = Connectiva(endpoint="memory://empty")
+        connectiva.connect()
+        received = connectiva.receive()
+        self.assertEqual(received.action, "error")
+        self.assertIn("No message found", received.metadata["error"])
+
+    def test_queues_are_isolated_by_name(self):
+        first = Connectiva(endpoint="memory://first")
+        second = Connectiva(endpoint="memory://second")
+        first.send(Message(action="send", data=1))
+        self.assertEqual(second.receive().action, "error")
+        self.assertEqual(first.receive().data, 1)
+
+    def test_bounded_capacity(self):
+        connectiva = Connectiva(endpoint="memory://bounded", capacity=2, block=False)
+        connectiva.send(Message(action="send", data=1))
+        connectiva.send(Message(action="send", data=2))
+        self.assertIn("error", connectiva.send(Message(action="send", data=3)))
+
+        timed = Connectiva(endpoint="memory://bounded", send_timeout=0.05)
+        started = time.monotonic()
+        self.assertIn("error", timed.send(Message(action="send", data=3)))
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+
+    def test_blocking_receive(self):
+        consumer = Connectiva(endpoint="memory://blocking", receive_timeout=5)
+        producer = Connectiva(endpoint="memory://blocking")
+        threading.Timer(0.05, producer.send, args=(Message(action="send", data="late"),)).start()
+        self.assertEqual(consumer.receive().data, "late")
+
+    def test_competing_consumers(self):
+        producer = Connectiva(endpoint="memory://work")
+        for i in range(100):
+            producer.send(Message(action="send", data=i))
+
+        received = []
+        lock = threading.Lock()
+
+        def consume():
+            consumer = Connectiva(endpoint="memory://work")
+            while True:
+                message = consumer.receive()
+                if message.action == "error":
+                    return
+                with lock:
+                    received.append(message.data)
+
+        threads = [threading.Thread(target=consume) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(received), list(range(100)))
+        self.assertEqual(producer.strategy.stats()["received"], 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
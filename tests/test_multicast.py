@@ -0,0 +1,131 @@
+# tests/test_multicast.py
+
+import os
+import time
+import shutil
+import unittest
+from connectiva import Connectiva, Message, Multicast
+
+
+class _SlowTarget:
+    """
+    Target whose send takes longer than its timeout. Records how many calls overlapped.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.running = 0
+        self.overlapped = False
+
+    def connect(self):
+        pass
+
+    def send_raw(self, body, headers=None):
+        self.running += 1
+        self.overlapped = self.overlapped or self.running > 1
+        time.sleep(self.delay)
+        self.running -= 1
+        return {"status": "sent"}
+
+    def disconnect(self):
+        pass
+
+
+class TestMulticast(unittest.TestCase):
+    def setUp(self):
+        self.directories = [os.path.abspath(f"test_multicast_{i}") for i in range(3)]
+        for directory in self.directories:
+            shutil.rmtree(directory, ignore_errors=True)
+            self.addCleanup(shutil.rmtree, directory, True)
+
+    def _count(self, directory):
+        return len([f for f in os.listdir(directory) if f.startswith("msg_")])
+
+    def test_send_to_all_targets(self):
+        targets = [{"endpoint": f"file://{d}", "directory": d} for d in self.directories]
+        with Multicast(targets) as multicast:
+            result = multicast.send(Message(action="send", data={"event": "created"}))
+
+        self.assertEqual(result["status"], "sent")
+        self.assertEqual(len(result["results"]), 3)
+        for directory in self.directories:
+            self.assertEqual(self._count(directory), 1)
+
+    def test_each_target_encodes(self):
+        targets = [{"endpoint": f"file://{d}", "directory": d} for d in self.directories]
+        message = Message(action="send", data={"event": "created"})
+        with Multicast(targets, encode_once=False) as multicast:
+            result = multicast.send(message)
+
+        self.assertEqual(result["status"], "sent")
+        for directory in self.directories:
+            reader = Connectiva(endpoint=f"file://{directory}", directory=directory)
+            self.assertEqual(reader.receive(), message)
+
+    def test_encode_once_keeps_routing(self):
+        lanes = self.directories[0]
+        targets = {
+            "lanes": {"endpoint": f"file://{lanes}", "directory": lanes, "priority_lanes": 2},
+            "memory": {"endpoint": "memory://multicast-routing"},
+        }
+        message = Message(action="send", data={"event": "urgent"}, metadata={"priority": 1})
+        with Multicast(targets) as multicast:
+            self.assertEqual(multicast.send(message)["status"], "sent")
+            # Every target's consumer sees the decoded message
+            self.assertEqual(multicast.targets["memory"].receive(), message)
+
+        self.assertTrue(all(name.startswith("msg_p1_") for name in os.listdir(lanes) if name.startswith("msg_")))
+        self.assertEqual(self._count(lanes), 1)
+
+    def test_latency_is_slowest_target(self):
+        targets = {f"slow{i}": _SlowTarget(0.3) for i in range(3)}
+        multicast = Multicast(targets)
+        started = time.monotonic()
+        result = multicast.send(Message(action="send", data={}))
+        elapsed = time.monotonic() - started
+        multicast.disconnect()
+
+        self.assertEqual(result["status"], "sent")
+        self.assertLess(elapsed, 0.8, "Targets should be sent to concurrently.")
+
+    def test_per_target_timeout(self):
+        file_target = Connectiva(endpoint=f"file://{self.directories[0]}", directory=self.directories[0])
+        multicast = Multicast(
+            {"file": file_target, "slow": _SlowTarget(1.0)},
+            timeout={"file": 5.0, "slow": 0.1}
+        )
+        result = multicast.send(Message(action="send", data={}))
+        multicast.disconnect()
+
+        self.assertEqual(result["status"], "partial")
+        self.assertEqual(result["results"]["file"]["status"], "file_written")
+        self.assertIn("Timed out", result["results"]["slow"]["error"])
+
+    def test_timed_out_target_is_skipped(self):
+        file_target = Connectiva(endpoint=f"file://{self.directories[0]}", directory=self.directories[0])
+        slow = _SlowTarget(0.3)
+        multicast = Multicast({"file": file_target, "slow": slow}, timeout={"file": 5.0, "slow": 0.05})
+        results = [multicast.send(Message(action="send", data=i))["results"] for i in range(3)]
+        time.sleep(0.4)
+        after = multicast.send(Message(action="send", data=3))["results"]
+        multicast.disconnect()
+
+        self.assertIn("Timed out", results[0]["slow"]["error"])
+        self.assertEqual([result["slow"]["error"] for result in results[1:]], ["Earlier call still running"] * 2)
+        self.assertEqual(after["slow"]["error"], "Timed out after 0.05s")
+        self.assertFalse(slow.overlapped, "Calls on one target must not overlap.")
+        self.assertEqual(self._count(self.directories[0]), 4)
+
+    def test_unserializable_message_is_not_sent(self):
+        targets = [{"endpoint": f"file://{d}", "directory": d} for d in self.directories]
+        multicast = Multicast(targets)
+        result = multicast.send(Message(action="send", data={"bad": object()}))
+        multicast.disconnect()
+
+        self.assertEqual(result["status"], "failed")
+        for directory in self.directories:
+            self.assertEqual(self._count(directory), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
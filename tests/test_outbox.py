@@ -0,0 +1,172 @@
+# tests/test_outbox.py
+
+import os
+import time
+import shutil
+import unittest
+from unittest import mock
+from connectiva import Connectiva, Message
+from connectiva.outbox import Outbox
+from connectiva.protocols.file_protocol import FileProtocol
+
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        self.outbox_dir = os.path.abspath("test_outbox")
+        self.spool_dir = os.path.abspath("test_outbox_spool")
+        for directory in (self.outbox_dir, self.spool_dir):
+            shutil.rmtree(directory, ignore_errors=True)
+            self.addCleanup(shutil.rmtree, directory, True)
+
+    def _wait_for(self, condition, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if condition():
+                return
+            time.sleep(0.02)
+        self.fail("Condition not reached before timeout")
+
+    def test_send_is_queued_and_drained(self):
+        connectiva = Connectiva(
+            endpoint=f"file://{self.spool_dir}",
+            directory=self.spool_dir,
+            outbox_dir=self.outbox_dir
+        )
+        connectiva.connect()
+        for i in range(10):
+            result = connectiva.send(Message(action="send", data={"n": i}))
+            self.assertEqual(result["status"], "queued")
+
+        self._wait_for(lambda: connectiva.outbox_stats()["depth"] == 0)
+        stats = connectiva.outbox_stats()
+        connectiva.disconnect()
+
+        self.assertEqual(stats["drained"], 10)
+        self.assertGreater(stats["drain_rate"], 0)
+        files = [f for f in os.listdir(self.spool_dir) if f.startswith("msg_")]
+        self.assertEqual(len(files), 10)
+
+    def test_survives_restart(self):
+        outbox = Outbox(self.outbox_dir, lambda messages: [{"error": "down"}] * len(messages))
+        outbox.append(Message(action="send", data={"n": 1}))
+        outbox.close()
+
+        delivered = []
+        outbox = Outbox(self.outbox_dir, lambda messages: [delivered.append(m.data) or {} for m in messages])
+        outbox.start()
+        outbox.stop(flush=True, timeout=5)
+        outbox.close()
+
+        self.assertEqual(delivered, [{"n": 1}])
+
+    def test_retries_preserve_order(self):
+        delivered = []
+        calls = {"count": 0}
+
+        def flaky(messages):
+            calls["count"] += 1
+            results = []
+            for message in messages:
+                # The third message fails on its first two attempts
+                if message.data["n"] == 2 and calls["count"] <= 2:
+                    results.append({"error": "broker unavailable"})
+                else:
+                    delivered.append(message.data["n"])
+                    results.append({"status": "sent"})
+            return results
+
+        outbox = Outbox(self.outbox_dir, flaky, batch_size=10, retry_backoff=0.01)
+        for i in range(5):
+            outbox.append(Message(action="send", data={"n": i}))
+        outbox.start()
+        outbox.stop(flush=True, timeout=5)
+        stats = outbox.stats()
+        outbox.close()
+
+        self.assertEqual(stats["depth"], 0)
+        self.assertEqual(stats["failed_batches"], 2)
+        # Messages after a failure are resent, so the final delivery order is intact
+        self.assertEqual(delivered[-3:], [2, 3, 4])
+        self.assertEqual(sorted(set(delivered)), [0, 1, 2, 3, 4])
+
+
+    def test_poison_message_is_dead_lettered(self):
+        delivered = []
+
+        def send_batch(messages):
+            results = []
+            for message in messages:
+                if message.data["n"] == 1:
+                    return results + [{"error": "rejected"}]
+                delivered.append(message.data["n"])
+                results.append({"status": "sent"})
+            return results
+
+        outbox = Outbox(self.outbox_dir, send_batch, retry_backoff=0.01, max_attempts=3)
+        for i in range(3):
+            outbox.append(Message(action="send", data={"n": i}))
+        outbox.start()
+        outbox.stop(flush=True, timeout=5)
+        stats = outbox.stats()
+        dead_letters = outbox.dead_letters()
+        outbox.close()
+
+        self.assertEqual(delivered, [0, 2])
+        self.assertEqual((stats["depth"], stats["dead_letters"]), (0, 1))
+        self.assertEqual(dead_letters[0]["message"].data, {"n": 1})
+        self.assertEqual(dead_letters[0]["error"], "rejected")
+
+    def test_short_results_are_reported(self):
+        outbox = Outbox(self.outbox_dir, lambda messages: [{"status": "sent"}], retry_backoff=0.01)
+        for i in range(2):
+            outbox.append(Message(action="send", data={"n": i}))
+        outbox.start()
+        outbox.stop(flush=True, timeout=5)
+        stats = outbox.stats()
+        outbox.close()
+
+        self.assertEqual(stats["depth"], 0)
+        self.assertEqual(stats["failed_batches"], 1)
+        self.assertIn("No result", stats["last_error"])
+
+    def test_unserializable_message_and_reconnect(self):
+        connectiva = Connectiva(endpoint=f"file://{self.spool_dir}", directory=self.spool_dir, outbox_dir=self.outbox_dir)
+        connectiva.connect()
+        self.assertIn("error", connectiva.send(Message(action="send", data={"when": object()})))
+        connectiva.disconnect()
+        self.assertIsNone(connectiva.outbox._db, "disconnect() should close the outbox database.")
+
+        connectiva.connect()
+        self.assertEqual(connectiva.send(Message(action="send", data={"n": 1}))["status"], "queued")
+        connectiva.disconnect()
+        self.assertEqual(len([f for f in os.listdir(self.spool_dir) if f.startswith("msg_")]), 1)
+
+    def test_drainer_does_not_overlap_receive(self):
+        calls = {"running": 0, "overlapped": False}
+
+        def exclusive(method):
+            def call(*args, **kwargs):
+                calls["running"] += 1
+                calls["overlapped"] = calls["overlapped"] or calls["running"] > 1
+                try:
+                    time.sleep(0.05)
+                    return method(*args, **kwargs)
+                finally:
+                    calls["running"] -= 1
+            return call
+
+        for name in ("send_batch", "receive"):
+            patch = mock.patch.object(FileProtocol, name, exclusive(getattr(FileProtocol, name)))
+            patch.start()
+            self.addCleanup(patch.stop)
+        connectiva = Connectiva(endpoint=f"file://{self.spool_dir}", directory=self.spool_dir, outbox_dir=self.outbox_dir)
+        connectiva.connect()
+        for i in range(10):
+            connectiva.send(Message(action="send", data={"n": i}))
+            connectiva.receive()
+        connectiva.disconnect()
+        self.assertFalse(calls["overlapped"], "The drainer should not use the strategy during receive().")
+
+
+if __name__ == "__main__":
+    unittest.main()
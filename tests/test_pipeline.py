@@ -0,0 +1,155 @@
+# tests/test_pipeline.py
+
+import os
+import time
+import random
+import shutil
+import threading
+import unittest
+from connectiva import Connectiva, Message, Pipeline
+
+
+class _RecordingSource:
+    """
+    In-memory source that records the order in which messages are acknowledged.
+    """
+
+    def __init__(self, count):
+        self.pending = [Message(action="send", data={"n": i}) for i in range(count)]
+        self.acked = []
+
+    def receive(self):
+        if not self.pending:
+            return Message(action="error", data={}, metadata={"error": "No message found"})
+        return self.pending.pop(0)
+
+    def ack(self, message):
+        self.acked.append(message.data["n"])
+
+
+class _ThreadBoundSource(_RecordingSource):
+    """
+    Source that, like a pika channel or a Kafka consumer, must only be used from one thread.
+    """
+
+    def __init__(self, count):
+        super().__init__(count)
+        self.thread = None
+        self.violations = []
+
+    def receive(self):
+        self.thread = threading.current_thread()
+        return super().receive()
+
+    def ack(self, message):
+        if threading.current_thread() is not self.thread:
+            self.violations.append(threading.current_thread().name)
+        super().ack(message)
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.source_dir = os.path.abspath("test_pipeline_source")
+        self.sink_dir = os.path.abspath("test_pipeline_sink")
+        for directory in (self.source_dir, self.sink_dir):
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+            self.addCleanup(shutil.rmtree, directory, True)
+
+        self.source = Connectiva(endpoint=f"file://{self.source_dir}", directory=self.source_dir)
+        self.sink = Connectiva(endpoint=f"file://{self.sink_dir}", directory=self.sink_dir)
+
+    def _wait_for(self, condition, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if condition():
+                return
+            time.sleep(0.05)
+        self.fail("Condition not reached before timeout")
+
+    def _sink_files(self):
+        return [f for f in os.listdir(self.sink_dir) if f.startswith("msg_")]
+
+    def test_transform_and_forward(self):
+        for i in range(20):
+            self.source.send(Message(action="send", data={"n": i}))
+
+        def double(message):
+            return Message(action="send", data={"n": message.data["n"] * 2})
+
+        def split_odd(message):
+            # Emit nothing for multiples of four, and the message itself otherwise
+            if message.data["n"] % 4:
+                yield message
+
+        pipeline = Pipeline(self.source, double, split_odd, sink=self.sink, workers=4, batch_size=5, poll_interval=0.01)
+        with pipeline:
+            self._wait_for(lambda: pipeline.metrics()["acked"] == 20)
+
+        received = []
+        while True:
+            message = self.sink.receive()
+            if message.action == "error":
+                break
+            received.append(message.data["n"])
+
+        self.assertEqual(sorted(received), [n * 2 for n in range(20) if (n * 2) % 4])
+        metrics = pipeline.metrics()
+        self.assertEqual(metrics["stages"]["0:double"]["count"], 20)
+        self.assertEqual(metrics["sink"]["count"], 10)
+        self.assertGreater(metrics["source"]["throughput"], 0)
+
+    def test_acks_follow_source_order(self):
+        source = _RecordingSource(30)
+
+        async def jitter(message):
+            time.sleep(random.random() / 100)
+            return message
+
+        pipeline = Pipeline(source, jitter, sink=self.sink, workers=8, poll_interval=0.01)
+        with pipeline:
+            self._wait_for(lambda: len(source.acked) == 30)
+
+        self.assertEqual(source.acked, list(range(30)))
+        self.assertEqual(len(self._sink_files()), 30)
+
+    def test_acks_run_on_the_receiving_thread(self):
+        source = _ThreadBoundSource(20)
+
+        pipeline = Pipeline(source, lambda message: message, sink=self.sink, workers=4, batch_size=3, poll_interval=0.01)
+        with pipeline:
+            self._wait_for(lambda: len(source.acked) == 20)
+
+        self.assertEqual(source.violations, [])
+        self.assertEqual(source.acked, list(range(20)))
+
+    def test_failure_without_handler_stops_unacked(self):
+        source = _RecordingSource(3)
+
+        def explode(message):
+            raise ValueError("bad payload")
+
+        pipeline = Pipeline(source, explode, sink=self.sink, poll_interval=0.01).start()
+        pipeline.join(timeout=5)
+
+        self.assertFalse(pipeline.running)
+        self.assertIsInstance(pipeline.error, ValueError)
+        self.assertEqual(source.acked, [])
+
+    def test_failure_with_handler_is_acked(self):
+        source = _RecordingSource(3)
+        failures = []
+
+        def explode(message):
+            raise ValueError("bad payload")
+
+        pipeline = Pipeline(source, explode, sink=self.sink, poll_interval=0.01,
+                            on_error=lambda message, error: failures.append(message.data["n"]))
+        with pipeline:
+            self._wait_for(lambda: len(source.acked) == 3)
+
+        self.assertEqual(failures, [0, 1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+# tests/test_profiling.py
+
+import os
+import json
+import time
+import shutil
+import unittest
+from connectiva import Connectiva, Message
+from connectiva.profiling import StageProfiler, child_traceparent, inherit_trace, trace_id
+
+
+class TestStageHooks(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.abspath("test_profiling")
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.test_dir, True)
+
+    def _connectiva(self, **kwargs):
+        connectiva = Connectiva(endpoint=f"file://{self.test_dir}", directory=self.test_dir, **kwargs)
+        connectiva.connect()
+        self.addCleanup(connectiva.disconnect)
+        return connectiva
+
+    def test_hooks_see_every_stage_in_order(self):
+        connectiva = self._connectiva()
+        calls = []
+        for stage in ("pre_serialize", "post_serialize", "pre_io", "post_io", "ack"):
+            connectiva.strategy.add_hook(stage, lambda message, stage, timestamp: calls.append((stage, timestamp)))
+
+        connectiva.send(Message(action="send", data="hooked"))
+        self.assertEqual([stage for stage, _ in calls], ["pre_serialize", "post_serialize", "pre_io", "post_io", "ack"])
+        timestamps = [timestamp for _, timestamp in calls]
+        self.assertEqual(timestamps, sorted(timestamps))
+
+    def test_failing_hook_does_not_fail_send(self):
+        connectiva = self._connectiva()
+        connectiva.strategy.add_hook("pre_io", lambda message, stage, timestamp: 1 / 0)
+        self.assertEqual(connectiva.send(Message(action="send", data="x"))["status"], "file_written")
+
+    def test_unknown_stage(self):
+        connectiva = self._connectiva()
+        with self.assertRaises(ValueError):
+            connectiva.strategy.add_hook("post_ack", print)
+
+    def test_profile_stats(self):
+        connectiva = self._connectiva(profile_sample_rate=1.0)
+        for i in range(20):
+            connectiva.send(Message(action="send", data=i))
+
+        stats = connectiva.profile_stats()
+        self.assertEqual(stats["sampled"], 20)
+        for stage in ("connectiva", "serialize", "prepare", "io", "ack", "total"):
+            self.assertEqual(stats[stage]["count"], 20)
+            self.assertLessEqual(stats[stage]["p50"], stats[stage]["p99"])
+        self.assertEqual(self._connectiva().profile_stats(), {})
+
+    def test_slow_traces_are_written(self):
+        trace_file = os.path.join(self.test_dir, "slow.jsonl")
+        connectiva = self._connectiva(profile_sample_rate=1.0, profile_slow_threshold=0.0,
+                                      profile_trace_file=trace_file, trace=True)
+        connectiva.send(Message(action="slow", data="x"))
+
+        with open(trace_file) as file:
+            traces = [json.loads(line) for line in file]
+        self.assertEqual(len(traces), 1)
+        self.assertEqual(traces[0]["action"], "slow")
+        self.assertIn("io", traces[0]["stages"])
+        self.assertTrue(traces[0]["traceparent"].startswith("00-"))
+
+    def test_standalone_profiler_samples_at_first_stage(self):
+        connectiva = self._connectiva()
+        profiler = StageProfiler(sample_rate=1.0)
+        profiler.attach(connectiva.strategy)
+        connectiva.send(Message(action="send", data="x"))
+        self.assertEqual(profiler.stats()["total"]["count"], 1)
+        self.assertNotIn("connectiva", profiler.stats())
+
+    def test_chunked_and_queued_sends_leave_no_open_samples(self):
+        chunked = self._connectiva(profile_sample_rate=1.0, chunk_size=1024)
+        chunked.send(Message(action="send", data="x" * 5000))
+        self.assertEqual(len(chunked.profiler._inflight), 0)
+
+        queued = self._connectiva(profile_sample_rate=1.0, outbox_dir=os.path.join(self.test_dir, "outbox"))
+        queued.send(Message(action="send", data="x"))
+        for _ in range(100):
+            if queued.outbox.depth() == 0:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(queued.profiler._inflight), 0)
+
+
+class TestTraceContext(unittest.TestCase):
+    def test_child_keeps_trace_id(self):
+        root = child_traceparent()
+        child = child_traceparent(root)
+        self.assertEqual(root.split("-")[1], child.split("-")[1])
+        self.assertNotEqual(root.split("-")[2], child.split("-")[2])
+        self.assertNotEqual(child_traceparent("garbage").split("-")[1], root.split("-")[1])
+
+    def test_trace_propagates_across_hops(self):
+        root = child_traceparent()
+        # Broker protocols hand out the sent envelope as data
+        received = Message(action="receive", data={"action": "order", "data": 1, "metadata": {"traceparent": root}})
+        outputs = inherit_trace(received, [Message(action="invoice", data=1)])
+        self.assertEqual(outputs[0].metadata["traceparent"], root)
+
+        connectiva = Connectiva(endpoint="memory://traced", trace=True)
+        connectiva.connect()
+        connectiva.send(outputs[0])
+        forwarded = connectiva.receive()
+        self.assertEqual(trace_id(forwarded), trace_id(received))
+        self.assertNotEqual(forwarded.metadata["traceparent"], root)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,553 @@
+# tests/test_rest_protocol.py
+
+import gzip
+import json
+import time
+import unittest
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from connectiva import Connectiva, Message
+from connectiva.codec import loads
+from connectiva.rate_limit import RateLimiter, AIMDLimiter, retry_after, create_rate_limiter
+from connectiva.load_balancer import LoadBalancer, NoReplicasError
+
+
+class _ETagHandler(BaseHTTPRequestHandler):
+    """
+    Serves a JSON document with an ETag and counts the requests it receives.
+    """
+    body = json.dumps({"content": "Hello REST!"}).encode()
+    etag = '"v1"'
+    max_age = 0
+    delay = 0.0
+    requests_seen = 0
+    not_modified = 0
+    always_not_modified = False
+
+    def do_GET(self):
+        type(self).requests_seen += 1
+        time.sleep(self.delay)
+        if self.always_not_modified or self.headers.get("If-None-Match") == self.etag:
+            type(self).not_modified += 1
+            self.send_response(304)
+            self.send_header("ETag", self.etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", self.etag)
+        self.send_header("Cache-Control", f"max-age={self.max_age}")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestRestProtocolCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _ETagHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.endpoint = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _ETagHandler.requests_seen = 0
+        _ETagHandler.not_modified = 0
+        _ETagHandler.max_age = 0
+        _ETagHandler.delay = 0.0
+        _ETagHandler.always_not_modified = False
+        self.addCleanup(setattr, _ETagHandler, "body", _ETagHandler.body)
+
+    def test_revalidates_with_etag(self):
+        connectiva = Connectiva(endpoint=self.endpoint, cache=True)
+        first = connectiva.receive()
+        second = connectiva.receive()
+
+        self.assertEqual(first.data, {"content": "Hello REST!"})
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(_ETagHandler.not_modified, 1, "Second request should be a conditional 304.")
+        self.assertEqual(connectiva.cache_stats()["revalidated"], 1)
+
+    def test_fresh_entry_skips_request(self):
+        _ETagHandler.max_age = 60
+        connectiva = Connectiva(endpoint=self.endpoint, cache=True)
+        for _ in range(3):
+            connectiva.receive()
+
+        stats = connectiva.cache_stats()
+        self.assertEqual(_ETagHandler.requests_seen, 1)
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_concurrent_requests_are_coalesced(self):
+        _ETagHandler.delay = 0.3
+        connectiva = Connectiva(endpoint=self.endpoint, cache=True)
+        results = [None] * 5
+
+        def receiver(index):
+            results[index] = connectiva.receive().data
+
+        threads = [threading.Thread(target=receiver, args=(i,)) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(_ETagHandler.requests_seen, 1, "Identical in-flight requests should share one fetch.")
+        self.assertEqual(results, [{"content": "Hello REST!"}] * 5)
+        self.assertEqual(connectiva.cache_stats()["coalesced"], 4)
+
+    def test_non_json_body_is_an_error(self):
+        _ETagHandler.body = b"<html>Not JSON</html>"
+        _ETagHandler.max_age = 60
+        connectiva = Connectiva(endpoint=self.endpoint, cache=True)
+
+        self.assertEqual(connectiva.receive().action, "error")
+        self.assertEqual(connectiva.cache_stats()["size"], 0, "Unreadable bodies should not be cached.")
+
+    def test_not_modified_without_cached_entry(self):
+        _ETagHandler.always_not_modified = True
+        connectiva = Connectiva(endpoint=self.endpoint, cache=True)
+
+        self.assertEqual(connectiva.receive().action, "error")
+        self.assertEqual(connectiva.cache_stats()["size"], 0)
+
+    def test_without_cache(self):
+        connectiva = Connectiva(endpoint=self.endpoint)
+        connectiva.receive()
+        connectiva.receive()
+        self.assertEqual(_ETagHandler.requests_seen, 2)
+        self.assertEqual(connectiva.cache_stats(), {})
+
+
+class _RawHandler(BaseHTTPRequestHandler):
+    """
+    Serves a gzip-encoded JSON message and records the requests posted to it.
+    """
+    posted = []
+
+    def do_GET(self):
+        body = gzip.compress(b'{"action": "send", "data": 1, "metadata": {}}')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Trace", "abc")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.posted.append((self.rfile.read(int(self.headers["Content-Length"])), dict(self.headers)))
+        self.send_response(202)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestRestProtocolRaw(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _RawHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.endpoint = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_relay_raw_body(self):
+        connectiva = Connectiva(endpoint=self.endpoint)
+        received = connectiva.receive_raw()
+        self.assertEqual(json.loads(received.data), {"action": "send", "data": 1, "metadata": {}})
+        # The body was decompressed, so its encoding headers must not be passed on
+        self.assertNotIn("Content-Encoding", received.metadata["headers"])
+        self.assertNotIn("Content-Length", received.metadata["headers"])
+        self.assertEqual(received.metadata["headers"]["X-Trace"], "abc")
+
+        _RawHandler.posted.clear()
+        result = connectiva.send_raw(received.data, received.metadata["headers"])
+        self.assertEqual(result["status_code"], 202)
+        body, headers = _RawHandler.posted[0]
+        self.assertEqual(body, received.data)
+        self.assertEqual(headers["X-Trace"], "abc")
+        self.assertNotIn("Content-Encoding", headers)
+
+    def test_request_bodies_are_only_compressed_on_request(self):
+        message = Message(action="send", data="z" * 10000)
+        for compress in (False, True):
+            _RawHandler.posted.clear()
+            connectiva = Connectiva(endpoint=self.endpoint, codec_processes=1, codec_threshold=1024,
+                                    compression_level=6, compress_requests=compress)
+            connectiva.send(message)
+            body, headers = _RawHandler.posted[0]
+            self.assertEqual(headers.get("Content-Encoding"), "deflate" if compress else None)
+            self.assertEqual(loads(body), message.__dict__)
+
+    def test_receive_decodes_through_codec(self):
+        connectiva = Connectiva(endpoint=self.endpoint, codec_processes=1, codec_threshold=16)
+        self.assertEqual(connectiva.receive().data, {"action": "send", "data": 1, "metadata": {}})
+        self.assertEqual(connectiva.strategy.codec.stats()["offloaded"], 1)
+
+
+class _ThrottlingHandler(BaseHTTPRequestHandler):
+    """
+    Answers 429 with a Retry-After header for the first ``throttle`` requests.
+    """
+    throttle = 0
+    requests_seen = 0
+
+    def do_GET(self):
+        type(self).requests_seen += 1
+        if type(self).throttle > 0:
+            type(self).throttle -= 1
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps({"content": "ok"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        type(self).requests_seen += 1
+        self.send_response(503)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestRestProtocolRateLimit(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _ThrottlingHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.endpoint = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _ThrottlingHandler.throttle = 0
+        _ThrottlingHandler.requests_seen = 0
+
+    def test_retries_throttled_requests(self):
+        _ThrottlingHandler.throttle = 2
+        connectiva = Connectiva(endpoint=self.endpoint, rate_limiter=RateLimiter(adaptive=True, retry_backoff=0.01))
+        received = connectiva.receive()
+
+        self.assertEqual(received.data, {"content": "ok"})
+        stats = connectiva.limiter_stats()
+        self.assertEqual(stats["throttled"], 2)
+        self.assertEqual(stats["retries"], 2)
+        self.assertLess(stats["concurrency"]["limit"], 4, "Throttling should cut the concurrency limit.")
+
+    def test_gives_up_after_max_retries(self):
+        _ThrottlingHandler.throttle = 10
+        connectiva = Connectiva(endpoint=self.endpoint, rate_limiter=RateLimiter(max_retries=1))
+        received = connectiva.receive()
+
+        self.assertEqual(received.action, "error")
+        self.assertEqual(_ThrottlingHandler.requests_seen, 2)
+
+    def test_post_is_not_retried_on_503(self):
+        connectiva = Connectiva(endpoint=self.endpoint, rate_limiter=RateLimiter(retry_backoff=0.01))
+        self.assertIn("error", connectiva.send(Message(action="send", data={})))
+        self.assertEqual(_ThrottlingHandler.requests_seen, 1)
+
+    def test_token_bucket_limits_rate(self):
+        connectiva = Connectiva(endpoint=self.endpoint, rate_limiter=RateLimiter(rate=20, burst=1, adaptive=False))
+        started = time.monotonic()
+        for _ in range(6):
+            connectiva.receive()
+        self.assertGreaterEqual(time.monotonic() - started, 0.24)
+
+    def test_limiter_is_shared_per_endpoint(self):
+        first = Connectiva(endpoint=self.endpoint, rate_limit=100)
+        second = Connectiva(endpoint=self.endpoint + "/other", rate_limit=100)
+        third = Connectiva(endpoint=self.endpoint, rate_limit=5)
+        self.assertIs(first.strategy.limiter, second.strategy.limiter)
+        self.assertIsNot(first.strategy.limiter, third.strategy.limiter, "Other limits need their own limiter.")
+        self.assertEqual(third.limiter_stats()["bucket"]["rate"], 5)
+        self.assertEqual(Connectiva(endpoint=self.endpoint).limiter_stats(), {})
+
+    def test_aimd_converges(self):
+        limiter = AIMDLimiter(initial=4, max_limit=8)
+        for _ in range(100):
+            limiter.acquire()
+            limiter.release(0.01)
+        self.assertEqual(limiter.stats()["limit"], 8)
+        limiter.acquire()
+        limiter.release(0.5)  # A single slow request is not a trend
+        self.assertEqual(limiter.stats()["limit"], 8)
+        for _ in range(limiter.window):
+            limiter.acquire()
+            limiter.release(0.5)  # Sustained latency far above the baseline counts as overload
+            if limiter.stats()["limit"] < 8:
+                break
+        self.assertEqual(limiter.stats()["limit"], 4)
+
+    def test_retry_after_formats(self):
+        self.assertEqual(retry_after("3"), 3.0)
+        self.assertIsNone(retry_after(None))
+        self.assertEqual(retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+
+
+class _ReplicaHandler(BaseHTTPRequestHandler):
+    """
+    Counts requests per server and answers with the server's configured status and delay.
+    """
+
+    def do_GET(self):
+        self.server.hits += 1
+        time.sleep(self.server.delay)
+        body = json.dumps({"replica": self.server.server_address[1]}).encode()
+        self.send_response(self.server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestRestProtocolLoadBalancing(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.servers = []
+        for _ in range(3):
+            server = ThreadingHTTPServer(("127.0.0.1", 0), _ReplicaHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            cls.servers.append(server)
+        cls.endpoints = [f"http://127.0.0.1:{server.server_address[1]}" for server in cls.servers]
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls.servers:
+            server.shutdown()
+            server.server_close()
+
+    def setUp(self):
+        for server in self.servers:
+            server.hits = 0
+            server.status = 200
+            server.delay = 0.0
+
+    def test_round_robin(self):
+        connectiva = Connectiva(endpoint=",".join(self.endpoints))
+        for _ in range(9):
+            self.assertEqual(connectiva.receive().action, "receive")
+        self.assertEqual([server.hits for server in self.servers], [3, 3, 3])
+
+    def test_failing_replica_is_ejected(self):
+        self.servers[0].status = 500
+        connectiva = Connectiva(endpoint=self.endpoints[0], endpoints=self.endpoints, failure_threshold=2)
+        for _ in range(30):
+            connectiva.receive()
+        self.assertEqual(self.servers[0].hits, 2)
+        self.assertFalse(connectiva.load_balancer_stats()[self.endpoints[0]]["healthy"])
+
+    def test_p2c_prefers_fast_replicas(self):
+        self.servers[0].delay = 0.05
+        connectiva = Connectiva(endpoint=self.endpoints[0], endpoints=self.endpoints, load_balancing="p2c")
+        for _ in range(40):
+            connectiva.receive()
+        self.assertLess(self.servers[0].hits, 10)
+
+    def test_resolver(self):
+        resolved = [self.endpoints[1:]]
+        connectiva = Connectiva(endpoint=self.endpoints[0], resolver=lambda: resolved[0], resolve_interval=0)
+        for _ in range(4):
+            connectiva.receive()
+        resolved[0] = self.endpoints[:1]
+        connectiva.receive()
+        self.assertEqual([server.hits for server in self.servers], [1, 2, 2])
+
+    def test_empty_resolver(self):
+        balancer = LoadBalancer(resolver=lambda: [], strategy="p2c")
+        with self.assertRaises(NoReplicasError):
+            balancer.pick()
+
+        connectiva = Connectiva(endpoint=self.endpoints[0], resolver=lambda: [])
+        self.assertEqual(connectiva.receive().action, "error")
+
+    def test_replicas_have_their_own_limiter(self):
+        limiters = [create_rate_limiter(endpoint, rate_limit=1000) for endpoint in self.endpoints]
+        before = [limiter.stats()["requests"] for limiter in limiters]
+        connectiva = Connectiva(endpoint=",".join(self.endpoints), rate_limit=1000)
+        for _ in range(3):
+            connectiva.receive()
+        after = [limiter.stats()["requests"] for limiter in limiters]
+        self.assertEqual([a - b for a, b in zip(after, before)], [1, 1, 1])
+        stats = connectiva.limiter_stats()
+        self.assertEqual(sorted(stats), sorted(self.endpoints))
+        self.assertEqual([stats[endpoint]["requests"] for endpoint in self.endpoints], after)
+
+    def test_least_outstanding(self):
+        balancer = LoadBalancer(endpoints=["a", "b"], strategy="least_outstanding")
+        first = balancer.pick()
+        second = balancer.pick()
+        self.assertNotEqual(first, second)
+        balancer.release(first, 0.01)
+        self.assertEqual(balancer.pick(), first)
+
+
+class _StreamHandler(BaseHTTPRequestHandler):
+    """
+    Streams numbered events, at most three per connection, resuming after Last-Event-ID.
+    """
+    total = 5
+    pause = 0.0
+    idle = 0.0
+    empty_polls = 0
+    envelope = True
+    connections = 0
+
+    def _event(self, n):
+        return {"id": n, "action": "tick", "data": n} if self.envelope else {"id": n, "value": n}
+
+    def do_GET(self):
+        type(self).connections += 1
+        start = int(self.headers.get("Last-Event-ID") or 0)
+        accept = self.headers.get("Accept")
+        events = list(range(start + 1, min(start + 3, self.total) + 1))
+        if accept == "application/json":
+            if self.empty_polls:
+                type(self).empty_polls -= 1
+                events = []
+            if not events:
+                self.send_response(204)
+                self.end_headers()
+                return
+            body = json.dumps([self._event(n) for n in events[:2]]).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", accept)
+        self.end_headers()
+        if accept == "text/event-stream":
+            self.wfile.write(b"retry: 10\n: keep-alive\n\n")
+        for n in events:
+            if accept == "text/event-stream":
+                self.wfile.write(f"id: {n}\nevent: tick\ndata: {{\"count\":\ndata: {n}}}\n\n".encode())
+            else:
+                self.wfile.write((json.dumps(self._event(n)) + "\n").encode())
+            self.wfile.flush()
+            time.sleep(self.pause)
+        time.sleep(self.idle)  # Keep the connection open without sending anything
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestRestProtocolStreaming(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _StreamHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.endpoint = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _StreamHandler.connections = 0
+        _StreamHandler.pause = 0.0
+        _StreamHandler.idle = 0.0
+        _StreamHandler.empty_polls = 0
+        _StreamHandler.envelope = True
+
+    def _take(self, connectiva, count):
+        stream = connectiva.stream()
+        messages = [next(stream) for _ in range(count)]
+        stream.close()
+        return messages
+
+    def test_sse_resumes_after_reconnect(self):
+        connectiva = Connectiva(endpoint=self.endpoint, stream_mode="sse")
+        messages = self._take(connectiva, 5)
+        self.assertEqual([message.data for message in messages], [{"count": n} for n in range(1, 6)])
+        self.assertEqual(messages[0].metadata, {"event_id": "1", "event": "tick"})
+        self.assertEqual(_StreamHandler.connections, 2)
+        self.assertEqual(connectiva.strategy.reconnect_delay, 0.01)
+
+    def test_sse_delivers_events_as_they_arrive(self):
+        _StreamHandler.pause = 0.5
+        connectiva = Connectiva(endpoint=self.endpoint, stream_mode="sse")
+        started = time.monotonic()
+        self._take(connectiva, 1)
+        self.assertLess(time.monotonic() - started, 0.4)
+
+    def test_sse_reconnects_after_idle_timeout(self):
+        _StreamHandler.idle = 3.0
+        connectiva = Connectiva(endpoint=self.endpoint, stream_mode="sse", stream_timeout=0.3)
+        started = time.monotonic()
+        messages = self._take(connectiva, 5)
+        self.assertEqual([message.data for message in messages], [{"count": n} for n in range(1, 6)])
+        self.assertEqual(_StreamHandler.connections, 2)
+        self.assertLess(time.monotonic() - started, 2.0)
+
+    def test_ndjson(self):
+        connectiva = Connectiva(endpoint=self.endpoint, stream_mode="ndjson", reconnect_delay=0.01)
+        messages = self._take(connectiva, 5)
+        self.assertEqual([message.data for message in messages], [1, 2, 3, 4, 5])
+        self.assertEqual(messages[-1].action, "tick")
+        self.assertEqual(messages[-1].metadata["event_id"], "5")
+
+    def test_long_poll(self):
+        connectiva = Connectiva(endpoint=self.endpoint, stream_mode="long_poll", long_poll_wait=1)
+        messages = self._take(connectiva, 4)
+        self.assertEqual([message.data for message in messages], [1, 2, 3, 4])
+        self.assertEqual(_StreamHandler.connections, 2)
+
+    def test_record_ids_stay_in_data(self):
+        _StreamHandler.envelope = False
+        connectiva = Connectiva(endpoint=self.endpoint, stream_mode="ndjson", reconnect_delay=0.01)
+        message = self._take(connectiva, 1)[0]
+        self.assertEqual(message.data, {"id": 1, "value": 1})
+        self.assertEqual(message.metadata["event_id"], "1")
+
+    def test_long_poll_backs_off_on_empty_responses(self):
+        _StreamHandler.empty_polls = 3
+        connectiva = Connectiva(endpoint=self.endpoint, stream_mode="long_poll", long_poll_wait=1, reconnect_delay=0.2)
+        started = time.monotonic()
+        self._take(connectiva, 1)
+        self.assertGreaterEqual(time.monotonic() - started, 0.6)
+        self.assertEqual(_StreamHandler.connections, 4)
+
+    def test_unsupported_protocol(self):
+        with self.assertRaises(ValueError):
+            next(Connectiva(endpoint="memory://nothing").stream())
+
+
+if __name__ == "__main__":
+    unittest.main()
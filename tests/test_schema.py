@@ -0,0 +1,152 @@
+# tests/test_schema.py
+
+import os
+import json
+import shutil
+import unittest
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from connectiva import Connectiva, Message
+from connectiva.protocols.memory_protocol import delete_queue
+from connectiva.schema import CompiledSchema, SchemaRegistry
+
+ORDER = ["id", "customer", {"name": "address", "fields": ["city", "zip"]}, {"name": "lines", "items": ["sku", "qty"]}]
+
+
+class _RegistryHandler(BaseHTTPRequestHandler):
+    """
+    Minimal registry service keeping schemas in memory.
+    """
+    schemas = {}
+
+    def do_GET(self):
+        schema_id = self.path.rsplit("/", 1)[-1]
+        if schema_id not in self.schemas:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps(self.schemas[schema_id]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        document = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.schemas[document["id"]] = document
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestCompiledSchema(unittest.TestCase):
+    def setUp(self):
+        self.schema = CompiledSchema("order", ORDER)
+        self.order = {
+            "id": 7,
+            "customer": "ada",
+            "address": {"city": "Berlin", "zip": "10115"},
+            "lines": [{"sku": "a-1", "qty": 2}, {"sku": "b-2", "qty": 1}],
+        }
+
+    def test_roundtrip_is_positional(self):
+        encoded = self.schema.encode(self.order)
+        self.assertEqual(encoded, [7, "ada", ["Berlin", "10115"], [["a-1", 2], ["b-2", 1]]])
+        self.assertEqual(self.schema.decode(encoded), self.order)
+        self.assertLess(len(json.dumps(encoded)), len(json.dumps(self.order)))
+
+    def test_missing_fields_decode_as_none(self):
+        decoded = self.schema.decode(self.schema.encode({"id": 1, "customer": "bob"}))
+        self.assertEqual(decoded, {"id": 1, "customer": "bob", "address": None, "lines": None})
+
+    def test_unknown_fields_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.schema.encode(dict(self.order, note="fragile"))
+        with self.assertRaises(ValueError):
+            self.schema.encode({"id": 1, "note": "fragile"})
+        with self.assertRaises(ValueError):
+            # As many fields as the schema, but one of them unknown
+            self.schema.encode({"id": 1, "customer": "ada", "address": None, "note": "fragile"})
+        with self.assertRaises(ValueError):
+            CompiledSchema("pair", ["a", "b"]).encode({"a": 1, "c": 2})
+
+    def test_malformed_values_are_rejected(self):
+        for values in ([1], [1, 5], [7, "ada", "Berlin", None], [7, "ada", None, [1]], "oops"):
+            with self.assertRaises(ValueError, msg=values):
+                self.schema.decode(values)
+
+
+class TestSchemaRegistry(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _RegistryHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.test_dir = os.path.abspath("test_schemas")
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.test_dir, True)
+        delete_queue()
+        self.addCleanup(delete_queue)
+
+    def test_schemas_persist_in_directory(self):
+        schema_id = SchemaRegistry(os.path.join(self.test_dir, "a")).register(ORDER)
+        shutil.copytree(os.path.join(self.test_dir, "a"), os.path.join(self.test_dir, "b"))
+        self.assertEqual(SchemaRegistry(os.path.join(self.test_dir, "b")).get(schema_id).fields, ORDER)
+        with self.assertRaises(KeyError):
+            SchemaRegistry(os.path.join(self.test_dir, "c")).get(schema_id)
+
+    def test_schemas_are_mirrored_from_service(self):
+        schema_id = SchemaRegistry(url=self.url).register(ORDER, schema_id="order.v1")
+        mirror = SchemaRegistry(self.test_dir, url=self.url)
+        self.assertEqual(mirror.get("order.v1").fields, ORDER)
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, f"{schema_id}.json")))
+
+    def test_connectiva_encodes_and_decodes(self):
+        schema_id = SchemaRegistry(self.test_dir).register(ORDER)
+        producer = Connectiva(endpoint="memory://orders", schema_registry=self.test_dir)
+        consumer = Connectiva(endpoint="memory://orders", schema_registry=self.test_dir)
+        producer.connect()
+        consumer.connect()
+
+        order = {"id": 1, "customer": "ada", "address": None, "lines": [{"sku": "a-1", "qty": 2}]}
+        producer.send(Message(action="order", data=order, metadata={"schema_id": schema_id}))
+        self.assertEqual(consumer.receive().data, order)
+        self.assertIn("error", producer.send(Message(action="order", data={"bogus": 1}, metadata={"schema_id": schema_id})))
+
+        for values in ([1], [1, 5]):
+            # Bypass encoding to deliver a payload that does not match the schema
+            producer.strategy.send(Message(action="order", data=values, metadata={"schema_id": schema_id}))
+            received = consumer.receive()
+            self.assertEqual(received.action, "error")
+            self.assertIn("Expected", received.metadata["error"])
+
+        results = producer.send_batch([
+            Message(action="order", data=order, metadata={"schema_id": schema_id}),
+            Message(action="order", data=order, metadata={"schema_id": "missing"}),
+            Message(action="order", data={"bogus": 1}, metadata={"schema_id": schema_id}),
+        ])
+        self.assertNotIn("error", results[0])
+        self.assertIn("error", results[1])
+        self.assertIn("error", results[2])
+        self.assertEqual(consumer.receive().data, order)
+
+        # Broker protocols hand out the sent envelope as data
+        envelope = {"action": "order", "data": [1, "ada", None, None], "metadata": {"schema_id": schema_id}}
+        producer.strategy.send(Message(action="receive", data=envelope))
+        self.assertEqual(consumer.receive().data["data"], {"id": 1, "customer": "ada", "address": None, "lines": None})
+
+
+if __name__ == "__main__":
+    unittest.main()
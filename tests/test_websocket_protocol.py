@@ -1,11 +1,14 @@
 # tests/test_websocket_protocol.py
 
+import os
+import time
 import unittest
 import logging
-import threading
 import nest_asyncio
 import asyncio
+from websockets.extensions.permessage_deflate import PerMessageDeflate
 from connectiva import Connectiva, Message
+from connectiva.protocols.websocket_protocol import DEFLATE_MEM_LEVEL, DEFLATE_WINDOW_BITS
 
 # Apply the nest_asyncio patch
 nest_asyncio.apply()
@@ -22,8 +25,7 @@ class TestWebSocketProtocolWithConnectiva(unittest.TestCase):
             mode="server",
             log=True
         )
-        cls.server_thread = threading.Thread(target=cls.server.connect)
-        cls.server_thread.start()
+        cls.server.connect()
 
         # Start the WebSocket client using Connectiva
         cls.client = Connectiva(
@@ -38,7 +40,6 @@ class TestWebSocketProtocolWithConnectiva(unittest.TestCase):
         # Disconnect both client and server
         cls.client.disconnect()
         cls.server.disconnect()
-        cls.server_thread.join()
 
     def test_send_receive(self):
         # Test sending and receiving messages
@@ -61,5 +62,153 @@ class TestWebSocketProtocolWithConnectiva(unittest.TestCase):
         self.assertEqual(received_message.data["data"]["received"], message.data["content"], "Server should echo the message back to the client.")
 
 
+class TestWebSocketServerMode(unittest.TestCase):
+    endpoint = "ws://localhost:8766"
+
+    def _server(self, **kwargs):
+        server = Connectiva(endpoint=self.endpoint, mode="server", log=True, **kwargs)
+        server.connect()
+        self.addCleanup(server.disconnect)
+        return server
+
+    def _client(self, **kwargs):
+        client = Connectiva(endpoint=self.endpoint, mode="client", log=True, **kwargs)
+        client.connect()
+        self.addCleanup(client.disconnect)
+        return client
+
+    def _wait_for_connections(self, server, count):
+        for _ in range(100):
+            if server.strategy.server_stats()["connections"] == count:
+                return
+            time.sleep(0.01)
+        self.fail(f"Expected {count} connections")
+
+    def test_connect_returns_and_broadcasts(self):
+        server = self._server()
+        clients = [self._client() for _ in range(3)]
+        self._wait_for_connections(server, 3)
+
+        result = server.strategy.broadcast(Message(action="news", data={"headline": "Hello all!"}))
+        self.assertEqual(result["recipients"], 3)
+
+        for client in clients:
+            received = client.receive()
+            self.assertEqual(received.data["data"], {"headline": "Hello all!"})
+
+    def test_handler_callback_and_receive(self):
+        def on_message(message, connection_id):
+            return Message(action="reply", data={"upper": message.data["text"].upper()})
+
+        server = self._server(on_message=on_message)
+        client = self._client()
+        client.send(Message(action="send", data={"text": "ping"}))
+
+        self.assertEqual(client.receive().data["data"], {"upper": "PING"})
+        inbound = server.receive()
+        self.assertEqual(inbound.data, {"text": "ping"})
+        self.assertIn("connection_id", inbound.metadata)
+
+        # Reply directly to the sending connection
+        reply = Message(action="direct", data={"to": "you"}, metadata={"connection_id": inbound.metadata["connection_id"]})
+        self.assertEqual(server.send(reply)["status"], "sent")
+        self.assertEqual(client.receive().data["data"], {"to": "you"})
+
+    def test_slow_consumer_is_evicted(self):
+        server = self._server(send_queue_size=1, on_message=None)
+        self._client(close_timeout=0.1)  # Never reads
+        self._wait_for_connections(server, 1)
+
+        payload = Message(action="bulk", data=os.urandom(100_000).hex())
+        for _ in range(200):
+            server.strategy.broadcast(payload)
+            if server.strategy.server_stats()["evicted"]:
+                break
+
+        self.assertEqual(server.strategy.server_stats()["evicted"], 1)
+        self._wait_for_connections(server, 0)
+
+    def test_raw_frames(self):
+        server = self._server(on_message=None)
+        client = self._client()
+        body = b'{"action": "send", "data": {"text": "raw"}, "metadata": {}}'
+        self.assertEqual(client.send_raw(body)["status"], "sent")
+        inbound = server.receive()
+        self.assertEqual(inbound.data, {"text": "raw"})
+
+        self.assertEqual(server.send_raw(body, {"connection_id": inbound.metadata["connection_id"]})["recipients"], 1)
+        self.assertEqual(client.receive_raw().data, body)
+
+    def test_slow_handler_does_not_block_other_connections(self):
+        def on_message(message, connection_id):
+            if message.data["text"] == "slow":
+                time.sleep(1)
+            return Message(action="reply", data=message.data["text"])
+
+        self._server(on_message=on_message)
+        slow, fast = self._client(), self._client()
+        slow.send(Message(action="send", data={"text": "slow"}))
+        started = time.monotonic()
+        fast.send(Message(action="send", data={"text": "fast"}))
+
+        self.assertEqual(fast.receive().data["data"], "fast")
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(slow.receive().data["data"], "slow")
+
+    def test_not_connected_returns_errors(self):
+        client = Connectiva(endpoint=self.endpoint, mode="client")
+        self.assertIn("error", client.send(Message(action="send", data={})))
+        self.assertEqual(client.receive().action, "error")
+        self.assertIn("error", client.send_raw(b"{}"))
+
+    def test_failed_client_connect_stops_loop(self):
+        client = Connectiva(endpoint="ws://localhost:8799", mode="client")
+        client.connect()
+        self.assertIsNone(client.strategy.loop, "A client that failed to connect should not keep its loop running.")
+        self.assertEqual(client.send(Message(action="send", data={})), {"error": "Not connected"})
+        self.assertEqual(client.receive_raw().metadata["error"], "Not connected")
+
+    def test_failed_server_start_stops_loop(self):
+        self._server()
+        second = Connectiva(endpoint=self.endpoint, mode="server")
+        second.connect()
+        self.assertIsNone(second.strategy.loop, "A server that failed to bind should not keep its loop running.")
+
+    def test_balanced_connection_stays_outstanding(self):
+        self._server()
+        client = Connectiva(endpoint=f"{self.endpoint},ws://localhost:8799", mode="client")
+        client.connect()
+
+        self.assertEqual(client.load_balancer_stats()[self.endpoint]["outstanding"], 1)
+        client.disconnect()
+        self.assertEqual(client.load_balancer_stats()[self.endpoint]["outstanding"], 0)
+
+    def test_binary_frames_with_deflate_tuning(self):
+        options = {"binary": True, "deflate_window_bits": 10, "deflate_mem_level": 4, "max_size": 2 ** 22}
+        self._server(**options)
+        client = self._client(**options)
+
+        [extension] = client.strategy.websocket.extensions
+        self.assertIsInstance(extension, PerMessageDeflate, "permessage-deflate should be negotiated.")
+        self.assertEqual((extension.local_max_window_bits, extension.remote_max_window_bits), (10, 10))
+        self.assertEqual(extension.compress_settings["memLevel"], 4)
+
+        client.send(Message(action="send", data={"content": "compressed " * 1000}))
+        frame = client.receive_raw().data
+        self.assertIsInstance(frame, bytes)
+        self.assertIn(b"compressed", frame)
+
+        client.send(Message(action="send", data={"content": "again"}))
+        self.assertEqual(client.receive().data["data"], {"received": "again"})
+
+    def test_deflate_defaults_for_unset_options(self):
+        self._server(deflate_level=1)
+        client = self._client(deflate_level=1)
+
+        [extension] = client.strategy.websocket.extensions
+        self.assertEqual(extension.local_max_window_bits, DEFLATE_WINDOW_BITS)
+        self.assertEqual(extension.compress_settings, {"memLevel": DEFLATE_MEM_LEVEL, "level": 1})
+
+
 if __name__ == "__main__":
     unittest.main()